@@ -27,12 +27,24 @@ import base64
 import hashlib
 import io
 import logging
+import mmap
+import re
+import threading
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple
+from dataclasses import dataclass, field
 from datetime import datetime
-from difflib import SequenceMatcher
 
 import config
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 # ============================================================
 # LAZY IMPORTS — тяжёлые SDK загружаются только при вызове
@@ -58,20 +70,80 @@ def _lazy_import_pil_image():
     return Image
 
 
-_rapidfuzz_cache = {"loaded": False, "fuzz": None}
+def _lazy_import_tqdm():
+    from tqdm import tqdm
+    return tqdm
+
+
+_pyvips_cache = {"loaded": False, "pyvips": None}
+
+
+def _lazy_import_pyvips():
+    """pyvips (libvips) или None, если не установлен — тогда ресайз через PIL."""
+    if not _pyvips_cache["loaded"]:
+        try:
+            import pyvips
+            _pyvips_cache["pyvips"] = pyvips
+        except (ImportError, OSError):
+            # OSError: пакет есть, но libvips не найдена в системе
+            _pyvips_cache["pyvips"] = None
+        _pyvips_cache["loaded"] = True
+    return _pyvips_cache["pyvips"]
+
+
+_fastfuzz_cache = {"loaded": False, "module": None}
+
+
+def _lazy_import_fastfuzz():
+    """utils.fastfuzz (Numba-ядро) или None, если numba не установлена."""
+    if not _fastfuzz_cache["loaded"]:
+        try:
+            from utils import fastfuzz
+            _fastfuzz_cache["module"] = fastfuzz if fastfuzz.AVAILABLE else None
+        except ImportError:
+            _fastfuzz_cache["module"] = None
+        _fastfuzz_cache["loaded"] = True
+    return _fastfuzz_cache["module"]
+
+
+_xlsxwriter_cache = {"loaded": False, "xlsxwriter": None}
+
+
+def _lazy_import_xlsxwriter():
+    """xlsxwriter или None — тогда новая книга пишется openpyxl (write-only)."""
+    if not _xlsxwriter_cache["loaded"]:
+        try:
+            import xlsxwriter
+            _xlsxwriter_cache["xlsxwriter"] = xlsxwriter
+        except ImportError:
+            _xlsxwriter_cache["xlsxwriter"] = None
+        _xlsxwriter_cache["loaded"] = True
+    return _xlsxwriter_cache["xlsxwriter"]
+
+
+_rapidfuzz_cache = {"loaded": False, "fuzz": None, "process": None}
 
 
 def _lazy_import_rapidfuzz():
     if not _rapidfuzz_cache["loaded"]:
         try:
-            from rapidfuzz import fuzz as rf_fuzz
+            from rapidfuzz import fuzz as rf_fuzz, process as rf_process
             _rapidfuzz_cache["fuzz"] = rf_fuzz
+            _rapidfuzz_cache["process"] = rf_process
         except ImportError:
             _rapidfuzz_cache["fuzz"] = None
+            _rapidfuzz_cache["process"] = None
         _rapidfuzz_cache["loaded"] = True
     return _rapidfuzz_cache["fuzz"]
 
 
+def _lazy_import_rapidfuzz_process():
+    """rapidfuzz.process (extractOne/cdist) или None, если rapidfuzz отключён."""
+    if _lazy_import_rapidfuzz() is None:
+        return None
+    return _rapidfuzz_cache.get("process")
+
+
 _excel_styles_cache = {}
 
 
@@ -135,78 +207,142 @@ def setup_logging():
 
 log = setup_logging()
 
+# Перевод строки → пробел для однострочных превью текста в логе
+_NL_TO_SPACE = str.maketrans('\n', ' ')
+
 
 # ============================================================
 # 1. ИНИЦИАЛИЗАЦИЯ
 # ============================================================
 
+# Keepalive gRPC-канала Vision: между батчами канал простаивает, пока идут
+# запросы к Claude, — пинги не дают прокси/NAT закрыть соединение
+_VISION_CHANNEL_OPTIONS = (
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+)
+
+
 def init_vision_client():
     service_account = _lazy_import_service_account()
     vision = _lazy_import_vision()
     credentials = service_account.Credentials.from_service_account_file(
         config.GOOGLE_VISION_CREDENTIALS
     )
-    return vision.ImageAnnotatorClient(credentials=credentials)
+    try:
+        transport_cls = vision.ImageAnnotatorClient.get_transport_class("grpc")
+        channel = transport_cls.create_channel(
+            credentials=credentials, options=list(_VISION_CHANNEL_OPTIONS)
+        )
+        return vision.ImageAnnotatorClient(transport=transport_cls(channel=channel))
+    except (AttributeError, TypeError) as e:
+        log.debug("Vision: канал с keepalive недоступен (%s), обычный клиент", e)
+        return vision.ImageAnnotatorClient(credentials=credentials)
+
+
+def _claude_http_client(anthropic):
+    """
+    Общий httpx-клиент для Claude: пул keepalive-соединений на все потоки
+    process_all_images (TLS-рукопожатие — один раз на соединение) и HTTP/2,
+    если установлен пакет h2.
+    """
+    import httpx  # зависимость anthropic
+    from importlib.util import find_spec
+
+    workers = max(1, getattr(config, 'API_MAX_WORKERS', 8))
+    return anthropic.DefaultHttpxClient(
+        http2=find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=2 * workers,
+                            max_connections=2 * workers),
+        timeout=httpx.Timeout(getattr(config, 'CLAUDE_HTTP_TIMEOUT', 300.0),
+                              connect=5.0),
+    )
 
 
 def init_claude_client():
     anthropic = _lazy_import_anthropic()
+    kwargs = {"api_key": config.ANTHROPIC_API_KEY,
+              "http_client": _claude_http_client(anthropic)}
     base_url = getattr(config, 'ANTHROPIC_BASE_URL', None)
     if base_url:
-        return anthropic.Anthropic(api_key=config.ANTHROPIC_API_KEY, base_url=base_url)
-    return anthropic.Anthropic(api_key=config.ANTHROPIC_API_KEY)
+        kwargs["base_url"] = base_url
+    return anthropic.Anthropic(**kwargs)
 
 
 # ============================================================
 # 2. GOOGLE VISION OCR
 # ============================================================
 
-def ocr_image_structured(vision_client, image_path: str):
+# Лимит Vision API: не более 16 изображений в одном batch_annotate_images
+VISION_BATCH_SIZE = 16
+
+
+class OcrSettings(NamedTuple):
+    """Настройки постобработки OCR — читаются из config один раз на батч."""
+    need_tables: bool
+    need_debug: bool
+    row_tolerance: int
+    debug_folder: str
+
+    @property
+    def need_blocks(self) -> bool:
+        """Нужны ли структурные блоки (таблицы или debug) из ответа Vision."""
+        return bool(self.need_tables or self.need_debug)
+
+
+def _ocr_settings() -> OcrSettings:
+    return OcrSettings(
+        need_tables=getattr(config, 'OCR_TABLE_RECONSTRUCTION', True),
+        need_debug=getattr(config, 'OCR_SAVE_BBOX_DEBUG', False),
+        row_tolerance=getattr(config, 'TABLE_ROW_TOLERANCE_PX', 15),
+        debug_folder=getattr(config, 'OCR_DEBUG_FOLDER', './ocr_debug'),
+    )
+
+
+@lru_cache(maxsize=2)
+def _vision_request_params(need_blocks: bool) -> tuple:
     """
-    Вызывает Vision API и возвращает структурированный результат
-    включая блоки, реконструированные таблицы и обогащённый текст.
+    features и image_context для запроса Vision — создаются один раз.
+    Без блоков хватает TEXT_DETECTION: ответ меньше и быстрее разбирается;
+    DOCUMENT_TEXT_DETECTION — только когда нужна структура страницы.
+    """
+    vision = _lazy_import_vision()
+    feature_type = (vision.Feature.Type.DOCUMENT_TEXT_DETECTION if need_blocks
+                    else vision.Feature.Type.TEXT_DETECTION)
+    return ([vision.Feature(type_=feature_type)],
+            vision.ImageContext(language_hints=['ru']))
+
+
+def _build_structured_result(image_path: str, response, elapsed: float,
+                             settings: OcrSettings | None = None):
+    """
+    Превращает ответ Vision API по одному изображению в OcrStructuredResult:
+    блоки, реконструированные таблицы и обогащённый текст.
 
     Если OCR_TABLE_RECONSTRUCTION и OCR_SAVE_BBOX_DEBUG оба выключены —
     структурные блоки не извлекаются (экономия времени).
-
-    Returns:
-        OcrStructuredResult
+    settings — снимок config от вызывающего батча; по умолчанию читается заново.
     """
     from utils.table_reconstruction import (
         extract_structured_blocks, reconstruct_all_tables,
         build_enhanced_text, save_bbox_debug, OcrStructuredResult,
     )
-    vision = _lazy_import_vision()
 
     filename = os.path.basename(image_path)
-    file_size = os.path.getsize(image_path) / 1024  # KB
-    log.debug(f"[OCR] Отправка в Vision API: {filename} ({file_size:.0f} KB)")
-
-    with open(image_path, 'rb') as f:
-        content = f.read()
-
-    image = vision.Image(content=content)
-    t0 = time.time()
-    response = vision_client.document_text_detection(
-        image=image,
-        image_context=vision.ImageContext(language_hints=['ru'])
-    )
-    elapsed = time.time() - t0
-
-    if response.error.message:
-        log.error(f"[OCR] Vision API ошибка для {filename}: {response.error.message}")
-        raise Exception(f"Vision API ошибка: {response.error.message}")
 
     full_text = ""
     if response.full_text_annotation:
         full_text = response.full_text_annotation.text
-        log.debug(f"[OCR] {filename}: распознано {len(full_text)} символов за {elapsed:.1f}с")
-        log.debug(f"[OCR] {filename} текст (первые 200 сим.): {full_text[:200].replace(chr(10), ' ')}")
+        log.debug("[OCR] %s: распознано %d символов за %.1fс", filename, len(full_text), elapsed)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[OCR] %s текст (первые 200 сим.): %s",
+                      filename, full_text[:200].translate(_NL_TO_SPACE))
     else:
         log.warning(f"[OCR] {filename}: текст не найден (пустой ответ)")
 
-    need_tables = getattr(config, 'OCR_TABLE_RECONSTRUCTION', True)
-    need_debug = getattr(config, 'OCR_SAVE_BBOX_DEBUG', False)
+    settings = settings or _ocr_settings()
+    need_tables, need_debug = settings.need_tables, settings.need_debug
 
     # Извлекаем структурные блоки только если нужна реконструкция или debug
     blocks = []
@@ -224,16 +360,14 @@ def ocr_image_structured(vision_client, image_path: str):
 
         # Реконструкция таблиц
         if need_tables and table_blocks:
-            row_tol = getattr(config, 'TABLE_ROW_TOLERANCE_PX', 15)
-            tables_md, tables_csv = reconstruct_all_tables(blocks, row_tol)
+            tables_md, tables_csv = reconstruct_all_tables(blocks, settings.row_tolerance)
             if tables_md:
                 log.info(f"  [TABLE] {filename}: реконструировано {len(table_blocks)} таблиц ({len(tables_md)} сим.)")
 
         # Debug: bbox/confidence
         if need_debug:
-            debug_folder = getattr(config, 'OCR_DEBUG_FOLDER', './ocr_debug')
-            debug_path = save_bbox_debug(image_path, blocks, page_confidence, debug_folder)
-            log.debug(f"[DEBUG] bbox/confidence saved: {debug_path}")
+            debug_path = save_bbox_debug(image_path, blocks, page_confidence, settings.debug_folder)
+            log.debug("[DEBUG] bbox/confidence saved: %s", debug_path)
 
     enhanced_text = build_enhanced_text(full_text, tables_md)
 
@@ -248,6 +382,66 @@ def ocr_image_structured(vision_client, image_path: str):
     )
 
 
+def ocr_images_structured_batch(vision_client, image_paths: list) -> list:
+    """
+    Распознаёт несколько изображений через batch_annotate_images
+    (по VISION_BATCH_SIZE штук за один запрос вместо запроса на каждое фото).
+    Элементы image_paths — пути или CardImage (тогда файл не перечитывается).
+
+    Returns:
+        список той же длины, что image_paths: OcrStructuredResult
+        либо Exception для изображений, по которым Vision вернул ошибку
+    """
+    vision = _lazy_import_vision()
+    settings = _ocr_settings()
+    features, image_context = _vision_request_params(settings.need_blocks)
+    results = []
+
+    for start in range(0, len(image_paths), VISION_BATCH_SIZE):
+        chunk = [_as_card_image(img) for img in image_paths[start:start + VISION_BATCH_SIZE]]
+
+        requests = []
+        for card in chunk:
+            log.debug("[OCR] Отправка в Vision API: %s (%.0f KB)", card.filename, len(card.raw_bytes) / 1024)
+            requests.append(vision.AnnotateImageRequest(
+                image=vision.Image(content=card.raw_bytes),
+                features=features,
+                image_context=image_context,
+            ))
+
+        t0 = time.time()
+        batch_response = vision_client.batch_annotate_images(requests=requests)
+        elapsed = time.time() - t0
+        if len(chunk) > 1:
+            log.debug("[OCR] Батч из %d фото обработан за %.1fс", len(chunk), elapsed)
+
+        for card, response in zip(chunk, batch_response.responses):
+            if response.error.message:
+                log.error(f"[OCR] Vision API ошибка для {card.filename}: {response.error.message}")
+                results.append(Exception(f"Vision API ошибка: {response.error.message}"))
+                continue
+            results.append(_build_structured_result(card.path, response, elapsed, settings))
+
+    return results
+
+
+def ocr_image_structured(vision_client, image_path):
+    """
+    Вызывает Vision API и возвращает структурированный результат
+    включая блоки, реконструированные таблицы и обогащённый текст.
+    image_path — путь к фото или CardImage.
+
+    Тонкая обёртка над ocr_images_structured_batch для одного изображения.
+
+    Returns:
+        OcrStructuredResult
+    """
+    result = ocr_images_structured_batch(vision_client, [image_path])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
 def ocr_image(vision_client, image_path: str) -> str:
     """Обратно совместимая обёртка — возвращает только текст."""
     result = ocr_image_structured(vision_client, image_path)
@@ -273,51 +467,168 @@ def _load_prompt() -> str:
         )
 
 
-CLAUDE_SYSTEM_PROMPT = _load_prompt()
+@lru_cache(maxsize=1)
+def get_system_prompt() -> str:
+    """Системный промпт Claude: читается с диска при первом запросе, не при импорте."""
+    return _load_prompt()
+
+
+_MEDIA_TYPES = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+    '.png': 'image/png', '.webp': 'image/webp'
+}
+
+CLAUDE_JPEG_QUALITY = 80
+
+
+@dataclass
+class CardImage:
+    """
+    Фото карточки, прочитанное с диска один раз: одни и те же байты идут
+    в Vision OCR и (после сжатия) в Claude. Подготовленный для Claude
+    base64 кэшируется на экземпляре — повторы запроса не кодируют фото заново.
+    """
+    path: str
+    raw_bytes: bytes
+    _claude_payload: tuple | None = field(default=None, repr=False)
+
+    @classmethod
+    def load(cls, path: str) -> "CardImage":
+        with open(path, 'rb') as f:
+            return cls(path, f.read())
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def media_type(self) -> str:
+        return _MEDIA_TYPES.get(Path(self.path).suffix.lower(), 'image/jpeg')
+
+    def to_base64(self) -> tuple:
+        """Исходные байты в base64: (строка, media_type)."""
+        return base64.standard_b64encode(self.raw_bytes).decode('utf-8'), self.media_type
+
+    def claude_payload(self) -> tuple:
+        """Сжатое для Claude фото: (base64, media_type), считается один раз."""
+        if self._claude_payload is None:
+            self._claude_payload = _encode_for_claude(self)
+        return self._claude_payload
+
+
+def _as_card_image(image) -> CardImage:
+    """Путь к файлу или CardImage → CardImage."""
+    return image if isinstance(image, CardImage) else CardImage.load(image)
 
 
 def image_to_base64(image_path: str) -> tuple:
-    with open(image_path, 'rb') as f:
-        data = f.read()
+    return CardImage.load(image_path).to_base64()
 
-    ext = Path(image_path).suffix.lower()
-    media_types = {
-        '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
-        '.png': 'image/png', '.webp': 'image/webp'
-    }
-    media_type = media_types.get(ext, 'image/jpeg')
-    return base64.standard_b64encode(data).decode('utf-8'), media_type
 
+def _encode_for_claude(card: CardImage) -> tuple:
+    """
+    Уменьшает фото до CLAUDE_MAX_IMAGE_DIM по длинной стороне и перекодирует в JPEG.
+    Если установлен pyvips — через libvips (быстрее), иначе через PIL.
+
+    Returns: (base64-строка, media_type). Если фото не открылось — исходные байты.
+    """
+    max_dim = getattr(config, 'CLAUDE_MAX_IMAGE_DIM', 1600)
+    data = card.raw_bytes
+
+    pyvips = _lazy_import_pyvips()
+    if pyvips is not None:
+        try:
+            # shrink-on-load: JPEG декодируется сразу в нужном масштабе
+            img = pyvips.Image.thumbnail_buffer(data, max_dim, height=max_dim,
+                                                size='down', no_rotate=True)
+            if img.hasalpha():
+                img = img.flatten(background=255)
+            jpeg = img.jpegsave_buffer(Q=CLAUDE_JPEG_QUALITY)
+            log.debug("[CLAUDE] %s: vips → %dKB (%dx%d)",
+                      card.filename, len(jpeg) // 1024, img.width, img.height)
+            return base64.standard_b64encode(jpeg).decode('utf-8'), 'image/jpeg'
+        except Exception as e:
+            log.debug("[CLAUDE] %s: vips не справился (%s), PIL", card.filename, e)
+
+    try:
+        Image = _lazy_import_pil_image()
+        img = Image.open(io.BytesIO(data))
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=CLAUDE_JPEG_QUALITY)
+    except Exception as e:
+        log.debug("[CLAUDE] %s: без сжатия (%s)", card.filename, e)
+        return card.to_base64()
 
-def _pick_first(data: dict, paths: list):
-    """Возвращает первое непустое значение по списку путей.
+    log.debug("[CLAUDE] %s: %dKB → %dKB (%dx%d)", card.filename,
+              len(data) // 1024, buffer.tell() // 1024, img.width, img.height)
+    return base64.standard_b64encode(buffer.getvalue()).decode('utf-8'), 'image/jpeg'
 
-    Путь может быть строкой ('fio') или кортежем ('patient_info', 'name').
+
+def _path_getter(path):
     """
-    for path in paths:
-        cur = data
-        if isinstance(path, str):
-            path = path.split('.')
-        ok = True
-        for key in path:
-            if isinstance(cur, dict) and key in cur:
-                cur = cur[key]
-            else:
-                ok = False
-                break
-        if ok and cur not in (None, "", float('nan')):
-            # Пропускаем словари/списки — ищем скалярные значения
-            if isinstance(cur, (dict, list)):
-                continue
-            return cur
+    Getter для пути в payload: строка ('fio', 'a.b') или кортеж ('patient_info', 'name').
+    Отсутствующий ключ или не-словарь на пути → KeyError/TypeError.
+    """
+    keys = path.split('.') if isinstance(path, str) else path
+    if len(keys) == 1:
+        return itemgetter(keys[0])
+    getters = tuple(itemgetter(k) for k in keys)
+
+    def get(data):
+        for g in getters:
+            data = g(data)
+        return data
+    return get
+
+
+# Алиасы канонических полей в ответах Claude (порядок = приоритет)
+_FIO_GETTERS = tuple(map(_path_getter, [
+    ("пациент", "фио"),
+    ("patient_info", "name"),
+    "fio",
+    "patient_name",
+    ("document", "patient_name"),
+    "client_name",
+    "patient",
+]))
+_PHONE_GETTERS = tuple(map(_path_getter, [
+    "phone", "contact", "contacts",
+    ("patient_info", "phone"),
+    ("пациент", "телефон"),
+]))
+_IIN_GETTERS = tuple(map(_path_getter, [
+    ("пациент", "иин"),
+    "iin",
+    ("patient_info", "iin"),
+]))
+
+
+def _pick_first(data: dict, getters: tuple):
+    """Возвращает первое непустое скалярное значение по списку getter'ов."""
+    for get in getters:
+        try:
+            cur = get(data)
+        except (KeyError, TypeError, IndexError):
+            continue
+        # Пропускаем пустые значения и словари/списки — ищем скалярные значения
+        if cur is None or cur == "" or isinstance(cur, (dict, list)):
+            continue
+        return cur
     return None
 
 
+_YO_TRANS = str.maketrans({'ё': 'е', 'Ё': 'Е'})
+_WS_RE = re.compile(r'\s+')
+
+
 def _normalize_simple(value: str) -> str:
+    """ё → е и схлопывание пробелов — за один проход translate + regex."""
     if value is None:
         return ""
-    s = str(value).replace('ё', 'е')
-    return " ".join(s.split())
+    return _WS_RE.sub(' ', str(value).translate(_YO_TRANS)).strip()
 
 
 def collect_name_phone_iin(data: dict) -> dict:
@@ -325,29 +636,9 @@ def collect_name_phone_iin(data: dict) -> dict:
     if not isinstance(data, dict):
         return {"fio": "", "phone": "", "iin": ""}
 
-    aliases_fio = [
-        ("пациент", "фио"),
-        ("patient_info", "name"),
-        "fio",
-        "patient_name",
-        ("document", "patient_name"),
-        "client_name",
-        "patient",
-    ]
-    aliases_phone = [
-        "phone", "contact", "contacts",
-        ("patient_info", "phone"),
-        ("пациент", "телефон"),
-    ]
-    aliases_iin = [
-        ("пациент", "иин"),
-        "iin",
-        ("patient_info", "iin"),
-    ]
-
-    fio = _pick_first(data, aliases_fio)
-    phone = _pick_first(data, aliases_phone)
-    iin = _pick_first(data, aliases_iin)
+    fio = _pick_first(data, _FIO_GETTERS)
+    phone = _pick_first(data, _PHONE_GETTERS)
+    iin = _pick_first(data, _IIN_GETTERS)
 
     enriched = dict(data)
     if fio:
@@ -359,6 +650,100 @@ def collect_name_phone_iin(data: dict) -> dict:
     return enriched
 
 
+_VALID_PAGE_TYPES = frozenset({
+    "medical_card_front", "medical_card_inner", "procedure_sheet",
+    "products_list", "complex_package", "botox_record", "unknown",
+})
+
+# Маппинг document_type → page_type
+_DOC_TYPE_MAP = MappingProxyType({
+    "medical_card_front": "medical_card_front",
+    "medical_card_inner": "medical_card_inner",
+    "procedure_sheet": "procedure_sheet",
+    "products_list": "products_list",
+    "complex_package": "complex_package",
+    "botox_record": "botox_record",
+    "медицинская карта": "medical_card_front",
+    "медицинская_карта": "medical_card_front",
+    "процедурный лист": "procedure_sheet",
+    "процедурный_лист": "procedure_sheet",
+    "покупки": "products_list",
+    "список приобретенных средств для домашнего ухода": "products_list",
+    "список приобретённых средств для домашнего ухода": "products_list",
+    "комплекс": "complex_package",
+    "ботокс": "botox_record",
+    "ботулинический токсин": "botox_record",
+})
+
+# Русские ключи в корне ответа → page_type (порядок = приоритет)
+_RUSSIAN_KEYS = MappingProxyType({
+    "медицинская_карта": "medical_card_front",
+    "медкарта": "medical_card_front",
+    "процедурный_лист": "procedure_sheet",
+    "процедуры": "procedure_sheet",
+    "покупки": "products_list",
+    "косметика": "products_list",
+    "комплекс": "complex_package",
+    "пакет": "complex_package",
+    "ботокс": "botox_record",
+})
+
+
+def _normalized(page_type: str, data: dict, raw_payload, parse_mode: str) -> dict:
+    return {
+        "page_type": page_type,
+        "data": data,
+        "raw_payload": raw_payload,
+        "parse_mode": parse_mode,
+    }
+
+
+def _normalize_strict(payload: dict, filename: str) -> dict:
+    """Режим 1: канонический формат {page_type, data}."""
+    page_type = payload["page_type"]
+    if page_type not in _VALID_PAGE_TYPES:
+        log.debug("[NORMALIZE] %s: некорректный page_type='%s', ставлю unknown", filename, page_type)
+        page_type = "unknown"
+
+    data = payload["data"]
+    data = collect_name_phone_iin(data if isinstance(data, dict) else {})
+    return _normalized(page_type, data, payload, "strict")
+
+
+def _normalize_document_type(payload: dict, filename: str) -> dict:
+    """Режим 2: {document_type, ...поля...} — поля становятся data."""
+    doc_type = payload.get("document_type", "").lower()
+    page_type = _DOC_TYPE_MAP.get(doc_type, "unknown")
+    log.debug("[NORMALIZE] %s: восстановлен из document_type='%s' → %s", filename, doc_type, page_type)
+
+    data = {k: v for k, v in payload.items() if k != "document_type"}
+    return _normalized(page_type, collect_name_phone_iin(data), payload, "recovered")
+
+
+def _normalize_russian_keys(payload: dict, filename: str):
+    """Режим 3: русский ключ-раздел в корне. None, если такого ключа нет."""
+    for rus_key, page_type in _RUSSIAN_KEYS.items():
+        data = payload.get(rus_key)
+        if isinstance(data, dict):
+            log.debug("[NORMALIZE] %s: восстановлен из русского ключа '%s' → %s", filename, rus_key, page_type)
+            return _normalized(page_type, collect_name_phone_iin(data), payload, "recovered")
+    return None
+
+
+def _normalize_heuristic(payload: dict, ocr_text: str, filename: str) -> dict:
+    """Режим 4: тип по ключевым словам в payload и OCR-тексте, весь payload — data."""
+    page_type = infer_page_type_from_content(payload, ocr_text, filename)
+
+    # Если не удалось определить - оставляем unknown
+    if page_type == "unknown" and log.isEnabledFor(logging.WARNING):
+        log.warning("[NORMALIZE] %s: не удалось определить тип страницы, ключи: %s",
+                    filename, list(payload)[:10])
+
+    payload = collect_name_phone_iin(payload)
+    return _normalized(page_type, payload, payload,
+                       "recovered" if page_type != "unknown" else "fallback")
+
+
 def normalize_claude_response(payload: dict, ocr_text: str, filename: str) -> dict:
     """
     Нормализует ответ Claude к каноническому формату.
@@ -378,115 +763,75 @@ def normalize_claude_response(payload: dict, ocr_text: str, filename: str) -> di
         }
     """
     if not payload or not isinstance(payload, dict):
-        return {
-            "page_type": "unknown",
-            "data": {},
-            "raw_payload": payload,
-            "parse_mode": "fallback"
-        }
+        return _normalized("unknown", {}, payload, "fallback")
 
-    # Режим 1: Канонический формат (page_type + data)
     if "page_type" in payload and "data" in payload:
-        page_type = payload.get("page_type", "unknown")
-        data = payload.get("data", {})
-
-        # Валидация page_type
-        valid_types = {
-            "medical_card_front", "medical_card_inner", "procedure_sheet",
-            "products_list", "complex_package", "botox_record", "unknown"
-        }
-        if page_type not in valid_types:
-            log.debug(f"[NORMALIZE] {filename}: некорректный page_type='{page_type}', ставлю unknown")
-            page_type = "unknown"
-
-        data = data if isinstance(data, dict) else {}
-        data = collect_name_phone_iin(data)
-        return {
-            "page_type": page_type,
-            "data": data,
-            "raw_payload": payload,
-            "parse_mode": "strict"
-        }
-
-    # Режим 2: document_type формат
+        return _normalize_strict(payload, filename)
     if "document_type" in payload:
-        doc_type = payload.get("document_type", "").lower()
-
-        # Маппинг document_type → page_type
-        doc_type_map = {
-            "medical_card_front": "medical_card_front",
-            "medical_card_inner": "medical_card_inner",
-            "procedure_sheet": "procedure_sheet",
-            "products_list": "products_list",
-            "complex_package": "complex_package",
-            "botox_record": "botox_record",
-            "медицинская карта": "medical_card_front",
-            "медицинская_карта": "medical_card_front",
-            "процедурный лист": "procedure_sheet",
-            "процедурный_лист": "procedure_sheet",
-            "покупки": "products_list",
-            "список приобретенных средств для домашнего ухода": "products_list",
-            "список приобретённых средств для домашнего ухода": "products_list",
-            "комплекс": "complex_package",
-            "ботокс": "botox_record",
-            "ботулинический токсин": "botox_record",
-        }
-
-        page_type = doc_type_map.get(doc_type, "unknown")
-
-        # Собираем data из остальных полей
-        data = {k: v for k, v in payload.items() if k != "document_type"}
-
-        log.debug(f"[NORMALIZE] {filename}: восстановлен из document_type='{doc_type}' → {page_type}")
-
-        data = collect_name_phone_iin(data)
-        return {
-            "page_type": page_type,
-            "data": data,
-            "raw_payload": payload,
-            "parse_mode": "recovered"
-        }
+        return _normalize_document_type(payload, filename)
+    return (_normalize_russian_keys(payload, filename)
+            or _normalize_heuristic(payload, ocr_text, filename))
+
+
+# Характерные признаки типов страниц (ключи payload и слова в OCR-тексте)
+PAGE_TYPE_INDICATORS = {
+    "medical_card_front": [
+        "fio", "фио", "birth_date", "рождение", "iin", "иин",
+        "citizenship", "гражданство", "address", "адрес",
+        "allergies", "аллергии", "emergency_contact", "экстренный"
+    ],
+    "medical_card_inner": [
+        "complaints", "жалобы", "objective_status", "статус",
+        "diagnosis", "диагноз", "blood_pressure", "давление",
+        "hepatitis", "гепатит", "chronic", "хронические"
+    ],
+    "procedure_sheet": [
+        "procedures", "процедуры", "procedure_name", "название",
+        "description", "описание", "процедур"
+    ],
+    "products_list": [
+        "products", "покупки", "product_name", "товар",
+        "consultant", "консультант", "средств", "косметика",
+        "наименование", "приобрет", "цена", "items", "домашнего"
+    ],
+    "complex_package": [
+        "complex_name", "комплекс", "package", "пакет",
+        "purchase_date", "приобретения", "privilage", "привилегия"
+    ],
+    "botox_record": [
+        "injections", "инъекции", "drug", "препарат",
+        "injection_area", "область", "botox", "ботокс", "ботулин"
+    ],
+}
+
+
+def _build_indicator_matcher():
+    """
+    Один regex на все ключевые слова: lookahead находит самое длинное слово
+    в каждой позиции, а вложенные в него слова («процедур» в «процедуры»)
+    добавляются по заранее посчитанной таблице.
+    """
+    keyword_types = {}
+    for page_type, keywords in PAGE_TYPE_INDICATORS.items():
+        for kw in keywords:
+            keyword_types.setdefault(kw, []).append(page_type)
 
-    # Режим 3: Русские ключи в корне
-    russian_keys = {
-        "медицинская_карта": "medical_card_front",
-        "медкарта": "medical_card_front",
-        "процедурный_лист": "procedure_sheet",
-        "процедуры": "procedure_sheet",
-        "покупки": "products_list",
-        "косметика": "products_list",
-        "комплекс": "complex_package",
-        "пакет": "complex_package",
-        "ботокс": "botox_record",
-    }
+    ordered = sorted(keyword_types, key=len, reverse=True)
+    pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in ordered) + "))")
+    contained = {kw: tuple(other for other in keyword_types if other in kw)
+                 for kw in keyword_types}
+    return pattern, contained, keyword_types
 
-    for rus_key, page_type in russian_keys.items():
-        if rus_key in payload:
-            data = payload.get(rus_key, {})
-            if isinstance(data, dict):
-                log.debug(f"[NORMALIZE] {filename}: восстановлен из русского ключа '{rus_key}' → {page_type}")
-                data = collect_name_phone_iin(data)
-                return {
-                    "page_type": page_type,
-                    "data": data,
-                    "raw_payload": payload,
-                    "parse_mode": "recovered"
-                }
 
-    # Режим 4: Keyword heuristics на основе содержимого payload и OCR-текста
-    page_type = infer_page_type_from_content(payload, ocr_text, filename)
+_INDICATOR_RE, _INDICATOR_CONTAINED, _INDICATOR_TYPES = _build_indicator_matcher()
 
-    # Если не удалось определить - оставляем unknown
-    if page_type == "unknown":
-        log.warning(f"[NORMALIZE] {filename}: не удалось определить тип страницы, ключи: {list(payload.keys())[:10]}")
 
-    payload = collect_name_phone_iin(payload)
-    return {
-        "page_type": page_type,
-        "data": payload,  # Весь payload идёт в data
-        "raw_payload": payload,
-        "parse_mode": "recovered" if page_type != "unknown" else "fallback"
-    }
+def _find_indicators(text: str) -> set:
+    """Множество ключевых слов PAGE_TYPE_INDICATORS, встречающихся в тексте."""
+    found = set()
+    for kw in set(_INDICATOR_RE.findall(text)):
+        found.update(_INDICATOR_CONTAINED[kw])
+    return found
 
 
 def infer_page_type_from_content(payload: dict, ocr_text: str, filename: str) -> str:
@@ -495,53 +840,17 @@ def infer_page_type_from_content(payload: dict, ocr_text: str, filename: str) ->
 
     Используется как fallback когда формат ответа нестандартный.
     """
-    # Нормализуем ключи payload и OCR-текст для поиска
-    keys_lower = [str(k).lower() for k in payload.keys()]
+    # Ключи payload склеиваем через \n, чтобы совпадение не переходило между ключами
+    keys_text = "\n".join(str(k).lower() for k in payload.keys())
     text_lower = ocr_text.lower() if ocr_text else ""
 
-    # Характерные признаки типов страниц
-    indicators = {
-        "medical_card_front": [
-            "fio", "фио", "birth_date", "рождение", "iin", "иин",
-            "citizenship", "гражданство", "address", "адрес",
-            "allergies", "аллергии", "emergency_contact", "экстренный"
-        ],
-        "medical_card_inner": [
-            "complaints", "жалобы", "objective_status", "статус",
-            "diagnosis", "диагноз", "blood_pressure", "давление",
-            "hepatitis", "гепатит", "chronic", "хронические"
-        ],
-        "procedure_sheet": [
-            "procedures", "процедуры", "procedure_name", "название",
-            "description", "описание", "процедур"
-        ],
-        "products_list": [
-            "products", "покупки", "product_name", "товар",
-            "consultant", "консультант", "средств", "косметика",
-            "наименование", "приобрет", "цена", "items", "домашнего"
-        ],
-        "complex_package": [
-            "complex_name", "комплекс", "package", "пакет",
-            "purchase_date", "приобретения", "privilage", "привилегия"
-        ],
-        "botox_record": [
-            "injections", "инъекции", "drug", "препарат",
-            "injection_area", "область", "botox", "ботокс", "ботулин"
-        ],
-    }
-
-    # Подсчитываем совпадения для каждого типа
-    scores = {}
-    for page_type, keywords in indicators.items():
-        score = 0
-        for keyword in keywords:
-            # Проверяем в ключах payload
-            if any(keyword in key for key in keys_lower):
-                score += 2
-            # Проверяем в OCR-тексте (меньший вес)
-            if keyword in text_lower:
-                score += 1
-        scores[page_type] = score
+    # Подсчитываем совпадения для каждого типа:
+    # слово в ключах payload — +2, в OCR-тексте — +1 (меньший вес)
+    scores = dict.fromkeys(PAGE_TYPE_INDICATORS, 0)
+    for weight, text in ((2, keys_text), (1, text_lower)):
+        for keyword in _find_indicators(text):
+            for page_type in _INDICATOR_TYPES[keyword]:
+                scores[page_type] += weight
 
     # Выбираем тип с максимальным score
     if scores:
@@ -550,35 +859,31 @@ def infer_page_type_from_content(payload: dict, ocr_text: str, filename: str) ->
 
         # Порог для уверенности: минимум 3 совпадения
         if best_score >= 3:
-            log.debug(f"[INFER] {filename}: определён как {best_type} (score={best_score})")
+            log.debug("[INFER] %s: определён как %s (score=%s)", filename, best_type, best_score)
             return best_type
 
     # Не удалось определить
     return "unknown"
 
 
-def extract_with_claude(claude_client, image_path: str, ocr_text: str) -> dict:
-    filename = os.path.basename(image_path)
-    log.debug(f"[CLAUDE] Отправка в Claude: {filename}")
-
-    img_b64, media_type = image_to_base64(image_path)
+def extract_with_claude(claude_client, image, ocr_text: str) -> dict:
+    """image — путь к фото или CardImage (байты уже прочитаны для OCR)."""
+    card = _as_card_image(image)
+    filename = card.filename
+    log.debug("[CLAUDE] Отправка в Claude: %s", filename)
 
-    # Сжимаем если > 5MB
-    if len(img_b64) > 5_000_000:
-        log.debug(f"[CLAUDE] {filename}: сжатие изображения (>{len(img_b64)//1024}KB)")
-        Image = _lazy_import_pil_image()
-        img = Image.open(image_path)
-        img.thumbnail((2000, 2000), Image.Resampling.LANCZOS)
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=85)
-        img_b64 = base64.standard_b64encode(buffer.getvalue()).decode('utf-8')
-        media_type = 'image/jpeg'
+    img_b64, media_type = card.claude_payload()
 
     t0 = time.time()
     message = claude_client.messages.create(
         model=config.CLAUDE_MODEL,
         max_tokens=4096,
-        system=CLAUDE_SYSTEM_PROMPT,
+        # cache_control: промпт одинаков для всех карточек — кэшируется на стороне API
+        system=[{
+            "type": "text",
+            "text": get_system_prompt(),
+            "cache_control": {"type": "ephemeral"},
+        }],
         messages=[{
             "role": "user",
             "content": [
@@ -606,7 +911,7 @@ def extract_with_claude(claude_client, image_path: str, ocr_text: str) -> dict:
     response_text = message.content[0].text.strip()
     tokens_in = getattr(message.usage, 'input_tokens', '?')
     tokens_out = getattr(message.usage, 'output_tokens', '?')
-    log.debug(f"[CLAUDE] {filename}: ответ за {elapsed:.1f}с (токены: {tokens_in}→{tokens_out})")
+    log.debug("[CLAUDE] %s: ответ за %.1fс (токены: %s→%s)", filename, elapsed, tokens_in, tokens_out)
 
     # Убираем markdown-обёртки
     if response_text.startswith('```'):
@@ -618,8 +923,11 @@ def extract_with_claude(claude_client, image_path: str, ocr_text: str) -> dict:
     try:
         parsed = json.loads(response_text)
         normalized = normalize_claude_response(parsed, ocr_text, filename)
-        log.debug(f"[CLAUDE] {filename}: тип={normalized.get('page_type','?')} (режим: {normalized.get('parse_mode','?')})")
-        log.debug(f"[CLAUDE] {filename}: данные={json.dumps(normalized.get('data',{}), ensure_ascii=False)[:500]}")
+        log.debug("[CLAUDE] %s: тип=%s (режим: %s)", filename,
+                  normalized.get('page_type', '?'), normalized.get('parse_mode', '?'))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[CLAUDE] %s: данные=%s", filename,
+                      json.dumps(normalized.get('data', {}), ensure_ascii=False)[:500])
         return normalized
     except json.JSONDecodeError:
         start = response_text.find('{')
@@ -646,81 +954,103 @@ def extract_with_claude(claude_client, image_path: str, ocr_text: str) -> dict:
 #      Нечёткое сопоставление с известным списком из config.py
 # ============================================================
 
+# Сокращённые имена врачей: полное имя (нижний регистр) → варианты
+_DOCTOR_SHORT_NAMES = {
+    "виктория": ("вика", "виека", "викт"),
+    "оксана": ("оксан", "окс"),
+    "эльвира": ("эля", "эльв"),
+    "ольга": ("оля",),
+    "рада": ("рад",),
+}
+
+
 def _build_doctor_aliases():
     """
-    Строит словарь сокращений → полное имя врача.
+    Строит словарь сокращений → полное имя врача (только для чтения).
     Например: "О.А." → "Асшеман Оксана", "Виктория" → "Житникова Виктория"
     """
-    doctors = getattr(config, 'KNOWN_DOCTORS', [])
-    aliases = {}
-    for doc in doctors:
-        parts = doc.split()
-        if len(parts) >= 2:
-            surname = parts[0]
-            first_name = parts[1]
-            # Полное имя
-            aliases[doc.lower()] = doc
-            aliases[f"{surname} {first_name}".lower()] = doc
-            aliases[f"{first_name} {surname}".lower()] = doc
-            # Только имя
-            aliases[first_name.lower()] = doc
-            # Инициалы: "О.А." (Имя.Фамилия)
-            initials = f"{first_name[0]}.{surname[0]}."
-            aliases[initials.lower()] = doc
-            # Обратные инициалы: "А.О."
-            initials_rev = f"{surname[0]}.{first_name[0]}."
-            aliases[initials_rev.lower()] = doc
+    def _pairs(doctors):
+        for doc in doctors:
+            parts = doc.split()
+            if len(parts) < 2:
+                continue
+            surname, first_name = parts[0].lower(), parts[1].lower()
+            # Полное имя, обе перестановки, только имя
+            yield doc.lower(), doc
+            yield f"{surname} {first_name}", doc
+            yield f"{first_name} {surname}", doc
+            yield first_name, doc
+            # Инициалы: "О.А." (Имя.Фамилия) и обратные "А.О."
+            yield f"{first_name[0]}.{surname[0]}.", doc
+            yield f"{surname[0]}.{first_name[0]}.", doc
             # Сокращённые имена
-            short_names = {
-                "виктория": ["вика", "виека", "викт"],
-                "оксана": ["оксан", "окс"],
-                "эльвира": ["эля", "эльв"],
-                "ольга": ["оля"],
-                "рада": ["рад"],
-            }
-            for full_short, variants in short_names.items():
-                if first_name.lower() == full_short:
-                    for v in variants:
-                        aliases[v] = doc
-    return aliases
+            for v in _DOCTOR_SHORT_NAMES.get(first_name, ()):
+                yield v, doc
+
+    return MappingProxyType(dict(_pairs(getattr(config, 'KNOWN_DOCTORS', []))))
 
 
 DOCTOR_ALIASES = _build_doctor_aliases()
 
+# Список врачей и его lower-версия считаются один раз при импорте
+_DOCTORS_TUPLE = tuple(getattr(config, 'KNOWN_DOCTORS', []))
+_DOCTORS_LOWER = tuple(d.lower() for d in _DOCTORS_TUPLE)
+
 
+@lru_cache(maxsize=4096)
 def correct_doctor_name(raw_name: str) -> str:
     """
     Пытается найти точное совпадение с известным врачом.
     Если не нашли — пробуем нечёткое сопоставление (порог 0.6).
+
+    Результат кэшируется: одни и те же имена повторяются
+    во многих строках процедур/покупок одной карточки.
     """
     if not raw_name:
         return raw_name
 
     cleaned = raw_name.strip()
+    cleaned_lower = cleaned.lower()
 
     # 1. Точное совпадение по алиасам
-    if cleaned.lower() in DOCTOR_ALIASES:
-        matched = DOCTOR_ALIASES[cleaned.lower()]
+    if cleaned_lower in DOCTOR_ALIASES:
+        matched = DOCTOR_ALIASES[cleaned_lower]
         if matched != cleaned:
-            log.debug(f"[ВРАЧ] «{cleaned}» → «{matched}» (точное совпадение)")
+            log.debug("[ВРАЧ] «%s» → «%s» (точное совпадение)", cleaned, matched)
         return matched
 
     # 2. Нечёткое совпадение с известными врачами
-    doctors = getattr(config, 'KNOWN_DOCTORS', [])
     best_match = None
     best_score = 0.0
 
-    for doc in doctors:
-        score = fuzzy_match(cleaned, doc)
-        if score > best_score:
-            best_score = score
-            best_match = doc
+    rf_process = _lazy_import_rapidfuzz_process()
+    if rf_process is not None:
+        # Весь перебор врачей — одним вызовом в C++; строки уже в нижнем регистре,
+        # token_sort_ratio сам сортирует слова → метрика та же, что у fuzzy_match
+        found = rf_process.extractOne(
+            cleaned_lower, _DOCTORS_LOWER,
+            scorer=_rapidfuzz_cache["fuzz"].token_sort_ratio,
+            processor=None,
+        )
+        if found:
+            best_match, best_score = _DOCTORS_TUPLE[found[2]], found[1] / 100.0
+    elif (fastfuzz := _lazy_import_fastfuzz()) is not None:
+        # Без rapidfuzz: та же метрика в Numba-ядре, врачи закодированы один раз
+        idx, best_score = fastfuzz.token_sort_extract_one(cleaned_lower, _DOCTORS_LOWER)
+        if idx >= 0:
+            best_match = _DOCTORS_TUPLE[idx]
+    else:
+        for doc in _DOCTORS_TUPLE:
+            score = fuzzy_match(cleaned, doc)
+            if score > best_score:
+                best_score = score
+                best_match = doc
 
     if best_score >= 0.6 and best_match:
-        log.debug(f"[ВРАЧ] «{cleaned}» → «{best_match}» (fuzzy: {best_score:.0%})")
+        log.debug("[ВРАЧ] «%s» → «%s» (fuzzy: %.0f%%)", cleaned, best_match, best_score * 100)
         return best_match
 
-    log.debug(f"[ВРАЧ] «{cleaned}» — не найден в списке (лучший: {best_match}, {best_score:.0%})")
+    log.debug("[ВРАЧ] «%s» — не найден в списке (лучший: %s, %.0f%%)", cleaned, best_match, best_score * 100)
     return cleaned
 
 
@@ -748,23 +1078,71 @@ def correct_doctors_in_data(data: dict) -> dict:
 # 4. КЭШ
 # ============================================================
 
-def get_cache_path(image_path: str) -> str:
-    os.makedirs(config.CACHE_FOLDER, exist_ok=True)
+def _cache_file(image_path: str) -> str:
+    """Путь к JSON-кэшу фото (без создания папки кэша)."""
     h = hashlib.md5(image_path.encode()).hexdigest()
     return os.path.join(config.CACHE_FOLDER, f"{h}.json")
 
 
+def get_cache_path(image_path: str) -> str:
+    os.makedirs(config.CACHE_FOLDER, exist_ok=True)
+    return _cache_file(image_path)
+
+
 def load_from_cache(image_path: str) -> dict | None:
-    path = get_cache_path(image_path)
-    if os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+    try:
+        with open(_cache_file(image_path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _load_cached_results(image_paths: list) -> list:
+    """
+    Кэш-результаты для списка фото (в том же порядке, без отсутствующих).
+    Каждый файл читается один раз; чтение/разбор JSON — в пуле потоков.
+    """
+    if len(image_paths) < 2:
+        cached = map(load_from_cache, image_paths)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(16, len(image_paths))) as pool:
+            cached = list(pool.map(load_from_cache, image_paths))
+    return [c for c in cached if c]
+
+
+def _write_json_atomic(path: str, obj):
+    """
+    Пишет JSON через временный файл + fsync + os.replace: при обрыве процесса
+    на диске остаётся либо старая, либо новая версия, но не обрезанная.
+    orjson (если установлен) сериализует в разы быстрее json.dump(indent=2).
+    """
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        # Без fsync после сбоя питания на месте файла может оказаться пустой
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 def save_to_cache(image_path: str, result: dict):
-    with open(get_cache_path(image_path), 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    _write_json_atomic(get_cache_path(image_path), result)
+
+
+def save_raw_results(results: list) -> str:
+    """
+    Сырые результаты OCR → raw_results.json рядом с OUTPUT_FILE
+    (orjson, атомарная запись). Returns: путь к файлу.
+    """
+    raw_path = os.path.join(os.path.dirname(config.OUTPUT_FILE) or '.', "raw_results.json")
+    _write_json_atomic(raw_path, results)
+    return raw_path
 
 
 # ============================================================
@@ -774,6 +1152,11 @@ def save_to_cache(image_path: str, result: dict):
 #      Удалите файл реестра, чтобы обработать всё заново.
 # ============================================================
 
+def _now_iso() -> str:
+    """Отметка времени processed_at (ISO 8601, с точностью до секунды)."""
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
 def _get_registry_path() -> str:
     """Путь к файлу реестра обработанных карточек."""
     reg = getattr(config, 'PROCESSED_REGISTRY', None)
@@ -801,8 +1184,7 @@ def save_registry(registry: dict):
     """Сохраняет реестр на диск."""
     path = _get_registry_path()
     os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(registry, f, ensure_ascii=False, indent=2)
+    _write_json_atomic(path, registry)
     log.debug(f"[РЕЕСТР] Сохранён: {len(registry)} записей → {path}")
 
 
@@ -818,20 +1200,33 @@ def register_processed(registry: dict, result: dict):
         "md5": hashlib.md5(result.get("filepath", "").encode()).hexdigest(),
         "page_type": result.get("page_type", "unknown"),
         "client_name": fio,
-        "processed_at": result.get("processed_at", datetime.now().isoformat()),
+        "processed_at": result.get("processed_at") or _now_iso(),
         "written_to_excel": True,
     }
 
 
+_MD5_MMAP_LIMIT = 64 * 1024 * 1024
+_MD5_CHUNK = 1024 * 1024
+
+
 def _file_md5(filepath: str) -> str:
-    """MD5-хэш содержимого файла (для обнаружения изменений)."""
+    """
+    MD5-хэш содержимого файла (для обнаружения изменений).
+    Файлы до 64MB хэшируются через mmap одним вызовом, крупнее — блоками по 1MB.
+    """
     try:
-        h = hashlib.md5()
         with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return hashlib.md5(b'').hexdigest()
+            if size <= _MD5_MMAP_LIMIT:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.md5(mm).hexdigest()
+            h = hashlib.md5()
+            for chunk in iter(lambda: f.read(_MD5_CHUNK), b''):
                 h.update(chunk)
-        return h.hexdigest()
-    except (IOError, OSError):
+            return h.hexdigest()
+    except (IOError, OSError, ValueError):
         return ""
 
 
@@ -840,13 +1235,121 @@ def _file_md5(filepath: str) -> str:
 # ============================================================
 
 def get_image_files(folder: str) -> list:
-    files = []
-    for f in sorted(os.listdir(folder)):
-        if Path(f).suffix.lower() in config.IMAGE_EXTENSIONS:
-            files.append(os.path.join(folder, f))
+    """
+    Пути к фото в папке, по алфавиту. os.scandir отдаёт имя и путь
+    готовыми; сортируются только подошедшие файлы.
+    """
+    extensions = frozenset(e.lower() for e in config.IMAGE_EXTENSIONS)
+    with os.scandir(folder) as it:
+        files = [e.path for e in it
+                 if os.path.splitext(e.name)[1].lower() in extensions and e.is_file()]
+    files.sort()
     return files
 
 
+def _prefetch_ocr_batch(vision_client, cards: list) -> dict:
+    """
+    OCR пачки новых карточек (CardImage) одним batch-запросом к Vision.
+
+    Returns: {image_path: OcrStructuredResult | Exception}; пустой dict при сбое батча
+    (тогда файлы распознаются по одному в основном цикле).
+    """
+    if not cards:
+        return {}
+    try:
+        return {card.path: res for card, res in zip(cards, ocr_images_structured_batch(vision_client, cards))}
+    except Exception as e:
+        log.warning(f"[OCR] Батч-запрос Vision не удался ({e}), распознаю по одному")
+        return {}
+
+
+def _process_new_image(vision_client, claude_client, image, ocr_result=None,
+                       limiter=None) -> dict:
+    """
+    OCR + Claude для одного нового файла с повторами при ошибках API.
+    Выполняется в пуле потоков; кэш и реестр пишет вызывающий код.
+
+    image — CardImage (байты общие для Vision и Claude) или путь к файлу.
+    ocr_result — результат батч-OCR (или Exception) для первой попытки;
+    если OCR не удался, повтор распознаёт файл одиночным запросом.
+    limiter — общий на все потоки RateLimiter запросов к Claude; отказ
+    по лимиту (429/529) снижает его темп и ставит паузу Retry-After всем потокам.
+
+    Returns: dict результата (page_type="error" после исчерпания попыток).
+    """
+    img_path = image.path if isinstance(image, CardImage) else image
+    filename = os.path.basename(img_path)
+
+    for attempt in range(config.MAX_RETRIES + 1):
+        try:
+            image = _as_card_image(image)
+            if isinstance(ocr_result, Exception):
+                raise ocr_result
+            if ocr_result is None:
+                ocr_result = ocr_image_structured(vision_client, image)
+            # Claude получает enhanced_text (с таблицами), дедуп/Excel — оригинальный текст
+            if limiter is not None:
+                limiter.acquire()
+            parsed = extract_with_claude(claude_client, image, ocr_result.enhanced_text)
+
+            # Коррекция имён врачей
+            if parsed.get("data"):
+                parsed["data"] = correct_doctors_in_data(parsed["data"])
+
+            page_type = parsed.get("page_type", "unknown")
+            fio = parsed.get("data", {}).get("fio") or parsed.get("data", {}).get("patient_name") or "—"
+
+            result = {
+                "filename": filename,
+                "filepath": img_path,
+                "ocr_text": ocr_result.full_text,
+                "tables_md": ocr_result.tables_md,
+                "tables_csv": ocr_result.tables_csv,
+                "page_confidence": round(ocr_result.page_confidence, 4),
+                "page_type": page_type,
+                "data": parsed.get("data", {}),
+                "raw_payload": parsed.get("raw_payload"),
+                "parse_mode": parsed.get("parse_mode", "unknown"),
+                "processed_at": _now_iso()
+            }
+            # Хэш фото для дедупликации — из уже прочитанных байт, уходит в кэш
+            hash_size = getattr(config, 'IMAGE_HASH_SIZE', 16)
+            _store_phash(result, _phash_stamp(img_path, hash_size),
+                         compute_image_hash(io.BytesIO(image.raw_bytes), hash_size))
+
+            log.info(f"  ✓ {filename} | тип: {page_type} | клиент: {fio}")
+            if limiter is not None:
+                limiter.speed_up()
+            return result
+
+        except Exception as e:
+            from utils.rate_limit import rate_limit_delay
+            # Упал Claude — OCR уже есть, повтор его не переделывает
+            if isinstance(ocr_result, Exception):
+                ocr_result = None
+            limited = rate_limit_delay(e)
+            if limited is not None and limiter is not None:
+                limiter.slow_down()
+            if attempt < config.MAX_RETRIES:
+                wait = 2 ** (attempt + 1)
+                if limited is not None:
+                    wait = max(wait, limited)
+                log.warning(f"  ⚠ {filename}: попытка {attempt+1}/{config.MAX_RETRIES}: {e}")
+                log.warning(f"    Ожидание {wait}с перед повтором...")
+                if limited is not None and limiter is not None:
+                    # Лимит общий: паузу выдерживают все потоки, повторы идут по одному
+                    limiter.pause(wait)
+                else:
+                    time.sleep(wait)
+            else:
+                log.error(f"  ✗ {filename}: ОТКАЗ после {config.MAX_RETRIES} попыток: {e}")
+                return {
+                    "filename": filename, "filepath": img_path,
+                    "page_type": "error", "data": {"error": str(e)},
+                    "processed_at": _now_iso()
+                }
+
+
 def process_all_images(vision_client, claude_client) -> list:
     image_files = get_image_files(config.INPUT_FOLDER)
 
@@ -860,120 +1363,125 @@ def process_all_images(vision_client, claude_client) -> list:
 
     # Фильтруем: только новые файлы
     new_files = []
-    skipped_files = []
+    done_files = []
     for img_path in image_files:
         filename = os.path.basename(img_path)
         if filename in already_done:
-            # Проверяем: файл не изменился? (MD5 содержимого)
-            old_md5 = registry[filename].get("md5", "")
             # md5 в реестре — это хэш пути, не содержимого (для совместимости с кэшем)
             # Просто пропускаем
-            skipped_files.append(filename)
+            done_files.append(img_path)
         else:
             new_files.append(img_path)
 
     log.info(f"\nНайдено {len(image_files)} фото")
-    if skipped_files:
-        log.info(f"  ✓ Уже обработано (пропуск): {len(skipped_files)}")
+    if done_files:
+        log.info(f"  ✓ Уже обработано (пропуск): {len(done_files)}")
     log.info(f"  → Новых для обработки: {len(new_files)}")
 
+    # Уже обработанные — из кэша, один раз: для Excel или для группировки с новыми
+    cached_results = _load_cached_results(done_files)
+
     if not new_files:
         log.info("\n  Все карточки уже обработаны. Новых нет.")
         log.info("  (Удалите реестр для повторной обработки)")
-        # Возвращаем результаты из кэша для записи в Excel
-        cached_results = []
-        for img_path in image_files:
-            cached = load_from_cache(img_path)
-            if cached:
-                cached_results.append(cached)
         return cached_results
 
     log.info("")
     log.debug(f"Новые файлы: {[os.path.basename(f) for f in new_files]}")
 
-    results = []
+    results = cached_results
     errors = []
 
-    # Сначала загружаем уже обработанные из кэша (для группировки)
-    for img_path in image_files:
-        filename = os.path.basename(img_path)
-        if filename in already_done:
-            cached = load_from_cache(img_path)
-            if cached:
-                results.append(cached)
+    # Обрабатываем ТОЛЬКО новые.
+    # Основной поток читает фото и распознаёт пачки через Vision batch, Claude-запросы
+    # идут в пуле потоков; кэш/реестр/результаты пишутся под блокировкой.
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    from utils.rate_limit import RateLimiter
+
+    tqdm = _lazy_import_tqdm()
+    max_workers = max(1, getattr(config, 'API_MAX_WORKERS', 8))
+    # Не держим в памяти байты больше чем стольких фото сразу
+    max_in_flight = max_workers + VISION_BATCH_SIZE
+    new_results = [None] * len(new_files)
+    write_lock = threading.Lock()
+    in_flight = {}
+    save_every = max(1, getattr(config, 'SAVE_EVERY_N', 10))
+    # Темп запросов к Claude задаёт общий token bucket, а не пауза в каждом потоке
+    limiter = RateLimiter(getattr(config, 'API_RPS', 0))
+    done = 0
+
+    def collect(future):
+        nonlocal done
+        pos = in_flight.pop(future)
+        result = future.result()
+        new_results[pos] = result
+        with write_lock:
+            if result["page_type"] == "error":
+                errors.append(f"{result['filename']}: {result['data']['error']}")
+            else:
+                save_to_cache(result["filepath"], result)
+                register_processed(registry, result)
+                done += 1
+                # Периодически сбрасываем реестр на диск — прогресс не теряется при обрыве
+                if done % save_every == 0:
+                    save_registry(registry)
+        progress.update(1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            tqdm(total=len(new_files), desc="Обработка", unit="фото") as progress:
+        for start in range(0, len(new_files), VISION_BATCH_SIZE):
+            cards = []
+            for pos, img_path in enumerate(new_files[start:start + VISION_BATCH_SIZE], start):
+                filename = os.path.basename(img_path)
+                log.info(f"[{pos + 1}/{len(new_files)}] {filename}")
+
+                # Проверяем кэш (на случай если файл в кэше, но не в реестре)
+                cached = load_from_cache(img_path)
+                if cached:
+                    log.info(f"  ↩ из кэша (тип: {cached.get('page_type','?')})")
+                    new_results[pos] = cached
+                    with write_lock:
+                        register_processed(registry, cached)
+                    progress.update(1)
+                    continue
 
-    # Обрабатываем ТОЛЬКО новые
-    from tqdm import tqdm
-    for idx, img_path in enumerate(tqdm(new_files, desc="Обработка", unit="фото"), 1):
-        filename = os.path.basename(img_path)
-        log.info(f"\n{'─'*50}")
-        log.info(f"[{idx}/{len(new_files)}] {filename}")
-
-        # Проверяем кэш (на случай если файл в кэше, но не в реестре)
-        cached = load_from_cache(img_path)
-        if cached:
-            log.info(f"  ↩ из кэша (тип: {cached.get('page_type','?')})")
-            results.append(cached)
-            register_processed(registry, cached)
-            continue
-
-        for attempt in range(config.MAX_RETRIES + 1):
-            try:
-                ocr_result = ocr_image_structured(vision_client, img_path)
-                # Claude получает enhanced_text (с таблицами), дедуп/Excel — оригинальный текст
-                parsed = extract_with_claude(claude_client, img_path, ocr_result.enhanced_text)
-
-                # Коррекция имён врачей
-                if parsed.get("data"):
-                    parsed["data"] = correct_doctors_in_data(parsed["data"])
-
-                page_type = parsed.get("page_type", "unknown")
-                fio = parsed.get("data", {}).get("fio") or parsed.get("data", {}).get("patient_name") or "—"
-
-                result = {
-                    "filename": filename,
-                    "filepath": img_path,
-                    "ocr_text": ocr_result.full_text,
-                    "tables_md": ocr_result.tables_md,
-                    "tables_csv": ocr_result.tables_csv,
-                    "page_confidence": round(ocr_result.page_confidence, 4),
-                    "page_type": page_type,
-                    "data": parsed.get("data", {}),
-                    "raw_payload": parsed.get("raw_payload"),
-                    "parse_mode": parsed.get("parse_mode", "unknown"),
-                    "processed_at": datetime.now().isoformat()
-                }
-                save_to_cache(img_path, result)
-                results.append(result)
-
-                # Записываем в реестр
-                register_processed(registry, result)
-
-                log.info(f"  ✓ тип: {page_type} | клиент: {fio}")
-                time.sleep(config.API_DELAY)
-                break
-
-            except Exception as e:
-                if attempt < config.MAX_RETRIES:
-                    wait = 2 ** (attempt + 1)
-                    log.warning(f"  ⚠ Попытка {attempt+1}/{config.MAX_RETRIES}: {e}")
-                    log.warning(f"    Ожидание {wait}с перед повтором...")
-                    time.sleep(wait)
-                else:
-                    log.error(f"  ✗ ОТКАЗ после {config.MAX_RETRIES} попыток: {e}")
-                    errors.append(f"{filename}: {e}")
-                    results.append({
-                        "filename": filename, "filepath": img_path,
-                        "page_type": "error", "data": {"error": str(e)},
-                        "processed_at": datetime.now().isoformat()
-                    })
+                try:
+                    cards.append((pos, CardImage.load(img_path)))
+                except OSError as e:
+                    # Не читается — воркер повторит попытки и вернёт ошибку
+                    log.warning(f"  ⚠ {filename}: не удалось прочитать ({e})")
+                    cards.append((pos, img_path))
+
+            prefetched_ocr = _prefetch_ocr_batch(
+                vision_client, [card for _, card in cards if isinstance(card, CardImage)]
+            )
+            for pos, card in cards:
+                path = card.path if isinstance(card, CardImage) else card
+                future = pool.submit(
+                    _process_new_image, vision_client, claude_client,
+                    card, prefetched_ocr.pop(path, None), limiter,
+                )
+                in_flight[future] = pos
+
+            while len(in_flight) > max_in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future)
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                collect(future)
+
+    # Порядок результатов — как у входных файлов (группировка от него зависит)
+    results.extend(new_results)
 
     # Сохраняем реестр после обработки
     save_registry(registry)
 
     log.info(f"\n{'═'*50}")
     log.info(f"Обработка завершена: {len(new_files)} новых, "
-             f"{len(skipped_files)} пропущено, ошибок: {len(errors)}")
+             f"{len(done_files)} пропущено, ошибок: {len(errors)}")
     if errors:
         for e in errors:
             log.error(f"  - {e}")
@@ -994,10 +1502,39 @@ def normalize_name(name: str) -> str:
     return " ".join(sorted(words))  # Сортируем слова, чтобы "Иванов Пётр" = "Пётр Иванов"
 
 
-def fuzzy_match(name1: str, name2: str) -> float:
+def _indel_similarity(s1: str, s2: str, score_cutoff: float = 0.0) -> float:
+    """
+    Сходство строк 0.0–1.0 по Indel-расстоянию (как rapidfuzz.fuzz.ratio).
+    rapidfuzz (C++) → Numba-ядро utils.fastfuzz (та же метрика) → difflib.
+
+    score_cutoff — результат ниже порога не нужен: вместо него можно вернуть 0.0.
+    Сходство не больше 2·min(len)/(len1+len2), поэтому пары с сильно разной
+    длиной отсекаются без сравнения, а rapidfuzz с порогом переходит на
+    ленточный (banded) расчёт и обрывает его, как только порог недостижим.
+    """
+    if score_cutoff > 0:
+        total = len(s1) + len(s2)
+        # допуск: порог сравнивает вызывающий код, здесь отсекаем только заведомо ниже
+        cutoff = score_cutoff - 1e-6
+        if total and 2 * min(len(s1), len(s2)) / total < cutoff:
+            return 0.0
+    else:
+        cutoff = 0.0
+    rf_fuzz = _lazy_import_rapidfuzz()
+    if rf_fuzz is not None:
+        return rf_fuzz.ratio(s1, s2, score_cutoff=max(cutoff, 0.0) * 100) / 100.0
+    fastfuzz = _lazy_import_fastfuzz()
+    if fastfuzz is not None:
+        return float(fastfuzz.indel_ratio(fastfuzz.encode(s1), fastfuzz.encode(s2)))
+    from difflib import SequenceMatcher
+    return SequenceMatcher(None, s1, s2).ratio()
+
+
+def fuzzy_match(name1: str, name2: str, score_cutoff: float = 0.0) -> float:
     """
     Возвращает степень совпадения двух имён (0.0 - 1.0).
-    Использует rapidfuzz если доступен, иначе difflib.
+    Использует rapidfuzz если доступен, иначе Numba-ядро или difflib.
+    При score_cutoff сходство ниже порога может вернуться как 0.0.
     """
     if not name1 or not name2:
         return 0.0
@@ -1008,12 +1545,9 @@ def fuzzy_match(name1: str, name2: str) -> float:
     if n1 == n2:
         return 1.0
 
-    rf_fuzz = _lazy_import_rapidfuzz()
-    if rf_fuzz is not None:
-        # token_sort_ratio отлично работает для "Иванов Пётр" vs "Пётр Иванов"
-        return rf_fuzz.token_sort_ratio(n1, n2) / 100.0
-    else:
-        return SequenceMatcher(None, n1, n2).ratio()
+    # Слова уже отсортированы normalize_name ("Иванов Пётр" = "Пётр Иванов"),
+    # поэтому ratio здесь равен token_sort_ratio без повторной токенизации
+    return _indel_similarity(n1, n2, score_cutoff)
 
 
 def extract_identifiers(result: dict) -> dict:
@@ -1031,7 +1565,56 @@ def extract_identifiers(result: dict) -> dict:
     }
 
 
-def find_matching_client(identifiers: dict, clients: dict, threshold: float) -> str | None:
+_PHONE_STRIP = str.maketrans('', '', ' -+')
+
+
+class ClientIds(NamedTuple):
+    """Идентификаторы клиента в форме для сравнения — считаются один раз."""
+    iin: str         # без пробелов
+    phone_tail: str  # последние 7 цифр телефона без пробелов/дефисов/плюса
+    name: str        # normalize_name(ФИО)
+
+    @classmethod
+    def of(cls, fio, phone, iin) -> "ClientIds":
+        return cls(
+            (iin or "").replace(" ", ""),
+            (phone or "").translate(_PHONE_STRIP)[-7:],
+            normalize_name(fio),
+        )
+
+
+class ClientIndex:
+    """
+    Нормализованные идентификаторы клиентов (ClientIds) и точные индексы
+    ИИН → клиент, хвост телефона → клиент: проверки 1–2 в find_matching_client
+    — поиск в dict, а не проход по всем клиентам.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.by_iin = {}
+        self.by_phone_tail = {}
+
+    @classmethod
+    def from_clients(cls, clients: dict) -> "ClientIndex":
+        index = cls()
+        for key, client in clients.items():
+            index.update(key, client)
+        return index
+
+    def update(self, key: str, client: dict):
+        """Добавляет клиента или перечитывает его поля после изменения."""
+        ids = ClientIds.of(client.get("name"), client.get("phone"), client.get("iin"))
+        self.ids[key] = ids
+        # При совпадении побеждает клиент, созданный раньше
+        if ids.iin:
+            self.by_iin.setdefault(ids.iin, key)
+        if ids.phone_tail:
+            self.by_phone_tail.setdefault(ids.phone_tail, key)
+
+
+def find_matching_client(identifiers: dict, clients: dict, threshold: float,
+                         fio_matches=None, index: ClientIndex | None = None) -> str | None:
     """
     Ищет существующего клиента по нечёткому совпадению.
 
@@ -1039,33 +1622,118 @@ def find_matching_client(identifiers: dict, clients: dict, threshold: float) ->
     1. Точное совпадение ИИН → 100% тот же клиент
     2. Точное совпадение телефона → 100% тот же клиент
     3. Нечёткое совпадение ФИО >= threshold → вероятно тот же клиент
+
+    fio_matches — callable(client_key, client_name) -> bool с заранее
+    посчитанным результатом проверки 3; по умолчанию fuzzy_match.
+    index — ClientIndex, который вызывающий код ведёт вместе с clients;
+    без него индекс строится на каждом вызове.
     """
-    new_fio = identifiers["fio"]
-    new_phone = identifiers["phone"].replace(" ", "").replace("-", "").replace("+", "")
+    if index is None:
+        index = ClientIndex.from_clients(clients)
+
+    new_phone = identifiers["phone"].translate(_PHONE_STRIP)
+    new_tail = new_phone[-7:] if len(new_phone) >= 7 else ""
     new_iin = identifiers["iin"].replace(" ", "")
 
+    # Проверка 1: ИИН (если есть у обоих)
+    if new_iin and new_iin in index.by_iin:
+        return index.by_iin[new_iin]
+
+    # Проверка 2: Телефон (если есть у обоих)
+    if new_tail and new_tail in index.by_phone_tail:
+        return index.by_phone_tail[new_tail]
+
+    # Проверка 3: Нечёткое ФИО
+    new_fio = identifiers["fio"]
+    if not new_fio:
+        return None
+    new_name = normalize_name(new_fio)
     for client_key, client_data in clients.items():
-        # Проверка 1: ИИН (если есть у обоих)
-        if new_iin and client_data.get("iin"):
-            client_iin = client_data["iin"].replace(" ", "")
-            if new_iin == client_iin:
-                return client_key
-
-        # Проверка 2: Телефон (если есть у обоих)
-        if new_phone and len(new_phone) >= 7 and client_data.get("phone"):
-            client_phone = client_data["phone"].replace(" ", "").replace("-", "").replace("+", "")
-            if client_phone and new_phone[-7:] == client_phone[-7:]:
-                return client_key
-
-        # Проверка 3: Нечёткое ФИО
-        if new_fio and client_data.get("name"):
-            similarity = fuzzy_match(new_fio, client_data["name"])
-            if similarity >= threshold:
-                return client_key
+        if not client_data.get("name"):
+            continue
+        if fio_matches is not None:
+            matched = fio_matches(client_key, client_data["name"])
+        else:
+            known = index.ids[client_key].name
+            matched = new_name == known or _indel_similarity(new_name, known, threshold) >= threshold
+        if matched:
+            return client_key
 
     return None
 
 
+# Страниц за один вызов cdist: блок сравнивается с ФИО клиентов, созданных
+# до блока, и сам с собой — в памяти bool блок × клиенты, а не матрица N×N
+_FIO_MATRIX_BLOCK = 2048
+
+
+class _FioBlockMatcher:
+    """
+    Совпадения ФИО страниц с ФИО основателей клиентов (founder) блоками
+    rapidfuzz.process.cdist (C-код, все ядра).
+
+    fios — ФИО страниц в порядке обработки, уже нормализованные normalize_name;
+    страница-основатель регистрируется add_founder до сравнения с ней
+    следующих страниц.
+    """
+
+    def __init__(self, fios: list, threshold: float, rf_process):
+        self.fios = fios
+        # Баллы — отношения целых, соседние значения отличаются на ≫1e-3:
+        # допуск гасит погрешность float32 и сохраняет «>= threshold» из fuzzy_match
+        self.cutoff = max(threshold * 100 - 1e-3, 0)
+        self._process = rf_process
+        self._founders = []
+        # (начало блока, {позиция основателя: столбец}, блок × ранние основатели, блок × блок)
+        self._block = None
+
+    def add_founder(self, pos: int):
+        self._founders.append(pos)
+
+    def _hits(self, rows: list, cols: list):
+        import numpy as np
+        if not cols:
+            return np.zeros((len(rows), 0), dtype=bool)
+        # Слова в fios уже отсортированы → ratio == token_sort_ratio (как в fuzzy_match)
+        scores = self._process.cdist(
+            rows, cols, scorer=_rapidfuzz_cache["fuzz"].ratio, score_cutoff=self.cutoff,
+            dtype=np.float32, workers=-1,
+        )
+        # ниже score_cutoff cdist пишет 0 и не досчитывает расстояние
+        return scores >= self.cutoff
+
+    def matches(self, pos: int, founder_pos: int) -> bool:
+        """similarity(fios[pos], fios[founder_pos]) >= threshold; founder_pos <= pos."""
+        start = pos - pos % _FIO_MATRIX_BLOCK
+        if self._block is None or self._block[0] != start:
+            block = self.fios[start:start + _FIO_MATRIX_BLOCK]
+            # основатели до блока уже известны: страницы обрабатываются по порядку
+            earlier = [f for f in self._founders if f < start]
+            self._block = (start, {f: col for col, f in enumerate(earlier)},
+                           self._hits(block, [self.fios[f] for f in earlier]),
+                           self._hits(block, block))
+        _, columns, earlier_hits, block_hits = self._block
+        if founder_pos >= start:
+            return bool(block_hits[pos - start, founder_pos - start])
+        return bool(earlier_hits[pos - start, columns[founder_pos]])
+
+
+def _fio_matcher(fios: list, threshold: float):
+    """_FioBlockMatcher для ФИО страниц или None без rapidfuzz."""
+    rf_process = _lazy_import_rapidfuzz_process()
+    if rf_process is None or not fios:
+        return None
+    return _FioBlockMatcher(fios, threshold, rf_process)
+
+
+# Порядок группировки: сначала medical_card_front — они содержат больше всего
+# идентификаторов. Тип → ранг для ключа сортировки, прочие типы — в конец.
+_GROUPING_PRIORITY = MappingProxyType({t: i for i, t in enumerate([
+    'medical_card_front', 'complex_package', 'procedure_sheet',
+    'products_list', 'medical_card_inner', 'botox_record',
+])})
+
+
 def group_by_client(results: list) -> dict:
     """
     Группирует результаты по клиентам с нечётким сопоставлением.
@@ -1076,36 +1744,54 @@ def group_by_client(results: list) -> dict:
     threshold = getattr(config, 'FUZZY_NAME_THRESHOLD', 0.75)
     unmatched = []
 
-    # Сначала обрабатываем medical_card_front — они содержат больше всего идентификаторов
-    priority_order = ['medical_card_front', 'complex_package', 'procedure_sheet',
-                      'products_list', 'medical_card_inner', 'botox_record']
-
     sorted_results = sorted(
-        results,
-        key=lambda r: priority_order.index(r.get("page_type", ""))
-            if r.get("page_type", "") in priority_order else 99
+        results, key=lambda r: _GROUPING_PRIORITY.get(r.get("page_type", ""), 99)
     )
 
-    for result in sorted_results:
+    # ФИО страниц сравниваются с ФИО клиентов блоками cdist; в цикле — только lookup.
+    # Клиент сравнивается по ФИО страницы, которая его создала (founder).
+    all_ids = [extract_identifiers(r) for r in sorted_results]
+    norm_fios = [normalize_name(ids["fio"]) for ids in all_ids]
+    fio_pos = {i: n for n, i in enumerate(i for i, fio in enumerate(norm_fios) if fio)}
+    fio_matcher = _fio_matcher([norm_fios[i] for i in fio_pos], threshold)
+    founder = {}
+    # Нормализованные ИИН/телефон/ФИО клиентов — обновляются при изменении клиента
+    index = ClientIndex()
+
+    for i, result in enumerate(sorted_results):
         if result.get("page_type") == "error":
             unmatched.append(result)
             continue
 
-        ids = extract_identifiers(result)
+        ids = all_ids[i]
         if not ids["fio"] and not ids["phone"] and not ids["iin"]:
             unmatched.append(result)
             continue
 
+        fio_matches = None
+        if fio_matcher is not None and i in fio_pos:
+
+            def fio_matches(key, name, pos=fio_pos[i], fio=ids["fio"]):
+                if key in founder:
+                    return fio_matcher.matches(pos, fio_pos[founder[key]])
+                return fuzzy_match(fio, name, threshold) >= threshold
+
         # Ищем совпадение с существующим клиентом
-        match_key = find_matching_client(ids, clients, threshold)
+        match_key = find_matching_client(ids, clients, threshold, fio_matches, index)
 
         if match_key:
-            clients[match_key]["pages"].append(result)
-            log.debug(f"[ГРУППИРОВКА] «{ids['fio']}» → привязан к «{clients[match_key]['name']}»")
-            if ids["phone"] and not clients[match_key].get("phone"):
-                clients[match_key]["phone"] = ids["phone"]
-            if ids["iin"] and not clients[match_key].get("iin"):
-                clients[match_key]["iin"] = ids["iin"]
+            client = clients[match_key]
+            client["pages"].append(result)
+            log.debug("[ГРУППИРОВКА] «%s» → привязан к «%s»", ids['fio'], client['name'])
+            updated = False
+            if ids["phone"] and not client.get("phone"):
+                client["phone"] = ids["phone"]
+                updated = True
+            if ids["iin"] and not client.get("iin"):
+                client["iin"] = ids["iin"]
+                updated = True
+            if updated:
+                index.update(match_key, client)
         else:
             name = ids["fio"] if ids["fio"] else "(без ФИО)"
             client_key = f"client_{len(clients)+1}"
@@ -1115,7 +1801,12 @@ def group_by_client(results: list) -> dict:
                 "iin": ids["iin"],
                 "pages": [result]
             }
-            log.debug(f"[ГРУППИРОВКА] Новый клиент: «{name}» → {client_key}")
+            index.update(client_key, clients[client_key])
+            if ids["fio"] and i in fio_pos:
+                founder[client_key] = i
+                if fio_matcher is not None:
+                    fio_matcher.add_founder(fio_pos[i])
+            log.debug("[ГРУППИРОВКА] Новый клиент: «%s» → %s", name, client_key)
 
     # Непривязанные страницы → в отдельную группу (не трогаем в dedup)
     if unmatched:
@@ -1138,7 +1829,7 @@ def group_by_client(results: list) -> dict:
                 ids = extract_identifiers(page)
                 match_key = None
                 if ids["fio"] or ids["phone"] or ids["iin"]:
-                    match_key = find_matching_client(ids, clients, threshold)
+                    match_key = find_matching_client(ids, clients, threshold, index=index)
                 if match_key:
                     clients[match_key]["pages"].append(page)
                 else:
@@ -1164,44 +1855,239 @@ def group_by_client(results: list) -> dict:
 #    (убираем одинаковые карточки одного клиента)
 # ============================================================
 
-def compute_image_hash(image_path: str, hash_size: int = 16) -> str:
+def compute_image_hash(image_path, hash_size: int = 16) -> int | None:
     """
     Перцептивный хэш изображения (average hash).
     Два одинаковых фото (даже разного размера/качества) дадут похожий хэш.
+    image_path — путь или file-like с байтами фото.
+
+    Returns: hash_size² бит (пиксель ярче среднего = 1) одним int;
+    None — если фото не открылось.
     """
     try:
+        import numpy as np
         Image = _lazy_import_pil_image()
-        img = Image.open(image_path).convert('L')  # Чёрно-белое
-        img = img.resize((hash_size, hash_size), Image.Resampling.LANCZOS)
-        pixels = list(img.getdata())
-        avg = sum(pixels) / len(pixels)
-        return ''.join('1' if p > avg else '0' for p in pixels)
+        img = Image.open(image_path)
+        # JPEG декодируется сразу в уменьшенном масштабе (до 1/8) — полный
+        # кадр не нужен для картинки 16×16
+        img.draft('L', (hash_size * 8, hash_size * 8))
+        # aHash сравнивает пиксели со средней яркостью — к фильтру нечувствителен;
+        # BILINEAR при уменьшении тоже усредняет, но в разы дешевле LANCZOS
+        img = img.convert('L').resize((hash_size, hash_size), Image.Resampling.BILINEAR)
+        pixels = np.asarray(img, dtype=np.uint8)
+        return int.from_bytes(np.packbits(pixels > pixels.mean()).tobytes(), 'big')
     except Exception:
-        return ""
+        return None
 
 
-def hamming_distance(hash1: str, hash2: str) -> float:
+def hamming_distance(hash1: int | None, hash2: int | None, bits: int = 256) -> float:
     """
     Расстояние Хэмминга между двумя хэшами (0.0 = идентичны, 1.0 = полностью разные).
+    bits — длина хэша (hash_size²); XOR + popcount вместо побитового цикла.
     """
-    if not hash1 or not hash2 or len(hash1) != len(hash2):
+    if hash1 is None or hash2 is None:
         return 1.0
-    diff = sum(c1 != c2 for c1, c2 in zip(hash1, hash2))
-    return diff / len(hash1)
+    return (hash1 ^ hash2).bit_count() / bits
 
 
-def text_similarity(text1: str, text2: str) -> float:
-    """Степень совпадения двух OCR-текстов (0.0 - 1.0)."""
-    if not text1 or not text2:
-        return 0.0
-    t1 = " ".join(text1.lower().split())
-    t2 = " ".join(text2.lower().split())
+# Байт XOR на блок строк матрицы хэшей: блок × U × bytes uint8 не больше ~4 МБ
+_HASH_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def _hash_duplicate_matrix(hashes: list, bits: int, max_distance: float = 0.10):
+    """
+    Попарные расстояния Хэмминга всех хэшей NumPy: XOR упакованных битов
+    блоками строк (блок × U × bytes) → popcount по таблице на 256 значений
+    байта → сумма. Без unpackbits: в памяти байты XOR, а не биты.
+
+    Одинаковые хэши (одно и то же фото) сводятся словарём за O(N) к одному
+    представителю: расстояния считаются только между U различными хэшами,
+    затем матрица разворачивается обратно на N страниц.
+
+    Returns: bool-матрица N×N (distance < max_distance); пара с None → False.
+    """
+    import numpy as np
+    slots = {}
+    inverse = np.array([slots.setdefault(h, len(slots)) for h in hashes], dtype=np.intp)
+    unique = list(slots)
+    nbytes = (bits + 7) // 8
+    present = np.array([h is not None for h in unique], dtype=bool)
+    packed = np.frombuffer(
+        b"".join((h or 0).to_bytes(nbytes, 'big') for h in unique), dtype=np.uint8,
+    ).reshape(len(unique), nbytes)
+    popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(1, dtype=np.uint16)
+    close = np.empty((len(unique), len(unique)), dtype=bool)
+    rows = max(1, _HASH_BLOCK_BYTES // max(1, len(unique) * nbytes))
+    for start in range(0, len(unique), rows):
+        xor = packed[start:start + rows, None, :] ^ packed[None, :, :]
+        diff = popcount[xor].sum(-1)
+        close[start:start + rows] = diff / bits < max_distance
+    close &= present[:, None] & present[None, :]
+    return close[np.ix_(inverse, inverse)]
+
+
+def _normalize_ocr_text(text: str) -> str:
+    """OCR-текст для сравнения: нижний регистр, пробельные символы схлопнуты."""
+    return " ".join(text.lower().split())
+
+
+def _normalized_text_similarity(t1: str, t2: str, score_cutoff: float = 0.0) -> float:
+    """text_similarity для уже нормализованных (_normalize_ocr_text) текстов."""
     if t1 == t2:
         return 1.0
-    rf_fuzz = _lazy_import_rapidfuzz()
-    if rf_fuzz is not None:
-        return rf_fuzz.ratio(t1, t2) / 100.0
-    return SequenceMatcher(None, t1, t2).ratio()
+    return _indel_similarity(t1, t2, score_cutoff)
+
+
+def text_similarity(text1: str, text2: str, score_cutoff: float = 0.0) -> float:
+    """
+    Степень совпадения двух OCR-текстов (0.0 - 1.0).
+    При score_cutoff сходство ниже порога может вернуться как 0.0.
+    """
+    if not text1 or not text2:
+        return 0.0
+    return _normalized_text_similarity(
+        _normalize_ocr_text(text1), _normalize_ocr_text(text2), score_cutoff)
+
+
+def _text_duplicate_matrix(texts: list, threshold: float, norm: list | None = None):
+    """
+    Попарное сходство OCR-текстов одним вызовом rapidfuzz.process.cdist
+    (C++, все ядра) — та же метрика, что у text_similarity.
+    norm — тексты, уже пропущенные через _normalize_ocr_text (если есть).
+
+    Returns: bool-матрица N×N (similarity >= threshold; пустой текст → False)
+    или None без rapidfuzz.
+    """
+    rf_process = _lazy_import_rapidfuzz_process()
+    if rf_process is None or not texts:
+        return None
+    import numpy as np
+    if norm is None:
+        norm = [_normalize_ocr_text(t) for t in texts]
+    # допуск как в _FioBlockMatcher: гасит погрешность float32 на пороге
+    cutoff = max(threshold * 100 - 1e-3, 0)
+    scores = rf_process.cdist(
+        norm, norm, scorer=_rapidfuzz_cache["fuzz"].ratio, score_cutoff=cutoff,
+        dtype=np.float32, workers=-1,
+    )
+    present = np.array([bool(t) for t in texts])
+    return (scores >= cutoff) & present[:, None] & present[None, :]
+
+
+# Меняется вместе с алгоритмом compute_image_hash — старые хэши в кэше
+# перестают совпадать по отпечатку и пересчитываются
+_PHASH_VERSION = 2
+
+
+def _phash_stamp(path: str, hash_size: int) -> str | None:
+    """Отпечаток файла для кэша хэша: размер, mtime, размер и версия хэша. None — файла нет."""
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError, TypeError):
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}:{hash_size}:v{_PHASH_VERSION}"
+
+
+def _store_phash(page: dict, stamp: str | None, img_hash: int | None):
+    """Кладёт хэш фото в результат (он же уходит в JSON-кэш)."""
+    page["img_phash"] = format(img_hash, 'x') if img_hash is not None else ""
+    page["img_phash_stamp"] = stamp
+
+
+def _cached_phash(page: dict, stamp: str):
+    """(True, хэш | None), если в результате есть хэш для этой версии файла; иначе (False, None)."""
+    if not stamp or page.get("img_phash_stamp") != stamp:
+        return False, None
+    value = page.get("img_phash")
+    return True, (int(value, 16) if value else None)
+
+
+def _same_content_groups(paths: list) -> list:
+    """
+    Группирует побайтно одинаковые файлы (повторная загрузка того же скана).
+    Содержимое хэшируется (blake2b) только у файлов с совпадающим размером.
+
+    Returns: список групп путей; первый путь группы — представитель.
+    """
+    by_size = {}
+    for path in paths:
+        try:
+            by_size.setdefault(os.path.getsize(path), []).append(path)
+        except OSError:
+            by_size.setdefault(None, []).append(path)
+
+    groups = []
+    for size, same_size in by_size.items():
+        if size is None or len(same_size) == 1:
+            groups.extend([p] for p in same_size)
+            continue
+        by_digest = {}
+        for path in same_size:
+            try:
+                with open(path, 'rb') as f:
+                    digest = hashlib.file_digest(f, 'blake2b').digest()
+            except OSError:
+                digest = path  # не читается — отдельная группа
+            by_digest.setdefault(digest, []).append(path)
+        groups.extend(by_digest.values())
+    return groups
+
+
+def _compute_page_hashes(grouped_clients: dict, hash_size: int) -> dict:
+    """
+    Перцептивные хэши фото всех страниц, которые пойдут в дедупликацию.
+
+    Хэш берётся из результата (img_phash), если файл не менялся (размер +
+    mtime); остальные фото хэшируются сразу для всех клиентов в пуле
+    потоков (PIL отпускает GIL на декодировании и ресайзе). Побайтно
+    одинаковые файлы декодируются один раз и получают один хэш — проверка 1
+    сразу признаёт их дублями. Новые хэши дописываются в результаты и в уже
+    существующие JSON-кэши — на следующем запуске декодировать ничего не придётся.
+
+    Returns: {filepath: hash | None}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    pages_by_path = {}
+    for key, client_data in grouped_clients.items():
+        if key == "_unmatched" or len(client_data["pages"]) <= 1:
+            continue
+        for page in client_data["pages"]:
+            if page.get("filepath"):
+                pages_by_path.setdefault(page["filepath"], []).append(page)
+
+    hashes, missing = {}, {}
+    for path, pages in pages_by_path.items():
+        stamp = _phash_stamp(path, hash_size)
+        if stamp is None:
+            continue
+        hit, value = _cached_phash(pages[0], stamp)
+        if hit:
+            hashes[path] = value
+        else:
+            missing[path] = stamp
+    if not missing:
+        return hashes
+
+    groups = _same_content_groups(list(missing))
+    with ThreadPoolExecutor(max_workers=min(len(groups), os.cpu_count() or 1)) as pool:
+        computed = pool.map(lambda group: compute_image_hash(group[0], hash_size), groups)
+        for group, img_hash in zip(groups, computed):
+            for path in group:
+                hashes[path] = img_hash
+                for page in pages_by_path[path]:
+                    _store_phash(page, missing[path], img_hash)
+                if os.path.exists(_cache_file(path)):
+                    save_to_cache(path, pages_by_path[path][0])
+    return hashes
+
+
+def _page_content_key(page: dict) -> tuple | None:
+    """Тип + данные страницы для проверки 3; None — тип unknown, не сравнивается."""
+    page_type = page.get("page_type", "")
+    if page_type == "unknown":
+        return None
+    return page_type, json.dumps(page.get("data", {}), sort_keys=True, ensure_ascii=False)
 
 
 def deduplicate_pages(grouped_clients: dict) -> dict:
@@ -1219,6 +2105,7 @@ def deduplicate_pages(grouped_clients: dict) -> dict:
     hash_size = getattr(config, 'IMAGE_HASH_SIZE', 16)
     ocr_threshold = getattr(config, 'OCR_DUPLICATE_THRESHOLD', 0.90)
     total_removed = 0
+    image_hashes = _compute_page_hashes(grouped_clients, hash_size)
 
     for key, client_data in grouped_clients.items():
         # Не трогаем непривязанные страницы, чтобы не потерять данные
@@ -1228,12 +2115,17 @@ def deduplicate_pages(grouped_clients: dict) -> dict:
         if len(pages) <= 1:
             continue
 
-        # Вычисляем хэши для всех страниц
-        page_hashes = []
-        for page in pages:
-            filepath = page.get("filepath", "")
-            img_hash = compute_image_hash(filepath, hash_size) if filepath and os.path.exists(filepath) else ""
-            page_hashes.append(img_hash)
+        page_hashes = [image_hashes.get(page.get("filepath", "")) for page in pages]
+
+        # Проверка 1 для всех пар сразу; в цикле — только lookup
+        hash_dup = _hash_duplicate_matrix(page_hashes, hash_size * hash_size)
+        # Проверка 2 — так же матрицей, если есть rapidfuzz.
+        # Тексты нормализуются один раз на страницу, а не на каждую пару
+        ocr_texts = [p.get("ocr_text") or "" for p in pages]
+        ocr_norm = [_normalize_ocr_text(t) for t in ocr_texts]
+        text_dup = _text_duplicate_matrix(ocr_texts, ocr_threshold, ocr_norm)
+        # Проверка 3 — ключ (тип, данные) сериализуется один раз на страницу
+        content_keys = [_page_content_key(p) for p in pages]
 
         # Ищем дубли
         to_remove = set()
@@ -1244,32 +2136,19 @@ def deduplicate_pages(grouped_clients: dict) -> dict:
                 if j in to_remove:
                     continue
 
-                is_duplicate = False
-
                 # Проверка 1: Перцептивный хэш фото (расстояние < 10% = дубль)
-                if page_hashes[i] and page_hashes[j]:
-                    distance = hamming_distance(page_hashes[i], page_hashes[j])
-                    if distance < 0.10:
-                        is_duplicate = True
+                is_duplicate = bool(hash_dup[i, j])
 
                 # Проверка 2: OCR-текст
-                if not is_duplicate:
-                    ocr_i = pages[i].get("ocr_text", "")
-                    ocr_j = pages[j].get("ocr_text", "")
-                    if ocr_i and ocr_j:
-                        sim = text_similarity(ocr_i, ocr_j)
-                        if sim >= ocr_threshold:
-                            is_duplicate = True
+                if not is_duplicate and text_dup is not None:
+                    is_duplicate = bool(text_dup[i, j])
+                elif not is_duplicate and ocr_texts[i] and ocr_texts[j]:
+                    sim = _normalized_text_similarity(ocr_norm[i], ocr_norm[j], ocr_threshold)
+                    is_duplicate = sim >= ocr_threshold
 
                 # Проверка 3: Тип + ключевые данные
-                if not is_duplicate:
-                    type_i = pages[i].get("page_type", "")
-                    type_j = pages[j].get("page_type", "")
-                    if type_i == type_j and type_i != "unknown":
-                        data_i = json.dumps(pages[i].get("data", {}), sort_keys=True, ensure_ascii=False)
-                        data_j = json.dumps(pages[j].get("data", {}), sort_keys=True, ensure_ascii=False)
-                        if data_i == data_j:
-                            is_duplicate = True
+                if not is_duplicate and content_keys[i] is not None:
+                    is_duplicate = content_keys[i] == content_keys[j]
 
                 if is_duplicate:
                     # Оставляем тот, у которого OCR-текст длиннее (лучше распознан)
@@ -1297,8 +2176,8 @@ def deduplicate_pages(grouped_clients: dict) -> dict:
 # 8. ЗАПИСЬ В EXCEL
 # ============================================================
 
-def style_header(ws, row, col_count):
-    styles = _get_excel_styles()
+def style_header(ws, row, col_count, styles=None):
+    styles = styles or _get_excel_styles()
     for col in range(1, col_count + 1):
         cell = ws.cell(row=row, column=col)
         cell.font = styles['HEADER_FONT']
@@ -1307,8 +2186,12 @@ def style_header(ws, row, col_count):
         cell.border = styles['THIN_BORDER']
 
 
-def style_data_cell(cell, warning=False):
-    styles = _get_excel_styles()
+def style_data_cell(cell, warning=False, styles=None):
+    """
+    Стиль ячейки данных. styles — словарь _get_excel_styles(), который
+    вызывающий код получает один раз на лист, а не на каждую ячейку.
+    """
+    styles = styles or _get_excel_styles()
     cell.font = styles['CELL_FONT']
     cell.alignment = styles['CELL_ALIGNMENT']
     cell.border = styles['THIN_BORDER']
@@ -1316,12 +2199,33 @@ def style_data_cell(cell, warning=False):
         cell.fill = styles['WARN_FILL']
 
 
+def _append_styled_row(ws, values: list, styles: dict, warning=False):
+    """
+    Дописывает строку через ws.append и оформляет её ячейки публичными
+    атрибутами стиля (font/fill/border/alignment).
+    """
+    ws.append(values)
+    row_idx = ws.max_row
+    for col_idx in range(1, len(values) + 1):
+        style_data_cell(ws.cell(row=row_idx, column=col_idx), warning, styles)
+
+
+# Колонки с OCR-текстами/таблицами всегда шире max_w — их не сканируем
+_WIDE_COLUMN_PREFIXES = ("OCR_Текст_", "OCR_Таблицы_")
+
+
 def auto_width(ws, min_w=12, max_w=50):
     from openpyxl.utils import get_column_letter
+    cap = max_w - 2
     for col_cells in ws.columns:
         max_len = 0
         letter = get_column_letter(col_cells[0].column)
+        header = col_cells[0].value
+        if isinstance(header, str) and header.startswith(_WIDE_COLUMN_PREFIXES):
+            max_len = cap
         for cell in col_cells:
+            if max_len >= cap:
+                break  # ширина всё равно упрётся в max_w
             if cell.value:
                 max_len = max(max_len, len(str(cell.value)))
         ws.column_dimensions[letter].width = min(max(max_len + 2, min_w), max_w)
@@ -1332,13 +2236,28 @@ def safe_val(d: dict, key: str, default=""):
     return val if val is not None else default
 
 
-def truncate_text(text: str, max_length: int = 32000) -> str:
+# Лимит текста ячейки Excel — 32767 символов; берём с запасом под пометку
+_EXCEL_TEXT_LIMIT = 32000
+
+
+def truncate_text(text: str, max_length: int = _EXCEL_TEXT_LIMIT) -> str:
     """Ограничивает длину текста для Excel (лимит 32767 символов)."""
     if not text:
         return ""
-    if len(text) <= max_length:
-        return text
-    return text[:max_length] + "... [ОБРЕЗАНО]"
+    return text if len(text) <= max_length else text[:max_length] + "... [ОБРЕЗАНО]"
+
+
+# Тип страницы → колонка OCR-текста; остальные (unknown) — в procedures,
+# чтобы текст не терялся
+_OCR_TEXT_BUCKETS = MappingProxyType({
+    "medical_card_front": "front",
+    "medical_card_inner": "inner",
+    "procedure_sheet": "procedures",
+    "products_list": "products",
+    "complex_package": "complex",
+    "botox_record": "botox",
+})
+_OCR_TEXT_SEP = "\n\n---\n\n"
 
 
 def collect_ocr_texts(pages: list) -> dict:
@@ -1346,81 +2265,70 @@ def collect_ocr_texts(pages: list) -> dict:
     Собирает OCR-тексты по типам страниц.
 
     Returns:
-        dict с ключами: front, inner, procedures, products, complex, botox, full
-    """
-    texts = {
-        "front": [],
-        "inner": [],
-        "procedures": [],
-        "products": [],
-        "complex": [],
-        "botox": [],
-    }
-
-    for page in pages:
-        page_type = page.get("page_type", "")
-        ocr_text = page.get("ocr_text", "")
-
-        if not ocr_text:
-            continue
-
-        # Маппинг типов страниц к категориям
-        if page_type == "medical_card_front":
-            texts["front"].append(ocr_text)
-        elif page_type == "medical_card_inner":
-            texts["inner"].append(ocr_text)
-        elif page_type == "procedure_sheet":
-            texts["procedures"].append(ocr_text)
-        elif page_type == "products_list":
-            texts["products"].append(ocr_text)
-        elif page_type == "complex_package":
-            texts["complex"].append(ocr_text)
-        elif page_type == "botox_record":
-            texts["botox"].append(ocr_text)
-        else:
-            # unknown → не теряем, кладём в полный текст и в procedures как fallback
-            texts["procedures"].append(ocr_text)
-
-    # Объединяем тексты по категориям
-    result = {}
-    for key, text_list in texts.items():
-        joined = "\n\n---\n\n".join(text_list) if text_list else ""
-        result[key] = truncate_text(joined)
-
-    # Полный текст = все тексты вместе
-    all_texts = []
-    for text_list in texts.values():
-        all_texts.extend(text_list)
-    result["full"] = truncate_text("\n\n---\n\n".join(all_texts) if all_texts else "")
-
-    # Если все целевые категории пусты, но full есть — дублируем в procedures как fallback,
-    # чтобы колонка процедур не оставалась пустой (unknown-страницы попадают сюда).
-    if all(not texts[key] for key in ["front", "inner", "procedures", "products", "complex", "botox"]) and result["full"]:
-        result["procedures"] = result["full"]
-
-    # Собираем реконструированные таблицы
+        dict с ключами: front, inner, procedures, products, complex, botox, full,
+        tables_md, tables_csv
+    """
+    texts = {bucket: [] for bucket in _OCR_TEXT_BUCKETS.values()}
     tables_md_parts = []
     tables_csv_parts = []
+
+    # Один проход: текст — в свою категорию, таблицы — в свои списки
     for page in pages:
+        ocr_text = page.get("ocr_text", "")
+        if ocr_text:
+            texts[_OCR_TEXT_BUCKETS.get(page.get("page_type", ""), "procedures")].append(ocr_text)
         md = page.get("tables_md", "")
-        csv_text = page.get("tables_csv", "")
         if md:
             tables_md_parts.append(md)
+        csv_text = page.get("tables_csv", "")
         if csv_text:
             tables_csv_parts.append(csv_text)
 
+    # Каждая категория склеивается один раз; полный текст — все категории по порядку.
+    # Пустые категории не склеиваются и не проходят через truncate_text
+    result = {key: truncate_text(_OCR_TEXT_SEP.join(text_list)) if text_list else ""
+              for key, text_list in texts.items()}
+    filled = [key for key, text_list in texts.items() if text_list]
+    if len(filled) == 1:
+        # Одна категория = полный текст: тот же объект str, а не вторая копия —
+        # sharedStrings openpyxl находит его по уже посчитанному хэшу
+        result["full"] = result[filled[0]]
+    else:
+        result["full"] = truncate_text(_OCR_TEXT_SEP.join(
+            text for text_list in texts.values() for text in text_list))
     result["tables_md"] = truncate_text("\n\n".join(tables_md_parts)) if tables_md_parts else ""
     result["tables_csv"] = truncate_text("\n\n".join(tables_csv_parts)) if tables_csv_parts else ""
 
     return result
 
 
-def _build_client_row(key, cd, cid):
-    """Собирает строку данных для листа Клиенты."""
+# Поля лицевой стороны медкарты в порядке колонок листа «Клиенты»
+_CLIENT_FRONT_FIELDS = (
+    "card_created_date", "birth_date", "age", "gender", "citizenship", "iin",
+    "address", "phone", "email", "messenger", "emergency_contact",
+    "discount", "info_source", "allergies",
+)
+# Колонки OCR-текстов и таблиц (ключи collect_ocr_texts)
+_CLIENT_OCR_COLUMNS = (
+    "front", "inner", "procedures", "products", "complex", "botox", "full",
+    "tables_md", "tables_csv",
+)
+
+
+def _build_client_row(key, cd, cid, cache: dict | None = None):
+    """
+    Собирает строку данных для листа Клиенты.
+
+    cache — {key: поля строки без ID} на время одной записи Excel: если
+    дозапись не удалась и книга пересоздаётся, клиенты не сканируются заново.
+    """
+    if cache is not None and key in cache:
+        return [cid] + cache[key]
+
     front = {}
+    photo_file = None
     doctor = ""
-    last_visit = ""
-    first_visit = ""
+    dates = []
     files = []
 
     for page in cd["pages"]:
@@ -1430,112 +2338,251 @@ def _build_client_row(key, cd, cid):
 
         if pt == "medical_card_front":
             front = d
+            # Фото — файл первой лицевой стороны (данные — последней, как раньше)
+            if photo_file is None:
+                photo_file = page.get("filename", "")
         if d.get("doctor"):
             doctor = d["doctor"]
         if d.get("consultant"):
             doctor = doctor or d["consultant"]
 
-        for proc_key in ["procedures", "products", "injections"]:
+        for proc_key in ("procedures", "products", "injections"):
             items = d.get(proc_key, [])
             if isinstance(items, list):
-                for item in items:
-                    if isinstance(item, dict):
-                        for date_key in ["date", "procedure_date"]:
-                            dt = item.get(date_key, "")
-                            if dt:
-                                if not last_visit or dt > last_visit:
-                                    last_visit = dt
-                                if not first_visit or dt < first_visit:
-                                    first_visit = dt
-
-    photo_file = ""
-    for page in cd["pages"]:
-        if page.get("page_type") == "medical_card_front":
-            photo_file = page.get("filename", "")
-            break
+                dates.extend(dt for item in items if isinstance(item, dict)
+                             for date_key in ("date", "procedure_date")
+                             if (dt := item.get(date_key, "")))
+
+    # Первый/последний визит — одним min/max по всем датам (сравнение строк, как раньше)
+    last_visit = max(dates, default="")
+    first_visit = min(dates, default="")
 
     ocr_texts = collect_ocr_texts(cd["pages"])
 
-    return [
-        cid,
-        safe_val(front, "card_created_date") or first_visit,
-        photo_file,
+    (created, birth_date, age, gender, citizenship, iin, address, phone, email,
+     messenger, emergency_contact, discount, info_source, allergies) = _field_values(
+        front, _CLIENT_FRONT_FIELDS)
+
+    fields = [
+        created or first_visit,
+        photo_file or "",
         cd["name"],
-        safe_val(front, "birth_date"),
-        safe_val(front, "age"),
-        safe_val(front, "gender"),
-        safe_val(front, "citizenship"),
-        cd.get("iin") or safe_val(front, "iin"),
-        safe_val(front, "address"),
-        cd.get("phone") or safe_val(front, "phone"),
-        safe_val(front, "email"),
-        safe_val(front, "messenger"),
-        safe_val(front, "emergency_contact"),
-        safe_val(front, "discount"),
-        safe_val(front, "info_source"),
-        safe_val(front, "allergies"),
+        birth_date, age, gender, citizenship,
+        cd.get("iin") or iin,
+        address,
+        cd.get("phone") or phone,
+        email, messenger, emergency_contact,
+        discount, info_source, allergies,
         doctor, last_visit,
         len(cd["pages"]),
         "; ".join(files),
-        ocr_texts.get("front", ""),
-        ocr_texts.get("inner", ""),
-        ocr_texts.get("procedures", ""),
-        ocr_texts.get("products", ""),
-        ocr_texts.get("complex", ""),
-        ocr_texts.get("botox", ""),
-        ocr_texts.get("full", ""),
-        ocr_texts.get("tables_md", ""),
-        ocr_texts.get("tables_csv", ""),
+        *[ocr_texts[k] for k in _CLIENT_OCR_COLUMNS],
     ]
+    if cache is not None:
+        cache[key] = fields
+    return [cid] + fields
+
+
+# Заголовки листа «Клиенты» — порядок колонок _build_client_row
+_CLIENT_HEADERS = (
+    # 3.1. Идентификационный блок
+    "ID", "Дата создания карты", "Фото (файл)",
+    # 3.2. Персональные данные
+    "ФИО", "Дата рождения", "Возраст", "Пол", "Гражданство",
+    "ИИН / Паспорт", "Адрес", "Телефон", "Email", "Мессенджер",
+    "Экстренный контакт",
+    # Дополнительные поля клиники
+    "Скидка", "Источник инфо", "Аллергии", "Консультант/Врач",
+    "Дата последнего визита", "Кол-во страниц", "Файлы-источники",
+    # 3.3. OCR-тексты (оцифрованный текст)
+    "OCR_Текст_Лицевая", "OCR_Текст_Внутренняя", "OCR_Текст_Процедуры",
+    "OCR_Текст_Покупки", "OCR_Текст_Комплексы", "OCR_Текст_Ботокс",
+    "OCR_Текст_Полный",
+    # 3.4. Реконструированные таблицы
+    "OCR_Таблицы_MD", "OCR_Таблицы_CSV"
+)
+
+# Детальные листы: (название, заголовки) в порядке листов книги
+_DETAIL_SHEETS = (
+    ("Мед_данные", [
+        "ID", "ФИО", "Основные жалобы", "Объективный статус",
+        "Предварит. диагноз", "АД", "Вес", "ДМІ", "ДМІІ",
+        "Охват груди", "Охват талии", "Охват бёдер",
+        "Гепатиты/КВЗ/туберк./онко", "Хронические заболевания",
+        "Отметки специалиста"
+    ]),
+    ("Процедуры", ["ID", "ФИО", "Дата", "Процедура", "Описание", "Стоимость"]),
+    ("Покупки", ["ID", "ФИО", "Дата", "Консультант", "Наименование", "Цена"]),
+    ("Комплексы", [
+        "ID", "Пациент", "Контакты", "Врач", "Комплекс",
+        "Дата покупки", "Стоимость", "№", "Процедура",
+        "Дата", "Кол-во", "Комментарий"
+    ]),
+    ("Ботокс", [
+        "ID", "ФИО", "Препарат", "Область введения",
+        "Кол-во единиц", "Общая доза", "Дата процедуры", "Дата контроля"
+    ]),
+)
+
+
+# Поля детальных листов в порядке колонок (после ID и ФИО)
+_MED_FIELDS = (
+    "complaints", "objective_status", "preliminary_diagnosis",
+    "blood_pressure", "weight", "dm1", "dm2", "chest", "waist", "hips",
+    "hepatitis_history", "chronic_diseases", "specialist_notes",
+)
+_PROCEDURE_FIELDS = ("date", "procedure_name", "description", "cost")
+_PURCHASE_FIELDS = ("date", "consultant", "product_name", "price")
+_COMPLEX_FIELDS = ("patient_name", "contacts", "doctor", "complex_name",
+                   "purchase_date", "complex_cost")
+_COMPLEX_PROCEDURE_FIELDS = ("number", "procedure", "date", "quantity", "comment")
+_BOTOX_FIELDS = ("drug", "injection_area", "units_count", "total_dose",
+                 "procedure_date", "control_date")
+
+
+def _field_values(d: dict, fields: tuple) -> list:
+    """
+    То же, что [safe_val(d, k) for k in fields], но одним включением
+    со связанным d.get: один вызов на строку, а не на каждое поле.
+    None (null в ответе Claude) → "".
+    """
+    get = d.get
+    return ["" if (v := get(k)) is None else v for k in fields]
+
+
+def _med_rows(cid, cd, d):
+    yield [cid, cd["name"], *_field_values(d, _MED_FIELDS)]
+
+
+def _procedure_rows(cid, cd, d):
+    procs = d.get("procedures", [])
+    if isinstance(procs, list):
+        for p in procs:
+            if isinstance(p, dict):
+                yield [cid, cd["name"], *_field_values(p, _PROCEDURE_FIELDS)]
+
+
+def _purchase_rows(cid, cd, d):
+    prods = d.get("products", [])
+    if isinstance(prods, list):
+        for p in prods:
+            if isinstance(p, dict):
+                yield [cid, cd["name"], *_field_values(p, _PURCHASE_FIELDS)]
 
 
-def _append_new_clients(grouped_clients: dict, output_path: str) -> int:
+def _complex_rows(cid, cd, d):
+    procs = d.get("procedures", [])
+    base = [cid, *_field_values(d, _COMPLEX_FIELDS)]
+    if isinstance(procs, list) and procs:
+        for p in procs:
+            if isinstance(p, dict):
+                yield base + _field_values(p, _COMPLEX_PROCEDURE_FIELDS)
+    else:
+        yield base + [""] * len(_COMPLEX_PROCEDURE_FIELDS)
+
+
+def _botox_rows(cid, cd, d):
+    injs = d.get("injections", [])
+    if isinstance(injs, list):
+        for inj in injs:
+            if isinstance(inj, dict):
+                yield [cid, cd["name"], *_field_values(inj, _BOTOX_FIELDS)]
+
+
+# Тип страницы → (детальный лист, генератор строк(cid, cd, data))
+_DETAIL_ROW_BUILDERS = MappingProxyType({
+    "medical_card_inner": ("Мед_данные", _med_rows),
+    "procedure_sheet": ("Процедуры", _procedure_rows),
+    "products_list": ("Покупки", _purchase_rows),
+    "complex_package": ("Комплексы", _complex_rows),
+    "botox_record": ("Ботокс", _botox_rows),
+})
+
+
+def _collect_detail_rows(clients, client_id_map: dict) -> dict:
     """
-    Дозаписывает ТОЛЬКО новых клиентов в существующий Excel.
-    Существующие строки (с ручными правками) остаются нетронутыми.
-    Новые клиенты определяются по файлам-источникам.
+    Строки детальных листов за один проход по страницам.
+    clients — пары (key, cd) в порядке записи.
 
-    Returns: количество добавленных клиентов (0 = нечего добавлять).
-    Raises: Exception если дозапись невозможна (файл повреждён и т.п.)
+    Returns: {название листа: [строки]} для всех листов _DETAIL_SHEETS.
     """
-    import re
-    from openpyxl import load_workbook
+    rows = {title: [] for title, _ in _DETAIL_SHEETS}
+    for key, cd in clients:
+        cid = client_id_map.get(key, "")
+        for page in cd["pages"]:
+            handler = _DETAIL_ROW_BUILDERS.get(page.get("page_type"))
+            if handler is not None:
+                title, build = handler
+                rows[title].extend(build(cid, cd, page.get("data", {})))
+    return rows
 
-    wb = load_workbook(output_path)
 
-    if "Клиенты" not in wb.sheetnames:
-        wb.close()
-        raise ValueError("Лист 'Клиенты' не найден")
+_CLIENT_ID_RE = re.compile(r'CL-(\d+)')
 
-    ws = wb["Клиенты"]
 
-    # --- Читаем заголовки ---
-    headers = [cell.value for cell in ws[1]]
-    if "ID" not in headers or "Файлы-источники" not in headers:
-        wb.close()
-        raise ValueError("Нет колонок ID / Файлы-источники")
+def _scan_existing_clients(output_path: str) -> tuple:
+    """
+    Файлы-источники и максимальный номер CL-XXXX из листа «Клиенты».
+    Книга открывается read-only: строки читаются из XML потоком, объекты
+    ячеек для всей книги не создаются.
 
-    id_col = headers.index("ID")
-    files_col = headers.index("Файлы-источники")
+    Returns: (set имён файлов, max_id_num).
+    Raises: ValueError — нет листа «Клиенты» или колонок ID / Файлы-источники.
+    """
+    from openpyxl import load_workbook
 
-    # --- Собираем файлы из существующих строк и макс. ID ---
-    existing_files = set()
-    max_id_num = 0
+    wb = load_workbook(output_path, read_only=True)
+    try:
+        if "Клиенты" not in wb.sheetnames:
+            raise ValueError("Лист 'Клиенты' не найден")
+        ws = wb["Клиенты"]
+
+        headers = list(next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+        if "ID" not in headers or "Файлы-источники" not in headers:
+            raise ValueError("Нет колонок ID / Файлы-источники")
+        id_col = headers.index("ID")
+        files_col = headers.index("Файлы-источники")
+
+        existing_files = set()
+        max_id_num = 0
+        # Читаем только диапазон колонок от ID до файлов, а не всю строку
+        first = min(id_col, files_col)
+        id_col -= first
+        files_col -= first
+        for row in ws.iter_rows(min_row=2, min_col=first + 1,
+                                max_col=first + max(id_col, files_col) + 1, values_only=True):
+            cid_val = row[id_col] if id_col < len(row) else None
+            files_val = row[files_col] if files_col < len(row) else None
+
+            if cid_val:
+                cid_str = cid_val if isinstance(cid_val, str) else str(cid_val)
+                if cid_str.startswith("CL-") and (m := _CLIENT_ID_RE.match(cid_str)):
+                    max_id_num = max(max_id_num, int(m.group(1)))
+
+            if files_val:
+                # strip — на случай ручных правок ячейки; пустые имена отбрасывает filter
+                existing_files.update(filter(None, map(str.strip, str(files_val).split("; "))))
+        return existing_files, max_id_num
+    finally:
+        wb.close()
 
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, values_only=True):
-        cid_val = row[id_col] if id_col < len(row) else None
-        files_val = row[files_col] if files_col < len(row) else None
 
-        if cid_val:
-            m = re.match(r'CL-(\d+)', str(cid_val))
-            if m:
-                max_id_num = max(max_id_num, int(m.group(1)))
+def _append_new_clients(grouped_clients: dict, output_path: str,
+                        row_cache: dict | None = None) -> int:
+    """
+    Дозаписывает ТОЛЬКО новых клиентов в существующий Excel.
+    Существующие строки (с ручными правками) остаются нетронутыми.
+    Новые клиенты определяются по файлам-источникам.
+    row_cache — кэш строк клиентов (см. _build_client_row).
+
+    Returns: количество добавленных клиентов (0 = нечего добавлять).
+    Raises: Exception если дозапись невозможна (файл повреждён и т.п.)
+    """
+    from openpyxl import load_workbook
 
-        if files_val:
-            for f in str(files_val).split("; "):
-                f = f.strip()
-                if f:
-                    existing_files.add(f)
+    # Существующие файлы и ID — потоковым чтением; полная загрузка книги —
+    # только если действительно есть что дописать
+    existing_files, max_id_num = _scan_existing_clients(output_path)
 
     # --- Определяем новых клиентов ---
     new_clients = {}
@@ -1550,256 +2597,230 @@ def _append_new_clients(grouped_clients: dict, output_path: str) -> int:
         new_clients[key] = cd
 
     if not new_clients:
-        wb.close()
         log.info(f"\n  Нет новых клиентов — файл сохранён без изменений.")
         return 0
 
-    # --- Назначаем ID новым клиентам ---
+    wb = load_workbook(output_path)
+    ws = wb["Клиенты"]
+    # Стили берутся один раз на всю дозапись, а не на каждую ячейку
+    styles = _get_excel_styles()
+
+    # --- Назначаем ID новым клиентам и дописываем их в лист «Клиенты» ---
     client_id_map = {}
     new_id_counter = max_id_num
 
-    for key in sorted(new_clients.keys()):
+    for key in sorted(new_clients):
         if key == "_unmatched":
-            client_id_map[key] = "???"
+            cid = "???"
         else:
             new_id_counter += 1
-            client_id_map[key] = f"CL-{new_id_counter:04d}"
-
-    # --- Дописываем в лист «Клиенты» ---
-    row_idx = ws.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        is_unmatched = key == "_unmatched"
-        row_data = _build_client_row(key, cd, cid)
-
-        for col_idx, val in enumerate(row_data, 1):
-            ws.cell(row=row_idx, column=col_idx, value=val)
-            style_data_cell(ws.cell(row=row_idx, column=col_idx), warning=is_unmatched)
-
-        row_idx += 1
+            cid = f"CL-{new_id_counter:04d}"
+        client_id_map[key] = cid
+        row_data = _build_client_row(key, new_clients[key], cid, row_cache)
+        _append_styled_row(ws, row_data, styles, warning=key == "_unmatched")
 
     ws.auto_filter.ref = ws.dimensions
 
-    # --- Дозапись в детальные листы ---
-    # Структура: (имя_листа, заголовки, page_type, функция_извлечения_строк)
-
+    # --- Дозапись в детальные листы (один проход по страницам новых клиентов) ---
     def _ensure_sheet(wb, name, sheet_headers):
         if name in wb.sheetnames:
             return wb[name]
         ws_new = wb.create_sheet(name)
         ws_new.append(sheet_headers)
-        style_header(ws_new, 1, len(sheet_headers))
+        style_header(ws_new, 1, len(sheet_headers), styles)
         return ws_new
 
-    # Мед_данные
-    h_med = [
-        "ID", "ФИО", "Основные жалобы", "Объективный статус",
-        "Предварит. диагноз", "АД", "Вес", "ДМІ", "ДМІІ",
-        "Охват груди", "Охват талии", "Охват бёдер",
-        "Гепатиты/КВЗ/туберк./онко", "Хронические заболевания",
-        "Отметки специалиста"
-    ]
-    ws_med = _ensure_sheet(wb, "Мед_данные", h_med)
-    r_med = ws_med.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        for page in cd["pages"]:
-            if page.get("page_type") == "medical_card_inner":
-                d = page.get("data", {})
-                row_data = [
-                    cid, cd["name"],
-                    safe_val(d, "complaints"), safe_val(d, "objective_status"),
-                    safe_val(d, "preliminary_diagnosis"),
-                    safe_val(d, "blood_pressure"), safe_val(d, "weight"),
-                    safe_val(d, "dm1"), safe_val(d, "dm2"),
-                    safe_val(d, "chest"), safe_val(d, "waist"), safe_val(d, "hips"),
-                    safe_val(d, "hepatitis_history"),
-                    safe_val(d, "chronic_diseases"),
-                    safe_val(d, "specialist_notes")
-                ]
-                for col_idx, val in enumerate(row_data, 1):
-                    ws_med.cell(row=r_med, column=col_idx, value=val)
-                    style_data_cell(ws_med.cell(row=r_med, column=col_idx))
-                r_med += 1
-
-    # Процедуры
-    h_proc = ["ID", "ФИО", "Дата", "Процедура", "Описание", "Стоимость"]
-    ws_proc = _ensure_sheet(wb, "Процедуры", h_proc)
-    r_proc = ws_proc.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        for page in cd["pages"]:
-            if page.get("page_type") == "procedure_sheet":
-                procs = page.get("data", {}).get("procedures", [])
-                if isinstance(procs, list):
-                    for p in procs:
-                        if isinstance(p, dict):
-                            row_data = [
-                                cid, cd["name"],
-                                safe_val(p, "date"),
-                                safe_val(p, "procedure_name"),
-                                safe_val(p, "description"),
-                                safe_val(p, "cost")
-                            ]
-                            for col_idx, val in enumerate(row_data, 1):
-                                ws_proc.cell(row=r_proc, column=col_idx, value=val)
-                                style_data_cell(ws_proc.cell(row=r_proc, column=col_idx))
-                            r_proc += 1
-
-    # Покупки
-    h_purch = ["ID", "ФИО", "Дата", "Консультант", "Наименование", "Цена"]
-    ws_purch = _ensure_sheet(wb, "Покупки", h_purch)
-    r_purch = ws_purch.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        for page in cd["pages"]:
-            if page.get("page_type") == "products_list":
-                prods = page.get("data", {}).get("products", [])
-                if isinstance(prods, list):
-                    for p in prods:
-                        if isinstance(p, dict):
-                            row_data = [
-                                cid, cd["name"],
-                                safe_val(p, "date"),
-                                safe_val(p, "consultant"),
-                                safe_val(p, "product_name"),
-                                safe_val(p, "price")
-                            ]
-                            for col_idx, val in enumerate(row_data, 1):
-                                ws_purch.cell(row=r_purch, column=col_idx, value=val)
-                                style_data_cell(ws_purch.cell(row=r_purch, column=col_idx))
-                            r_purch += 1
-
-    # Комплексы
-    h_comp = [
-        "ID", "Пациент", "Контакты", "Врач", "Комплекс",
-        "Дата покупки", "Стоимость", "№", "Процедура",
-        "Дата", "Кол-во", "Комментарий"
-    ]
-    ws_comp = _ensure_sheet(wb, "Комплексы", h_comp)
-    r_comp = ws_comp.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        for page in cd["pages"]:
-            if page.get("page_type") == "complex_package":
-                d = page.get("data", {})
-                procs = d.get("procedures", [])
-                base = [
-                    cid, safe_val(d, "patient_name"), safe_val(d, "contacts"),
-                    safe_val(d, "doctor"), safe_val(d, "complex_name"),
-                    safe_val(d, "purchase_date"), safe_val(d, "complex_cost")
-                ]
-                if isinstance(procs, list) and procs:
-                    for p in procs:
-                        if isinstance(p, dict):
-                            row_data = base + [
-                                safe_val(p, "number"), safe_val(p, "procedure"),
-                                safe_val(p, "date"), safe_val(p, "quantity"),
-                                safe_val(p, "comment")
-                            ]
-                            for col_idx, val in enumerate(row_data, 1):
-                                ws_comp.cell(row=r_comp, column=col_idx, value=val)
-                                style_data_cell(ws_comp.cell(row=r_comp, column=col_idx))
-                            r_comp += 1
-                else:
-                    row_data = base + ["", "", "", "", ""]
-                    for col_idx, val in enumerate(row_data, 1):
-                        ws_comp.cell(row=r_comp, column=col_idx, value=val)
-                        style_data_cell(ws_comp.cell(row=r_comp, column=col_idx))
-                    r_comp += 1
-
-    # Ботокс
-    h_bot = [
-        "ID", "ФИО", "Препарат", "Область введения",
-        "Кол-во единиц", "Общая доза", "Дата процедуры", "Дата контроля"
-    ]
-    ws_bot = _ensure_sheet(wb, "Ботокс", h_bot)
-    r_bot = ws_bot.max_row + 1
-
-    for key in sorted(new_clients.keys()):
-        cd = new_clients[key]
-        cid = client_id_map[key]
-        for page in cd["pages"]:
-            if page.get("page_type") == "botox_record":
-                d = page.get("data", {})
-                injs = d.get("injections", [])
-                if isinstance(injs, list):
-                    for inj in injs:
-                        if isinstance(inj, dict):
-                            row_data = [
-                                cid, cd["name"],
-                                safe_val(inj, "drug"),
-                                safe_val(inj, "injection_area"),
-                                safe_val(inj, "units_count"),
-                                safe_val(inj, "total_dose"),
-                                safe_val(inj, "procedure_date"),
-                                safe_val(inj, "control_date")
-                            ]
-                            for col_idx, val in enumerate(row_data, 1):
-                                ws_bot.cell(row=r_bot, column=col_idx, value=val)
-                                style_data_cell(ws_bot.cell(row=r_bot, column=col_idx))
-                            r_bot += 1
+    detail_rows = _collect_detail_rows(
+        ((key, new_clients[key]) for key in sorted(new_clients)), client_id_map)
+    for title, sheet_headers in _DETAIL_SHEETS:
+        ws_detail = _ensure_sheet(wb, title, sheet_headers)
+        for row_data in detail_rows[title]:
+            _append_styled_row(ws_detail, row_data, styles)
 
     # --- Сохранение ---
-    wb.save(output_path)
+    _save_openpyxl_workbook(wb, output_path)
     wb.close()
 
     log.info(f"\n  ✓ Дозаписано {len(new_clients)} новых клиентов в {output_path}")
     return len(new_clients)
 
 
-def write_to_excel(grouped_clients: dict, all_results: list):
+# Именованные стили книги: (имя, ключи _get_excel_styles())
+_NAMED_STYLES = {
+    'ocr_header': ('HEADER_FONT', 'HEADER_FILL', 'HEADER_ALIGNMENT'),
+    'ocr_cell': ('CELL_FONT', None, 'CELL_ALIGNMENT'),
+    'ocr_warn': ('CELL_FONT', 'WARN_FILL', 'CELL_ALIGNMENT'),
+}
+
+
+def _register_named_styles(wb):
+    """
+    Регистрирует стили заголовка/ячейки/предупреждения в книге один раз.
+    Ячейке затем достаточно присвоить имя стиля вместо 4 атрибутов.
+    """
+    from openpyxl.styles import NamedStyle
+    styles = _get_excel_styles()
+    for name, (font, fill, alignment) in _NAMED_STYLES.items():
+        if name in wb.named_styles:
+            continue
+        ns = NamedStyle(name=name)
+        ns.font = styles[font]
+        if fill:
+            ns.fill = styles[fill]
+        ns.alignment = styles[alignment]
+        ns.border = styles['THIN_BORDER']
+        wb.add_named_style(ns)
+
+
+def _column_widths(headers: list, rows: list, min_w=12, max_w=50) -> list:
+    """
+    Ширины колонок по содержимому — как auto_width, но до записи строк.
+    Колонка сканируется, пока ширина не упрётся в max_w; OCR-колонки сразу max_w.
+    """
+    cap = max_w - 2
+    widths = []
+    for i, header in enumerate(headers):
+        width = len(str(header)) if header else 0
+        if isinstance(header, str) and header.startswith(_WIDE_COLUMN_PREFIXES):
+            width = cap
+        for row in rows:
+            if width >= cap:
+                break
+            val = row[i]
+            if val:
+                width = max(width, len(str(val)))
+        widths.append(min(max(width + 2, min_w), max_w))
+    return widths
+
+
+def _write_sheet_streamed(wb, title: str, headers: list, rows: list, warn_rows=()):
+    """
+    Пишет лист в write-only книгу: ширины и автофильтр задаются до строк,
+    ячейки создаются как WriteOnlyCell с именованным стилем.
+
+    warn_rows — индексы строк (в rows), выделяемых жёлтым.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(title)
+    for i, width in enumerate(_column_widths(headers, rows), 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(rows) + 1}"
+
+    def _cells(values, style):
+        cells = []
+        for val in values:
+            cell = WriteOnlyCell(ws, value=val)
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    ws.append(_cells(headers, 'ocr_header'))
+    warn_rows = set(warn_rows)
+    for i, row in enumerate(rows):
+        ws.append(_cells(row, 'ocr_warn' if i in warn_rows else 'ocr_cell'))
+    return ws
+
+
+# Те же стили в терминах xlsxwriter: один Format на стиль на всю книгу
+_XLSXWRITER_FORMATS = {
+    'ocr_header': {'font_name': 'Arial', 'font_size': 11, 'bold': True,
+                   'font_color': '#FFFFFF', 'bg_color': '#2F5496',
+                   'align': 'center', 'valign': 'vcenter', 'text_wrap': True,
+                   'border': 1},
+    'ocr_cell': {'font_name': 'Arial', 'font_size': 10,
+                 'valign': 'top', 'text_wrap': True, 'border': 1},
+    'ocr_warn': {'font_name': 'Arial', 'font_size': 10, 'bg_color': '#FFF2CC',
+                 'valign': 'top', 'text_wrap': True, 'border': 1},
+}
+
+
+def _save_with_xlsxwriter(xlsxwriter, path: str, sheets: list):
+    """
+    Пишет книгу xlsxwriter в режиме constant_memory: каждая строка сразу
+    уходит во временный XML листа, в памяти держится только текущая.
+
+    sheets — [(title, headers, rows, warn_rows), ...].
+    """
+    wb = xlsxwriter.Workbook(path, {'constant_memory': True,
+                                    'strings_to_urls': False})
+    formats = {name: wb.add_format(props)
+               for name, props in _XLSXWRITER_FORMATS.items()}
+    try:
+        for title, headers, rows, warn_rows in sheets:
+            ws = wb.add_worksheet(title)
+            for i, width in enumerate(_column_widths(headers, rows)):
+                ws.set_column(i, i, width)
+            ws.autofilter(0, 0, len(rows), len(headers) - 1)
+
+            ws.write_row(0, 0, headers, formats['ocr_header'])
+            warn_rows = set(warn_rows)
+            for r, row in enumerate(rows, 1):
+                fmt = formats['ocr_warn'] if r - 1 in warn_rows else formats['ocr_cell']
+                ws.write_row(r, 0, row, fmt)
+    finally:
+        wb.close()
+
+
+def _save_openpyxl_workbook(wb, path: str):
+    """
+    wb.save(path), но с уровнем сжатия ZIP из config.EXCEL_COMPRESSLEVEL:
+    openpyxl всегда берёт уровень zlib по умолчанию, а на больших
+    OCR-текстах deflate занимает большую часть времени сохранения.
+    """
+    from datetime import timezone
+    from zipfile import ZipFile, ZIP_DEFLATED
+    from openpyxl.writer.excel import ExcelWriter
+
+    if wb.write_only and not wb.worksheets:
+        wb.create_sheet()
+    archive = ZipFile(path, 'w', ZIP_DEFLATED, allowZip64=True,
+                      compresslevel=getattr(config, 'EXCEL_COMPRESSLEVEL', 1))
+    wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()
+
+
+def _save_new_workbook(path: str, sheets: list):
+    """
+    Сохраняет новую книгу: xlsxwriter (constant_memory), если установлен,
+    иначе openpyxl write-only. Листы и стили в обоих случаях одинаковы.
+    """
+    xlsxwriter = _lazy_import_xlsxwriter()
+    if xlsxwriter is not None:
+        _save_with_xlsxwriter(xlsxwriter, path, sheets)
+        return
+
     from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    _register_named_styles(wb)
+    for title, headers, rows, warn_rows in sheets:
+        _write_sheet_streamed(wb, title, headers, rows, warn_rows)
+    _save_openpyxl_workbook(wb, path)
 
+
+def write_to_excel(grouped_clients: dict, all_results: list):
     output_path = config.OUTPUT_FILE
     os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
 
+    # Строки «Клиенты» общие для дозаписи и пересоздания файла
+    row_cache = {}
+
     # === РЕЖИМ ДОЗАПИСИ (если файл уже существует) ===
     if os.path.exists(output_path):
         try:
-            _append_new_clients(grouped_clients, output_path)
+            _append_new_clients(grouped_clients, output_path, row_cache)
             return
         except Exception as e:
             log.warning(f"  ⚠ Дозапись не удалась ({e}), пересоздаю файл...")
 
-    # === СОЗДАНИЕ С НУЛЯ ===
-    wb = Workbook()
+    # === СОЗДАНИЕ С НУЛЯ (строки собираются, затем стримятся в XML) ===
+    sheets = []
 
     # === ЛИСТ 1: КЛИЕНТЫ ===
-    ws = wb.active
-    ws.title = "Клиенты"
-    headers = [
-        # 3.1. Идентификационный блок
-        "ID", "Дата создания карты", "Фото (файл)",
-        # 3.2. Персональные данные
-        "ФИО", "Дата рождения", "Возраст", "Пол", "Гражданство",
-        "ИИН / Паспорт", "Адрес", "Телефон", "Email", "Мессенджер",
-        "Экстренный контакт",
-        # Дополнительные поля клиники
-        "Скидка", "Источник инфо", "Аллергии", "Консультант/Врач",
-        "Дата последнего визита", "Кол-во страниц", "Файлы-источники",
-        # 3.3. OCR-тексты (оцифрованный текст)
-        "OCR_Текст_Лицевая", "OCR_Текст_Внутренняя", "OCR_Текст_Процедуры",
-        "OCR_Текст_Покупки", "OCR_Текст_Комплексы", "OCR_Текст_Ботокс",
-        "OCR_Текст_Полный",
-        # 3.4. Реконструированные таблицы
-        "OCR_Таблицы_MD", "OCR_Таблицы_CSV"
-    ]
-    ws.append(headers)
-    style_header(ws, 1, len(headers))
-
+    rows = []
+    warn_rows = []
     client_id_map = {}
-    row_idx = 2
 
     for idx, (key, cd) in enumerate(
         sorted(grouped_clients.items(), key=lambda x: x[0]), 1
@@ -1808,275 +2829,31 @@ def write_to_excel(grouped_clients: dict, all_results: list):
         cid = "???" if is_unmatched else f"CL-{idx:04d}"
         client_id_map[key] = cid
 
-        front = {}
-        doctor = ""
-        last_visit = ""
-        first_visit = ""
-        files = []
+        row = _build_client_row(key, cd, cid, row_cache)
+        if is_unmatched:
+            warn_rows.append(len(rows))
+        rows.append(row)
 
-        for page in cd["pages"]:
-            files.append(page.get("filename", ""))
-            pt = page.get("page_type", "")
-            d = page.get("data", {})
-
-            if pt == "medical_card_front":
-                front = d
-            if d.get("doctor"):
-                doctor = d["doctor"]
-            if d.get("consultant"):
-                doctor = doctor or d["consultant"]
-
-            # Находим последнюю и первую дату визита
-            for proc_key in ["procedures", "products", "injections"]:
-                items = d.get(proc_key, [])
-                if isinstance(items, list):
-                    for item in items:
-                        if isinstance(item, dict):
-                            for date_key in ["date", "procedure_date"]:
-                                dt = item.get(date_key, "")
-                                if dt:
-                                    if not last_visit or dt > last_visit:
-                                        last_visit = dt
-                                    if not first_visit or dt < first_visit:
-                                        first_visit = dt
-
-        # Фото — первый файл с лицевой стороной
-        photo_file = ""
-        for page in cd["pages"]:
-            if page.get("page_type") == "medical_card_front":
-                photo_file = page.get("filename", "")
-                break
+    sheets.append(("Клиенты", _CLIENT_HEADERS, rows, warn_rows))
+    counts = {"Клиенты": len(rows)}
 
-        # Собираем OCR-тексты
-        ocr_texts = collect_ocr_texts(cd["pages"])
-
-        row = [
-            # 3.1. Идентификационный блок
-            cid,
-            safe_val(front, "card_created_date") or first_visit,
-            photo_file,
-            # 3.2. Персональные данные (всё из OCR, пустое = пустое)
-            cd["name"],
-            safe_val(front, "birth_date"),
-            safe_val(front, "age"),
-            safe_val(front, "gender"),
-            safe_val(front, "citizenship"),
-            cd.get("iin") or safe_val(front, "iin"),
-            safe_val(front, "address"),
-            cd.get("phone") or safe_val(front, "phone"),
-            safe_val(front, "email"),
-            safe_val(front, "messenger"),
-            safe_val(front, "emergency_contact"),
-            # Дополнительные поля клиники
-            safe_val(front, "discount"),
-            safe_val(front, "info_source"),
-            safe_val(front, "allergies"),
-            doctor, last_visit,
-            len(cd["pages"]),
-            "; ".join(files),
-            # OCR-тексты
-            ocr_texts.get("front", ""),
-            ocr_texts.get("inner", ""),
-            ocr_texts.get("procedures", ""),
-            ocr_texts.get("products", ""),
-            ocr_texts.get("complex", ""),
-            ocr_texts.get("botox", ""),
-            ocr_texts.get("full", ""),
-            # Реконструированные таблицы
-            ocr_texts.get("tables_md", ""),
-            ocr_texts.get("tables_csv", ""),
-        ]
-        ws.append(row)
-        for col in range(1, len(headers) + 1):
-            style_data_cell(ws.cell(row=row_idx, column=col), warning=is_unmatched)
-        row_idx += 1
-
-    auto_width(ws)
-    ws.auto_filter.ref = ws.dimensions
+    # === ЛИСТЫ 2–6: МЕД. ДАННЫЕ, ПРОЦЕДУРЫ, ПОКУПКИ, КОМПЛЕКСЫ, БОТОКС ===
+    detail_rows = _collect_detail_rows(sorted(grouped_clients.items()), client_id_map)
+    for title, sheet_headers in _DETAIL_SHEETS:
+        sheets.append((title, sheet_headers, detail_rows[title], ()))
+        counts[title] = len(detail_rows[title])
 
-    # === ЛИСТ 2: МЕД. ДАННЫЕ ===
-    ws2 = wb.create_sheet("Мед_данные")
-    h2 = [
-        "ID", "ФИО", "Основные жалобы", "Объективный статус",
-        "Предварит. диагноз", "АД", "Вес", "ДМІ", "ДМІІ",
-        "Охват груди", "Охват талии", "Охват бёдер",
-        "Гепатиты/КВЗ/туберк./онко", "Хронические заболевания",
-        "Отметки специалиста"
-    ]
-    ws2.append(h2)
-    style_header(ws2, 1, len(h2))
-    r2 = 2
+    # === СОХРАНЕНИЕ === (папка создана в начале функции)
+    _save_new_workbook(output_path, sheets)
 
-    for key, cd in sorted(grouped_clients.items()):
-        cid = client_id_map.get(key, "")
-        for page in cd["pages"]:
-            if page.get("page_type") == "medical_card_inner":
-                d = page.get("data", {})
-                ws2.append([
-                    cid, cd["name"],
-                    safe_val(d, "complaints"), safe_val(d, "objective_status"),
-                    safe_val(d, "preliminary_diagnosis"),
-                    safe_val(d, "blood_pressure"), safe_val(d, "weight"),
-                    safe_val(d, "dm1"), safe_val(d, "dm2"),
-                    safe_val(d, "chest"), safe_val(d, "waist"), safe_val(d, "hips"),
-                    safe_val(d, "hepatitis_history"),
-                    safe_val(d, "chronic_diseases"),
-                    safe_val(d, "specialist_notes")
-                ])
-                for col in range(1, len(h2) + 1):
-                    style_data_cell(ws2.cell(row=r2, column=col))
-                r2 += 1
-
-    auto_width(ws2)
-    ws2.auto_filter.ref = ws2.dimensions
-
-    # === ЛИСТ 3: ПРОЦЕДУРЫ ===
-    ws3 = wb.create_sheet("Процедуры")
-    h3 = ["ID", "ФИО", "Дата", "Процедура", "Описание", "Стоимость"]
-    ws3.append(h3)
-    style_header(ws3, 1, len(h3))
-    r3 = 2
-
-    for key, cd in sorted(grouped_clients.items()):
-        cid = client_id_map.get(key, "")
-        for page in cd["pages"]:
-            if page.get("page_type") == "procedure_sheet":
-                procs = page.get("data", {}).get("procedures", [])
-                if isinstance(procs, list):
-                    for p in procs:
-                        if isinstance(p, dict):
-                            ws3.append([
-                                cid, cd["name"],
-                                safe_val(p, "date"),
-                                safe_val(p, "procedure_name"),
-                                safe_val(p, "description"),
-                                safe_val(p, "cost")
-                            ])
-                            for col in range(1, len(h3) + 1):
-                                style_data_cell(ws3.cell(row=r3, column=col))
-                            r3 += 1
-
-    auto_width(ws3)
-    ws3.auto_filter.ref = ws3.dimensions
-
-    # === ЛИСТ 4: ПОКУПКИ ===
-    ws4 = wb.create_sheet("Покупки")
-    h4 = ["ID", "ФИО", "Дата", "Консультант", "Наименование", "Цена"]
-    ws4.append(h4)
-    style_header(ws4, 1, len(h4))
-    r4 = 2
-
-    for key, cd in sorted(grouped_clients.items()):
-        cid = client_id_map.get(key, "")
-        for page in cd["pages"]:
-            if page.get("page_type") == "products_list":
-                prods = page.get("data", {}).get("products", [])
-                if isinstance(prods, list):
-                    for p in prods:
-                        if isinstance(p, dict):
-                            ws4.append([
-                                cid, cd["name"],
-                                safe_val(p, "date"),
-                                safe_val(p, "consultant"),
-                                safe_val(p, "product_name"),
-                                safe_val(p, "price")
-                            ])
-                            for col in range(1, len(h4) + 1):
-                                style_data_cell(ws4.cell(row=r4, column=col))
-                            r4 += 1
-
-    auto_width(ws4)
-    ws4.auto_filter.ref = ws4.dimensions
-
-    # === ЛИСТ 5: КОМПЛЕКСЫ ===
-    ws5 = wb.create_sheet("Комплексы")
-    h5 = [
-        "ID", "Пациент", "Контакты", "Врач", "Комплекс",
-        "Дата покупки", "Стоимость", "№", "Процедура",
-        "Дата", "Кол-во", "Комментарий"
-    ]
-    ws5.append(h5)
-    style_header(ws5, 1, len(h5))
-    r5 = 2
-
-    for key, cd in sorted(grouped_clients.items()):
-        cid = client_id_map.get(key, "")
-        for page in cd["pages"]:
-            if page.get("page_type") == "complex_package":
-                d = page.get("data", {})
-                procs = d.get("procedures", [])
-                base = [
-                    cid, safe_val(d, "patient_name"), safe_val(d, "contacts"),
-                    safe_val(d, "doctor"), safe_val(d, "complex_name"),
-                    safe_val(d, "purchase_date"), safe_val(d, "complex_cost")
-                ]
-                if isinstance(procs, list) and procs:
-                    for p in procs:
-                        if isinstance(p, dict):
-                            ws5.append(base + [
-                                safe_val(p, "number"), safe_val(p, "procedure"),
-                                safe_val(p, "date"), safe_val(p, "quantity"),
-                                safe_val(p, "comment")
-                            ])
-                            for col in range(1, len(h5) + 1):
-                                style_data_cell(ws5.cell(row=r5, column=col))
-                            r5 += 1
-                else:
-                    ws5.append(base + ["", "", "", "", ""])
-                    for col in range(1, len(h5) + 1):
-                        style_data_cell(ws5.cell(row=r5, column=col))
-                    r5 += 1
-
-    auto_width(ws5)
-    ws5.auto_filter.ref = ws5.dimensions
-
-    # === ЛИСТ 6: БОТОКС ===
-    ws6 = wb.create_sheet("Ботокс")
-    h6 = [
-        "ID", "ФИО", "Препарат", "Область введения",
-        "Кол-во единиц", "Общая доза", "Дата процедуры", "Дата контроля"
-    ]
-    ws6.append(h6)
-    style_header(ws6, 1, len(h6))
-    r6 = 2
-
-    for key, cd in sorted(grouped_clients.items()):
-        cid = client_id_map.get(key, "")
-        for page in cd["pages"]:
-            if page.get("page_type") == "botox_record":
-                d = page.get("data", {})
-                injs = d.get("injections", [])
-                if isinstance(injs, list):
-                    for inj in injs:
-                        if isinstance(inj, dict):
-                            ws6.append([
-                                cid, cd["name"],
-                                safe_val(inj, "drug"),
-                                safe_val(inj, "injection_area"),
-                                safe_val(inj, "units_count"),
-                                safe_val(inj, "total_dose"),
-                                safe_val(inj, "procedure_date"),
-                                safe_val(inj, "control_date")
-                            ])
-                            for col in range(1, len(h6) + 1):
-                                style_data_cell(ws6.cell(row=r6, column=col))
-                            r6 += 1
-
-    auto_width(ws6)
-    ws6.auto_filter.ref = ws6.dimensions
-
-    # === СОХРАНЕНИЕ ===
-    os.makedirs(os.path.dirname(config.OUTPUT_FILE) or '.', exist_ok=True)
-    wb.save(config.OUTPUT_FILE)
-
-    log.info(f"\nExcel сохранён: {config.OUTPUT_FILE}")
+    log.info(f"\nExcel сохранён: {output_path}")
     log.info(f"\nСтатистика:")
-    log.info(f"  Клиентов: {ws.max_row - 1}")
-    log.info(f"  Мед. записей: {ws2.max_row - 1}")
-    log.info(f"  Процедур: {ws3.max_row - 1}")
-    log.info(f"  Покупок: {ws4.max_row - 1}")
-    log.info(f"  Комплексов: {ws5.max_row - 1}")
-    log.info(f"  Записей ботокса: {ws6.max_row - 1}")
+    log.info(f"  Клиентов: {counts['Клиенты']}")
+    log.info(f"  Мед. записей: {counts['Мед_данные']}")
+    log.info(f"  Процедур: {counts['Процедуры']}")
+    log.info(f"  Покупок: {counts['Покупки']}")
+    log.info(f"  Комплексов: {counts['Комплексы']}")
+    log.info(f"  Записей ботокса: {counts['Ботокс']}")
 
 
 # ============================================================
@@ -2125,9 +2902,7 @@ def main():
     results = process_all_images(vision_client, claude_client)
 
     # Сырые результаты
-    raw_path = os.path.join(os.path.dirname(config.OUTPUT_FILE) or '.', "raw_results.json")
-    with open(raw_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    raw_path = save_raw_results(results)
     log.info(f"\nСырые данные: {raw_path}")
 
     # Группировка
@@ -2,6 +2,7 @@
 Конфигурация для скрипта оцифровки карточек клиентов.
 Заполните свои ключи и пути перед запуском.
 """
+import os
 from pathlib import Path
 
 # Абсолютный путь к папке проекта (работает после переноса каталога)
@@ -19,12 +20,17 @@ GOOGLE_VISION_CREDENTIALS = str(BASE_DIR / "micro-weaver-486910-g5-d70b970e607a.
 ANTHROPIC_API_KEY = "sk-ant-placeholder"
 ANTHROPIC_BASE_URL = "http://localhost:8317"
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
+# Максимальная сторона фото для Claude (px); меньше пикселей — меньше токенов
+CLAUDE_MAX_IMAGE_DIM = 1600
 
 # ============================================================
 # ПУТИ К ФАЙЛАМ
 # ============================================================
 INPUT_FOLDER = str(BASE_DIR / "JPG")
 OUTPUT_FILE = str(BASE_DIR / "clients_database.xlsx")
+# Уровень сжатия ZIP при сохранении книги через openpyxl (0–9, None — по умолчанию zlib).
+# OCR-тексты хорошо сжимаются и на уровне 1, а deflate при этом в разы быстрее
+EXCEL_COMPRESSLEVEL = 1
 CACHE_FOLDER = str(BASE_DIR / "ocr_cache")
 
 # ============================================================
@@ -32,7 +38,14 @@ CACHE_FOLDER = str(BASE_DIR / "ocr_cache")
 # ============================================================
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.heic', '.webp']
 MAX_RETRIES = 3
-API_DELAY = 0.5
+# Не более стольких запросов к Claude в секунду на все потоки (0 — без ограничения)
+API_RPS = 4.0
+# Число параллельных запросов к Claude (пул потоков в process_all_images)
+API_MAX_WORKERS = 8
+# Таймаут ответа Claude, сек (подключение — 5 сек); верификация с 8192 токенами
+# отвечает долго, поэтому запас больше минуты
+CLAUDE_HTTP_TIMEOUT = 300.0
+# Реестр обработанных сбрасывается на диск каждые N карточек
 SAVE_EVERY_N = 10
 
 # ============================================================
@@ -300,21 +313,42 @@ FINAL_VERIFICATION_FALLBACK_ONLY = True
 # Размер батча для финальной верификации (клиентов в одном запросе)
 VERIFICATION_BATCH_SIZE = 10
 
+# Сколько батчей верификации отправлять в Claude параллельно
+# (общий темп всё равно ограничен API_RPS)
+VERIFICATION_MAX_WORKERS = 4
+
+# Отправлять верификацию одним пакетом Message Batches API: вдвое дешевле,
+# но результат приходит асинхронно (минуты–часы). Прокси должен поддерживать
+# /v1/messages/batches; если пакет создать не удалось — обычные запросы.
+USE_MESSAGE_BATCHES_API = False
+# Как часто опрашивать статус пакета, сек
+MESSAGE_BATCHES_POLL_SECONDS = 30
+# Сколько ждать пакет, сек; по истечении он отменяется, клиенты — «Ошибка верификации»
+MESSAGE_BATCHES_TIMEOUT = 3600
+
 # Порог уверенности Claude для автоподтверждения (0-100)
 # Клиенты с score >= порога помечаются как "Подтверждён"
 CLAUDE_CONFIDENCE_THRESHOLD = 90
 
+# Совпадение сверки (%), начиная с которого найденный в БД клиент подтверждается
+# без запроса к Claude (None — проверять всех). Важно при FALLBACK_ONLY = False
+AUTO_CONFIRM_THRESHOLD = 95
+
 # Файл отчёта финальной верификации
 FINAL_VERIFICATION_REPORT = "final_verification_report.xlsx"
 
+# Итоговый комбинированный отчёт пайплайна (PIPELINE_REPORT_FILE в окружении — другой путь)
+PIPELINE_REPORT_FILE = os.environ.get("PIPELINE_REPORT_FILE") or str(BASE_DIR / "pipeline_report.xlsx")
+
 # Максимальное количество возможных совпадений для ненайденных клиентов
 MAX_POSSIBLE_MATCHES = 3
 
 # ============================================================
 # ЛОГИРОВАНИЕ
 # ============================================================
-# Папка для логов (каждый день — новый файл, старые сохраняются)
-LOG_FOLDER = str(BASE_DIR / "ocr_logs")
+# Папка для логов (каждый день — новый файл, старые сохраняются).
+# OCR_LOG_FOLDER в окружении — другая папка (тесты пишут во временную)
+LOG_FOLDER = os.environ.get("OCR_LOG_FOLDER") or str(BASE_DIR / "ocr_logs")
 
 # Уровень логирования: DEBUG (всё), INFO (основное), WARNING (только проблемы)
 LOG_LEVEL = "DEBUG"
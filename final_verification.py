@@ -16,7 +16,10 @@
     - final_verification_report.xlsx — отчёт с рекомендациями
 """
 
+import heapq
 import logging
+import sys
+import time
 import pandas as pd
 import json
 from typing import Dict, List, Tuple, Optional
@@ -24,9 +27,46 @@ from datetime import datetime
 from pathlib import Path
 
 import anthropic
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 log = logging.getLogger('pipeline')
 
+# Статусы Claude (final_status). sys.intern: во всех ячейках колонки
+# Claude_Статус лежит один и тот же объект строки, и сравнение со
+# статусом в фильтрах отчёта срабатывает по совпадению указателей
+_STATUS_CONFIRMED = sys.intern('Подтверждён')
+_STATUS_NEEDS_REVIEW = sys.intern('Требует проверки')
+_STATUS_POSSIBLE_DUPLICATE = sys.intern('Возможный дубль')
+_STATUS_NOT_FOUND = sys.intern('Не найден')
+_STATUS_ERROR = sys.intern('Ошибка верификации')
+_CLAUDE_STATUSES = {
+    status: status for status in (
+        _STATUS_CONFIRMED, _STATUS_NEEDS_REVIEW, _STATUS_POSSIBLE_DUPLICATE,
+        _STATUS_NOT_FOUND, _STATUS_ERROR,
+    )
+}
+# Категории колонки Claude_Статус: '' — клиент не проверялся Claude.
+# Нестандартные статусы из ответа дописываются в конец при сборке колонки
+_CLAUDE_STATUS_CATEGORIES = ('', *_CLAUDE_STATUSES)
+
+
+def _dumps_compact(obj) -> str:
+    """
+    JSON для промпта без отступов и пробелов: orjson (если установлен) или json.
+    Отступы не помогают модели, но оплачиваются как входные токены.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
 # ============================================================
 # СИСТЕМНЫЙ ПРОМПТ ДЛЯ CLAUDE
 # ============================================================
@@ -135,17 +175,25 @@ def run_final_claude_verification(
     confidence_threshold = getattr(config, 'CLAUDE_CONFIDENCE_THRESHOLD', 90)
     max_possible_matches = getattr(config, 'MAX_POSSIBLE_MATCHES', 3)
 
+    # Уверенные совпадения сверки подтверждаются без Claude
+    auto_mask = auto_confirm_mask(verification_df, config)
+    needs_claude = verification_df[~auto_mask]
+    if auto_mask.any():
+        log.info(f"  Автоподтверждено без Claude: {int(auto_mask.sum())} "
+                 f"(совпадение ≥ {getattr(config, 'AUTO_CONFIRM_THRESHOLD', 95)}%)")
+
     # Батчинг верификации
     results = batch_verify_clients(
         log=log,
         config=config,
         claude_client=claude_client,
-        verification_df=verification_df,
+        verification_df=needs_claude,
         ocr_sheets=ocr_sheets,
         db_index=db_index,
         batch_size=batch_size,
         max_possible_matches=max_possible_matches
-    )
+    ) if len(needs_claude) else []
+    results.extend(auto_confirmed_results(verification_df[auto_mask]))
 
     # Обогащаем verification_df новыми полями
     enhanced_df = enhance_verification_df(verification_df, results)
@@ -157,11 +205,12 @@ def run_final_claude_verification(
 
     generate_final_verification_report(enhanced_df, report_path, log)
 
-    # Статистика
-    confirmed = len(enhanced_df[enhanced_df['Claude_Статус'] == 'Подтверждён'])
-    needs_review = len(enhanced_df[enhanced_df['Claude_Статус'] == 'Требует проверки'])
-    possible_dupes = len(enhanced_df[enhanced_df['Claude_Статус'] == 'Возможный дубль'])
-    not_found = len(enhanced_df[enhanced_df['Claude_Статус'] == 'Не найден'])
+    # Статистика — один value_counts вместо маски на каждый статус
+    status_counts = enhanced_df['Claude_Статус'].value_counts()
+    confirmed = int(status_counts.get(_STATUS_CONFIRMED, 0))
+    needs_review = int(status_counts.get(_STATUS_NEEDS_REVIEW, 0))
+    possible_dupes = int(status_counts.get(_STATUS_POSSIBLE_DUPLICATE, 0))
+    not_found = int(status_counts.get(_STATUS_NOT_FOUND, 0))
 
     log.info(f"  Подтверждено: {confirmed}, Требует проверки: {needs_review}, "
              f"Возможные дубли: {possible_dupes}, Не найдено: {not_found}")
@@ -169,115 +218,204 @@ def run_final_claude_verification(
     return enhanced_df, report_path
 
 
+def auto_confirm_mask(verification_df: pd.DataFrame, config) -> pd.Series:
+    """
+    Строки, которые не нужно отправлять Claude: сверка нашла клиента
+    в БД («Найден в БД» / «Найден») с совпадением ≥ AUTO_CONFIRM_THRESHOLD.
+    AUTO_CONFIRM_THRESHOLD = None — все строки идут в Claude.
+
+    Returns:
+        Булева маска по verification_df
+    """
+    threshold = getattr(config, 'AUTO_CONFIRM_THRESHOLD', 95)
+    status_col = 'Статус_БД' if 'Статус_БД' in verification_df.columns else 'Статус'
+    if (threshold is None or status_col not in verification_df.columns
+            or 'Совпадение_%' not in verification_df.columns):
+        return pd.Series(False, index=verification_df.index)
+
+    found = verification_df[status_col].isin(
+        [getattr(config, 'STATUS_DB_FOUND', 'Найден в БД'), 'Найден']
+    )
+    score = pd.to_numeric(verification_df['Совпадение_%'], errors='coerce')
+    return found & (score >= threshold)
+
+
+def auto_confirmed_results(confirmed_df: pd.DataFrame) -> List[dict]:
+    """
+    Результаты в формате ответа Claude для автоподтверждённых строк:
+    статус «Подтверждён», уверенность — процент совпадения сверки.
+    """
+    return [
+        {
+            'client_id': str(idx),
+            'final_status': _STATUS_CONFIRMED,
+            'confidence_score': score,
+            'possible_matches': [],
+            'discrepancies': [],
+            'ocr_corrections': {},
+            'recommendations': []
+        }
+        for idx, score in zip(confirmed_df.index, confirmed_df['Совпадение_%'].tolist())
+    ]
+
+
 # ============================================================
 # ПОДГОТОВКА КОНТЕКСТА
 # ============================================================
 
-def prepare_client_context(
-    row: pd.Series,
-    row_index: int,
-    ocr_sheets: dict,
-    db_index: dict
-) -> dict:
+def _is_missing(val) -> bool:
+    """Пропуск (None/NaN/NA/NaT) — без диспетчеризации pd.isna на каждое значение."""
+    return val is None or val is pd.NA or val is pd.NaT or (isinstance(val, float) and val != val)
+
+
+def _to_int(val) -> int:
+    try:
+        return int(val)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def _to_float(val) -> float:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _safe_str(val) -> str:
+    return "" if _is_missing(val) else str(val)
+
+
+def _safe_int(val) -> int:
+    return 0 if _is_missing(val) else _to_int(val)
+
+
+def _safe_float(val) -> float:
+    return 0.0 if _is_missing(val) else _to_float(val)
+
+
+# Сколько клиентов БД отправлять Claude для поиска альтернативных совпадений
+# (чтобы не превысить лимит токенов)
+DB_SAMPLE_LIMIT = 200
+
+
+def prepare_db_sample(db_index: dict, limit: int = DB_SAMPLE_LIMIT) -> list:
     """
-    Подготовка контекста клиента для отправки в Claude.
+    Выборка клиентов БД для поиска альтернативных совпадений.
+    Не зависит от батча — собирается один раз на всю верификацию.
 
-    Args:
-        row: Строка из verification_df
-        row_index: Индекс строки (используется как ID)
-        ocr_sheets: Данные OCR
-        db_index: Индекс БД
+    Берутся самые частые клиенты (по total_visits): порядок db_index
+    ничего не говорит о релевантности, а постоянные клиенты — наиболее
+    вероятные совпадения. При равном числе визитов — порядок db_index.
 
     Returns:
-        Словарь с контекстом клиента
+        Список limit клиентов {fio, phone, visits, doctors}
     """
-    # Безопасное получение значений
-    def safe_str(val):
-        if pd.isna(val):
-            return ""
-        return str(val)
+    # nlargest — частичная сортировка O(n log limit) вместо сортировки всей БД
+    top_clients = heapq.nlargest(
+        limit, db_index.values(), key=lambda c: c.get('total_visits', 0) or 0
+    )
+    return [
+        {
+            'fio': client_data.get('name_orig', ''),
+            'phone': client_data.get('phone', ''),
+            'visits': client_data.get('total_visits', 0),
+            'doctors': ', '.join(client_data.get('doctors', [])[:3])
+        }
+        for client_data in top_clients
+    ]
 
-    def safe_int(val):
-        if pd.isna(val):
-            return 0
-        try:
-            return int(val)
-        except:
-            return 0
 
-    def safe_float(val):
-        if pd.isna(val):
-            return 0.0
-        try:
-            return float(val)
-        except:
-            return 0.0
-
-    context = {
-        'client_id': str(row_index),
-        'ocr_data': {
-            'fio': safe_str(row.get('OCR_ФИО', '')),
-            'phone': safe_str(row.get('OCR_Телефон', '')),
-        },
-        'db_data': {
-            'fio': safe_str(row.get('БД_ФИО', '')),
-            'phone': safe_str(row.get('БД_Телефон', '')),
-            'visits_count': safe_int(row.get('Визитов_в_БД', 0)),
-            'doctors': safe_str(row.get('Врачи_в_БД', '')),
-        },
-        'match_info': {
-            'status': safe_str(row.get('Статус', '')),
-            'score': safe_float(row.get('Совпадение_%', 0))
-        }
-    }
+def _batch_client_contexts(batch_df: pd.DataFrame) -> list:
+    """
+    Контекст клиентов батча для отправки в Claude: client_id — оригинальный
+    индекс строки, данные OCR, данные БД и результат сверки.
 
-    return context
+    Без iterrows (Series на каждую строку): колонки берутся списками целиком,
+    пропуски (NaN/None/NA) заменяются на None одной операцией на колонку.
+    """
+    def column(name):
+        if name not in batch_df.columns:
+            return [None] * len(batch_df)
+        values = batch_df[name]
+        return values.astype(object).where(values.notna(), None).tolist()
+
+    return [
+        {
+            'client_id': str(idx),
+            'ocr_data': {
+                'fio': _safe_str(ocr_fio),
+                'phone': _safe_str(ocr_phone),
+            },
+            'db_data': {
+                'fio': _safe_str(db_fio),
+                'phone': _safe_str(db_phone),
+                'visits_count': _safe_int(visits),
+                'doctors': _safe_str(doctors),
+            },
+            'match_info': {
+                'status': _safe_str(status),
+                'score': _safe_float(score)
+            }
+        }
+        for idx, ocr_fio, ocr_phone, db_fio, db_phone, visits, doctors, status, score in zip(
+            batch_df.index,
+            column('OCR_ФИО'), column('OCR_Телефон'),
+            column('БД_ФИО'), column('БД_Телефон'),
+            column('Визитов_в_БД'), column('Врачи_в_БД'),
+            column('Статус'), column('Совпадение_%'),
+        )
+    ]
 
 
 def prepare_batch_data(
     batch_df: pd.DataFrame,
-    ocr_sheets: dict,
     db_index: dict,
-    max_possible_matches: int = 3
+    max_possible_matches: int = 3,
+    include_db_sample: bool = True
 ) -> str:
     """
     Подготовка данных батча для отправки в Claude.
 
     Args:
         batch_df: DataFrame с батчем клиентов
-        ocr_sheets: Данные OCR
         db_index: Индекс БД
         max_possible_matches: Максимум альтернативных совпадений
+        include_db_sample: Добавить выборку БД в JSON батча
+            (False — она уже передана в системном промпте, см. build_verification_system)
 
     Returns:
         Строка JSON с данными батча
     """
-    batch_contexts = []
+    batch_data = {'clients': _batch_client_contexts(batch_df)}
+    if include_db_sample:
+        # Добавляем список клиентов из БД (для поиска альтернативных совпадений)
+        batch_data['db_clients_sample'] = prepare_db_sample(db_index)
+    batch_data['max_possible_matches'] = max_possible_matches
 
-    for idx, row in batch_df.iterrows():
-        context = prepare_client_context(row, idx, ocr_sheets, db_index)
-        batch_contexts.append(context)
+    return _dumps_compact(batch_data)
 
-    # Добавляем список всех клиентов из БД (для поиска альтернативных совпадений)
-    db_clients_list = []
-    for db_name, client_data in db_index.items():
-        db_clients_list.append({
-            'fio': client_data.get('name_orig', ''),
-            'phone': client_data.get('phone', ''),
-            'visits': client_data.get('total_visits', 0),
-            'doctors': ', '.join(client_data.get('doctors', [])[:3])
-        })
 
-    # Ограничиваем список БД (чтобы не превысить лимит токенов)
-    db_clients_list = db_clients_list[:200]  # Топ-200 клиентов
+def build_verification_system(db_index: dict) -> list:
+    """
+    Системный промпт верификации: инструкция + выборка БД.
 
-    batch_data = {
-        'clients': batch_contexts,
-        'db_clients_sample': db_clients_list,
-        'max_possible_matches': max_possible_matches
-    }
+    Выборка БД одинакова для всех батчей, поэтому сериализуется один раз и
+    помечается cache_control: Anthropic кэширует префикс промпта, и
+    повторные батчи не оплачивают эти токены заново.
 
-    return json.dumps(batch_data, ensure_ascii=False, indent=2)
+    Returns:
+        Список текстовых блоков для параметра system
+    """
+    db_sample_json = _dumps_compact({'db_clients_sample': prepare_db_sample(db_index)})
+    return [
+        {"type": "text", "text": CLAUDE_VERIFICATION_PROMPT},
+        {
+            "type": "text",
+            "text": f"Клиенты из БД для поиска возможных совпадений:\n\n{db_sample_json}",
+            "cache_control": {"type": "ephemeral"},
+        },
+    ]
 
 
 # ============================================================
@@ -302,7 +440,7 @@ def batch_verify_clients(
         config: Конфигурация
         claude_client: Клиент Claude
         verification_df: DataFrame с результатами сверки
-        ocr_sheets: Данные OCR
+        ocr_sheets: Данные OCR (не используются: контекст клиента — из verification_df)
         db_index: Индекс БД
         batch_size: Размер батча
         max_possible_matches: Максимум альтернативных совпадений
@@ -310,57 +448,234 @@ def batch_verify_clients(
     Returns:
         Список результатов верификации
     """
-    all_results = []
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.rate_limit import RateLimiter
+
     total_batches = (len(verification_df) + batch_size - 1) // batch_size
+    max_workers = max(1, getattr(config, 'VERIFICATION_MAX_WORKERS', 4))
+
+    log.info(f"  Обработка {len(verification_df)} клиентов батчами по {batch_size} "
+             f"({min(max_workers, total_batches or 1)} параллельно)...")
+
+    # Запросы упираются в сеть, а не в CPU: батчи идут в пуле потоков,
+    # темп задаёт общий token bucket (как в process_all_images)
+    limiter = RateLimiter(getattr(config, 'API_RPS', 0))
+    # Выборка БД общая для всех батчей — один раз в системный промпт
+    system = build_verification_system(db_index)
+    batches = [
+        (i // batch_size + 1, verification_df.iloc[i:i + batch_size])
+        for i in range(0, len(verification_df), batch_size)
+    ]
+
+    if getattr(config, 'USE_MESSAGE_BATCHES_API', False):
+        try:
+            return _verify_with_message_batches(
+                log, config, claude_client, batches, db_index,
+                max_possible_matches, system
+            )
+        except anthropic.APIError as e:
+            # Пакет не создан (прокси без /v1/messages/batches и т.п.) — обычные запросы
+            log.warning(f"  ⚠ Message Batches API недоступен ({e}), обычные запросы...")
 
-    log.info(f"  Обработка {len(verification_df)} клиентов батчами по {batch_size}...")
+    def verify(batch):
+        batch_num, batch_df = batch
+        return _verify_one_batch(
+            log, config, claude_client, batch_df, db_index,
+            max_possible_matches, batch_num, total_batches, limiter, system
+        )
 
-    for i in range(0, len(verification_df), batch_size):
-        batch_df = verification_df.iloc[i:i+batch_size]
-        batch_num = (i // batch_size) + 1
+    all_results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # map отдаёт результаты в порядке батчей, как при последовательной обработке
+        for batch_results in pool.map(verify, batches):
+            all_results.extend(batch_results)
 
-        log.info(f"  Батч {batch_num}/{total_batches} ({len(batch_df)} клиентов)...")
+    return all_results
 
-        # Подготовка данных батча
-        batch_data_str = prepare_batch_data(batch_df, ocr_sheets, db_index, max_possible_matches)
 
-        # Отправка в Claude
-        try:
-            user_message = f"""Проверь этих {len(batch_df)} клиентов:
+def _verify_with_message_batches(
+    log,
+    config,
+    claude_client: anthropic.Anthropic,
+    batches: list,
+    db_index: dict,
+    max_possible_matches: int,
+    system
+) -> List[dict]:
+    """
+    Все батчи одним пакетом Message Batches API: вдвое дешевле обычных
+    запросов, без лимита на частоту, но ответ приходит асинхронно —
+    пакет опрашивается раз в MESSAGE_BATCHES_POLL_SECONDS.
+
+    Батчи без успешного ответа (ошибка, истёк срок, отменены по
+    MESSAGE_BATCHES_TIMEOUT) — «Ошибка верификации», как при сбое запроса;
+    ответы, готовые до отмены, используются.
+
+    Raises:
+        anthropic.APIError: только если пакет не удалось создать.
+    """
+    requests = [
+        {
+            "custom_id": f"batch_{batch_num}",
+            "params": {
+                "model": config.CLAUDE_MODEL,
+                "max_tokens": 8192,
+                "system": system,
+                "messages": [{
+                    "role": "user",
+                    "content": _batch_user_message(
+                        batch_df, db_index, max_possible_matches, system
+                    )
+                }]
+            }
+        }
+        for batch_num, batch_df in batches
+    ]
+    job = claude_client.messages.batches.create(requests=requests)
+    log.info(f"  Пакет {job.id}: {len(requests)} батчей отправлено, ожидание результатов...")
+
+    # Пакет уже создан и оплачивается: дальнейшие ошибки не переводят
+    # на обычные запросы (двойная оплата), а дают «Ошибка верификации»
+    responses = {}
+    try:
+        poll_seconds = getattr(config, 'MESSAGE_BATCHES_POLL_SECONDS', 30)
+        deadline = time.monotonic() + getattr(config, 'MESSAGE_BATCHES_TIMEOUT', 3600)
+        canceled = False
+        while job.processing_status != "ended":
+            if not canceled and time.monotonic() >= deadline:
+                # Отмена не мгновенна: пакет доходит до ended, уже готовые
+                # (и оплаченные) ответы остаются в results()
+                log.error(f"  Пакет {job.id} не завершился за отведённое время — отменяю")
+                claude_client.messages.batches.cancel(job.id)
+                canceled = True
+            else:
+                time.sleep(poll_seconds)
+            job = claude_client.messages.batches.retrieve(job.id)
+
+        for item in claude_client.messages.batches.results(job.id):
+            if item.result.type == "succeeded":
+                responses[item.custom_id] = item.result.message
+            else:
+                log.error(f"  Батч {item.custom_id}: {item.result.type}")
+    except anthropic.APIError as e:
+        log.error(f"  Ошибка при получении результатов пакета {job.id}: {e}")
+
+    # Порядок результатов — по номерам батчей, а не по порядку ответов пакета
+    all_results = []
+    for batch_num, batch_df in batches:
+        response = responses.get(f"batch_{batch_num}")
+        if response is None:
+            all_results.extend(_failed_batch_results(batch_df))
+        else:
+            all_results.extend(parse_claude_batch_response(response, log))
+    return all_results
+
+
+def _batch_user_message(
+    batch_df: pd.DataFrame,
+    db_index: dict,
+    max_possible_matches: int,
+    system=None
+) -> str:
+    """Текст запроса к Claude для батча клиентов."""
+    batch_data_str = prepare_batch_data(batch_df, db_index, max_possible_matches,
+                                        include_db_sample=system is None)
+    return f"""Проверь этих {len(batch_df)} клиентов:
 
 {batch_data_str}
 
 ВАЖНО: Ответь ТОЛЬКО валидным JSON в формате из системного промпта. Не добавляй никаких пояснений, markdown, или других символов. Начни ответ сразу с {{"""
 
+
+def _failed_batch_results(batch_df: pd.DataFrame) -> List[dict]:
+    """Пустые результаты «Ошибка верификации» для всех клиентов батча."""
+    return [
+        {
+            'client_id': str(idx),
+            'final_status': _STATUS_ERROR,
+            'confidence_score': 0,
+            'possible_matches': [],
+            'discrepancies': [],
+            'ocr_corrections': {},
+            'recommendations': ['Верификация не выполнена из-за ошибки API']
+        }
+        for idx in batch_df.index
+    ]
+
+
+def _verify_one_batch(
+    log,
+    config,
+    claude_client: anthropic.Anthropic,
+    batch_df: pd.DataFrame,
+    db_index: dict,
+    max_possible_matches: int,
+    batch_num: int,
+    total_batches: int,
+    limiter=None,
+    system=None
+) -> List[dict]:
+    """
+    Один запрос к Claude для батча клиентов (выполняется в пуле потоков).
+
+    Отказ по лимиту (429/529) снижает темп limiter и ставит паузу Retry-After
+    всем потокам, затем запрос повторяется (до config.MAX_RETRIES раз).
+    Прочие ошибки — пустые результаты «Ошибка верификации», как раньше.
+    system — блоки build_verification_system (выборка БД уже в них);
+    None — выборка БД отправляется в JSON батча.
+
+    Returns:
+        Список результатов верификации для клиентов батча
+    """
+    from utils.rate_limit import rate_limit_delay
+
+    log.info(f"  Батч {batch_num}/{total_batches} ({len(batch_df)} клиентов)...")
+
+    # Подготовка данных батча
+    user_message = _batch_user_message(batch_df, db_index, max_possible_matches, system)
+
+    max_retries = getattr(config, 'MAX_RETRIES', 3)
+    for attempt in range(max_retries + 1):
+        # Отправка в Claude
+        try:
+            if limiter is not None:
+                limiter.acquire()
             response = claude_client.messages.create(
                 model=config.CLAUDE_MODEL,
                 max_tokens=8192,
-                system=CLAUDE_VERIFICATION_PROMPT,
+                system=system or CLAUDE_VERIFICATION_PROMPT,
                 messages=[{
                     "role": "user",
                     "content": user_message
                 }]
             )
+            if limiter is not None:
+                limiter.speed_up()
 
             # Парсинг ответа
-            batch_results = parse_claude_batch_response(response, log)
-            all_results.extend(batch_results)
+            return parse_claude_batch_response(response, log)
 
         except Exception as e:
+            limited = rate_limit_delay(e)
+            if limited is not None and attempt < max_retries:
+                wait = max(2 ** (attempt + 1), limited)
+                log.warning(f"  ⚠ Батч {batch_num}: лимит API, повтор через {wait}с "
+                            f"({attempt + 1}/{max_retries})")
+                if limiter is not None:
+                    limiter.slow_down()
+                    # Паузу выдерживают все потоки, а не только этот
+                    limiter.pause(wait)
+                else:
+                    time.sleep(wait)
+                continue
+
             log.error(f"  Ошибка при обработке батча {batch_num}: {e}")
             # Добавляем пустые результаты для клиентов из батча
-            for idx, row in batch_df.iterrows():
-                all_results.append({
-                    'client_id': str(idx),
-                    'final_status': 'Ошибка верификации',
-                    'confidence_score': 0,
-                    'possible_matches': [],
-                    'discrepancies': [],
-                    'ocr_corrections': {},
-                    'recommendations': ['Верификация не выполнена из-за ошибки API']
-                })
+            return _failed_batch_results(batch_df)
 
-    return all_results
+
+# Разбор JSON из ответа Claude (raw_decode — объект без окружающего текста)
+_JSON_DECODER = json.JSONDecoder()
 
 
 def parse_claude_batch_response(
@@ -381,37 +696,16 @@ def parse_claude_batch_response(
         # Извлекаем текст ответа
         response_text = response.content[0].text.strip()
 
-        # Убираем markdown обёртки если есть
-        if response_text.startswith('```'):
-            # Ищем JSON между ``` блоками
-            lines = response_text.split('\n')
-            json_lines = []
-            in_json = False
-            for line in lines:
-                if line.strip().startswith('```'):
-                    if not in_json:
-                        in_json = True
-                        continue
-                    else:
-                        break
-                if in_json:
-                    json_lines.append(line)
-            response_text = '\n'.join(json_lines)
-
-        # Пытаемся найти JSON объект в тексте
-        # Ищем первый { и последний }
+        # JSON-объект начинается с первой «{»: markdown-обёртка ```json до неё
+        # и любой текст после объекта (закрывающие ```) raw_decode не трогает
         start_idx = response_text.find('{')
-        end_idx = response_text.rfind('}')
-
-        if start_idx == -1 or end_idx == -1:
+        if start_idx == -1:
             log.error(f"  Не найден JSON объект в ответе Claude")
             log.error(f"  Ответ: {response_text[:500]}")
             return []
 
-        json_text = response_text[start_idx:end_idx+1]
-
-        # Пытаемся распарсить JSON
-        parsed = json.loads(json_text)
+        # Разбираем ровно один объект за один проход, без вырезания подстроки
+        parsed, _ = _JSON_DECODER.raw_decode(response_text, start_idx)
 
         # Поддерживаем разные варианты структуры ответа
         if 'clients' in parsed:
@@ -428,25 +722,27 @@ def parse_claude_batch_response(
             log.warning(f"  Ключи в ответе: {list(parsed.keys())}")
             return []
 
-        # Нормализуем результаты к ожидаемому формату
+        # Нормализуем результаты к ожидаемому формату. Тексты для колонок
+        # отчёта собираются сразу, пока ответ разбирается по клиентам
         normalized_results = []
         for result in results:
             normalized = {
                 'client_id': result.get('client_id', ''),
-                'final_status': result.get('final_status') or result.get('status', 'Не найден'),
+                'final_status': result.get('final_status') or result.get('status', _STATUS_NOT_FOUND),
                 'confidence_score': result.get('confidence_score') or result.get('confidence', 0),
                 'possible_matches': result.get('possible_matches', []),
                 'discrepancies': result.get('discrepancies', []),
                 'ocr_corrections': result.get('ocr_corrections', {}),
                 'recommendations': result.get('recommendations') or result.get('recommended_actions', [])
             }
+            normalized.update(zip(_RESULT_TEXT_KEYS, _format_result_texts(normalized)))
             normalized_results.append(normalized)
 
         return normalized_results
 
     except json.JSONDecodeError as e:
         log.error(f"  Ошибка парсинга JSON от Claude: {e}")
-        log.error(f"  Попытка распарсить: {json_text[:500] if 'json_text' in locals() else response_text[:500]}")
+        log.error(f"  Попытка распарсить: {response_text[start_idx:start_idx + 500]}")
         return []
     except Exception as e:
         log.error(f"  Ошибка обработки ответа Claude: {e}")
@@ -457,6 +753,69 @@ def parse_claude_batch_response(
 # ОБОГАЩЕНИЕ VERIFICATION_DF
 # ============================================================
 
+# Ключи готовых текстов в результате: совпадения, расхождения, рекомендации, исправления
+_RESULT_TEXT_KEYS = ('_matches_text', '_disc_text', '_rec_text', '_corr_text')
+
+
+def _format_result_texts(result: dict) -> Tuple[str, str, str, str]:
+    """Тексты колонок Возможные_совпадения_БД / Расхождения / Рекомендации / Исправления_OCR."""
+    matches_text = disc_text = rec_text = corr_text = ''
+
+    # Возможные совпадения
+    possible_matches = result.get('possible_matches', [])
+    if possible_matches and isinstance(possible_matches, list):
+        matches_text = '; '.join([
+            f"{m.get('db_name', '')} ({m.get('score', 0)}%) - {m.get('match_reason', '')}"
+            for m in possible_matches
+            if isinstance(m, dict)
+        ])
+
+    # Расхождения
+    discrepancies = result.get('discrepancies', [])
+    if discrepancies and isinstance(discrepancies, list):
+        disc_text = '; '.join([
+            f"{d.get('field', '')}: OCR={d.get('ocr_value', '')} vs БД={d.get('db_value', '')} ({d.get('explanation', '')})"
+            for d in discrepancies
+            if isinstance(d, dict)
+        ])
+
+    # Рекомендации
+    recommendations = result.get('recommendations', [])
+    if recommendations and isinstance(recommendations, list):
+        rec_text = '; '.join([
+            str(r) for r in recommendations
+        ])
+
+    # Исправления OCR
+    corrections = result.get('ocr_corrections', {})
+    if corrections and isinstance(corrections, dict):
+        corr_text = '; '.join([
+            f"{field}: {value}"
+            for field, value in corrections.items()
+            if value
+        ])
+
+    return matches_text, disc_text, rec_text, corr_text
+
+
+def _result_texts(result: dict) -> Tuple[str, str, str, str]:
+    """Готовые тексты из parse_claude_batch_response, иначе — собранные по результату."""
+    if _RESULT_TEXT_KEYS[0] in result:
+        return tuple(result[key] for key in _RESULT_TEXT_KEYS)
+    return _format_result_texts(result)
+
+
+def _status_categorical(status_list: List[Optional[str]]) -> pd.Categorical:
+    """
+    Колонка Claude_Статус как Categorical: код int8 на строку вместо объекта,
+    сравнение со статусом — по кодам. Статусы вне словаря не теряются (не NaN),
+    а добавляются категориями после стандартных.
+    """
+    known = set(_CLAUDE_STATUS_CATEGORIES)
+    extra = [s for s in dict.fromkeys(status_list) if s is not None and s not in known]
+    return pd.Categorical(status_list, categories=[*_CLAUDE_STATUS_CATEGORIES, *extra])
+
+
 def enhance_verification_df(
     verification_df: pd.DataFrame,
     claude_results: List[dict]
@@ -474,68 +833,54 @@ def enhance_verification_df(
     # Создаём копию БЕЗ reset_index - сохраняем оригинальные индексы!
     enhanced_df = verification_df.copy()
 
-    # Создаём маппинг client_id (оригинальный индекс) -> результат
-    results_map = {}
-    for result in claude_results:
-        client_id_str = result.get('client_id', '')
-        if client_id_str and client_id_str.isdigit():
-            results_map[int(client_id_str)] = result
-
-    # Добавляем новые колонки
-    enhanced_df['Claude_Статус'] = ''
-    enhanced_df['Claude_Совпадение_%'] = 0.0
-    enhanced_df['Возможные_совпадения_БД'] = ''
-    enhanced_df['Расхождения'] = ''
-    enhanced_df['Рекомендации'] = ''
-    enhanced_df['Исправления_OCR'] = ''
-
-    # Заполняем данные по ОРИГИНАЛЬНЫМ индексам
-    for idx in enhanced_df.index:
-        if idx in results_map:
-            result = results_map[idx]
-
-            # Статус
-            enhanced_df.at[idx, 'Claude_Статус'] = result.get('final_status', '')
-
-            # Оценка совпадения
-            enhanced_df.at[idx, 'Claude_Совпадение_%'] = result.get('confidence_score', 0)
-
-            # Возможные совпадения
-            possible_matches = result.get('possible_matches', [])
-            if possible_matches and isinstance(possible_matches, list):
-                matches_text = '; '.join([
-                    f"{m.get('db_name', '')} ({m.get('score', 0)}%) - {m.get('match_reason', '')}"
-                    for m in possible_matches
-                    if isinstance(m, dict)
-                ])
-                enhanced_df.at[idx, 'Возможные_совпадения_БД'] = matches_text
-
-            # Расхождения
-            discrepancies = result.get('discrepancies', [])
-            if discrepancies and isinstance(discrepancies, list):
-                disc_text = '; '.join([
-                    f"{d.get('field', '')}: OCR={d.get('ocr_value', '')} vs БД={d.get('db_value', '')} ({d.get('explanation', '')})"
-                    for d in discrepancies
-                    if isinstance(d, dict)
-                ])
-                enhanced_df.at[idx, 'Расхождения'] = disc_text
-
-            # Рекомендации
-            recommendations = result.get('recommendations', [])
-            if recommendations and isinstance(recommendations, list):
-                enhanced_df.at[idx, 'Рекомендации'] = '; '.join([
-                    str(r) for r in recommendations
-                ])
-
-            # Исправления OCR
-            corrections = result.get('ocr_corrections', {})
-            if corrections and isinstance(corrections, dict):
-                corr_text = '; '.join([
-                    f"{field}: {value}"
-                    for field, value in corrections.items()
-                    if value
-                ])
-                enhanced_df.at[idx, 'Исправления_OCR'] = corr_text
+    # Создаём маппинг client_id (оригинальный индекс) -> результат.
+    # str() — Claude иногда возвращает client_id числом; isdecimal — ровно то, что примет int()
+    results_map = {
+        int(client_id): result
+        for result in claude_results
+        if (client_id := str(result.get('client_id', ''))).isdecimal()
+    }
+
+    # Значения новых колонок собираются в списки за один проход по индексам
+    # и присваиваются целыми колонками — без .at на каждую ячейку
+    n = len(enhanced_df)
+    status_list = [''] * n
+    score_list = [0.0] * n
+    matches_list = [''] * n
+    disc_list = [''] * n
+    rec_list = [''] * n
+    corr_list = [''] * n
+
+    # Заполняем данные по ОРИГИНАЛЬНЫМ индексам — только строки, для которых
+    # есть ответ Claude (isin — проверка по всему индексу за один вызов)
+    index = enhanced_df.index
+    for pos in index.isin(list(results_map)).nonzero()[0]:
+        result = results_map[index[pos]]
+
+        # Статус — известные статусы заменяются общим интернированным объектом
+        status = result.get('final_status', '')
+        if isinstance(status, str):
+            status_list[pos] = _CLAUDE_STATUSES.get(status, status)
+        else:
+            status_list[pos] = None if status is None else str(status)
+
+        # Оценка совпадения
+        score_list[pos] = result.get('confidence_score', 0)
+
+        # Тексты совпадений/расхождений/рекомендаций/исправлений — готовые
+        # строки из parse_claude_batch_response (или собираются здесь)
+        (matches_list[pos], disc_list[pos],
+         rec_list[pos], corr_list[pos]) = _result_texts(result)
+
+    # Добавляем новые колонки. Для пустого DataFrame — скалярами:
+    # пустой список дал бы колонкам другой dtype
+    enhanced_df['Claude_Статус'] = _status_categorical(status_list)
+    # dtype=float — колонка float64, даже если Claude вернул целые оценки
+    enhanced_df['Claude_Совпадение_%'] = pd.Series(score_list, index=enhanced_df.index, dtype=float)
+    enhanced_df['Возможные_совпадения_БД'] = matches_list if n else ''
+    enhanced_df['Расхождения'] = disc_list if n else ''
+    enhanced_df['Рекомендации'] = rec_list if n else ''
+    enhanced_df['Исправления_OCR'] = corr_list if n else ''
 
     return enhanced_df
 
@@ -544,6 +889,34 @@ def enhance_verification_df(
 # ГЕНЕРАЦИЯ ОТЧЁТА
 # ============================================================
 
+# Стиль заголовка как у DataFrame.to_excel: жирный, по центру, тонкая рамка
+_HEADER_FONT = Font(bold=True)
+_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+_HEADER_BORDER = Border(*(Side(style='thin'),) * 4)
+
+
+def _write_df_sheet(wb: Workbook, sheet_name: str, df: pd.DataFrame):
+    """
+    Пишет DataFrame (без индекса) листом write-only книги — то же,
+    что df.to_excel(writer, sheet_name, index=False), но построчно.
+    """
+    ws = wb.create_sheet(sheet_name)
+
+    header = []
+    for col in df.columns:
+        cell = WriteOnlyCell(ws, value=str(col))
+        cell.font = _HEADER_FONT
+        cell.alignment = _HEADER_ALIGNMENT
+        cell.border = _HEADER_BORDER
+        header.append(cell)
+    ws.append(header)
+
+    # NaN → пустая ячейка (как в to_excel) — одной операцией на весь DataFrame
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        ws.append(row)
+
+
 def generate_final_verification_report(
     enhanced_df: pd.DataFrame,
     output_path: str,
@@ -558,125 +931,100 @@ def generate_final_verification_report(
         log: Logger
     """
     try:
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-
-            # ====== ЛИСТ 1: СВОДКА ======
-            summary_data = {
-                'Метрика': [
-                    'Всего клиентов',
-                    'Подтверждены Claude',
-                    'Требуют проверки',
-                    'Возможные дубли',
-                    'Не найдены',
-                    'Найдено возможных совпадений',
-                    'Исправлено ошибок OCR',
-                    'Выявлено расхождений'
-                ],
-                'Значение': [
-                    len(enhanced_df),
-                    len(enhanced_df[enhanced_df['Claude_Статус'] == 'Подтверждён']),
-                    len(enhanced_df[enhanced_df['Claude_Статус'] == 'Требует проверки']),
-                    len(enhanced_df[enhanced_df['Claude_Статус'] == 'Возможный дубль']),
-                    len(enhanced_df[enhanced_df['Claude_Статус'] == 'Не найден']),
-                    len(enhanced_df[enhanced_df['Возможные_совпадения_БД'].str.len() > 0]),
-                    len(enhanced_df[enhanced_df['Исправления_OCR'].str.len() > 0]),
-                    len(enhanced_df[enhanced_df['Расхождения'].str.len() > 0])
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Сводка', index=False)
-
-            # ====== ЛИСТ 2: ТРЕБУЮТ ПРОВЕРКИ ======
-            needs_review = enhanced_df[enhanced_df['Claude_Статус'] == 'Требует проверки'].copy()
-            if not needs_review.empty:
-                # Добавляем ID как индекс
-                needs_review.insert(0, 'ID', needs_review.index)
-                # Выбираем ключевые колонки
-                review_cols = [
-                    'ID', 'OCR_ФИО', 'OCR_Телефон',
-                    'БД_ID', 'БД_ФИО', 'БД_Телефон', 'Статус_БД',
-                    'Claude_Статус', 'Claude_Совпадение_%',
-                    'Расхождения', 'Рекомендации'
-                ]
-                review_cols = [col for col in review_cols if col in needs_review.columns]
-                needs_review[review_cols].to_excel(writer, sheet_name='Требуют_проверки', index=False)
-            else:
-                pd.DataFrame({'Сообщение': ['Нет клиентов, требующих проверки']}).to_excel(
-                    writer, sheet_name='Требуют_проверки', index=False
-                )
-
-            # ====== ЛИСТ 3: ВОЗМОЖНЫЕ ДУБЛИ ======
-            possible_dupes = enhanced_df[enhanced_df['Claude_Статус'] == 'Возможный дубль'].copy()
-            if not possible_dupes.empty:
-                # Добавляем ID как индекс
-                possible_dupes.insert(0, 'ID', possible_dupes.index)
-                dupe_cols = [
-                    'ID', 'OCR_ФИО', 'OCR_Телефон',
-                    'БД_ID', 'БД_ФИО', 'БД_Телефон',
-                    'Claude_Совпадение_%', 'Рекомендации'
-                ]
-                dupe_cols = [col for col in dupe_cols if col in possible_dupes.columns]
-                possible_dupes[dupe_cols].to_excel(writer, sheet_name='Возможные_дубли', index=False)
-            else:
-                pd.DataFrame({'Сообщение': ['Дубли не найдены']}).to_excel(
-                    writer, sheet_name='Возможные_дубли', index=False
-                )
-
-            # ====== ЛИСТ 4: НЕ НАЙДЕНЫ (РАСШИРЕННЫЙ) ======
-            status_col = 'Статус_БД' if 'Статус_БД' in enhanced_df.columns else 'Статус'
-            try:
-                from config import STATUS_DB_NOT_FOUND
-            except ImportError:
-                STATUS_DB_NOT_FOUND = "Нет в БД (новый для картотеки)"
-            if status_col == 'Статус_БД':
-                not_found = enhanced_df[enhanced_df[status_col] == STATUS_DB_NOT_FOUND].copy()
-            else:
-                not_found = enhanced_df[enhanced_df[status_col] == 'Не найден'].copy()
-            if not not_found.empty:
-                # Добавляем ID как индекс
-                not_found.insert(0, 'ID', not_found.index)
-                not_found_cols = [
-                    'ID', 'OCR_ФИО', 'OCR_Телефон',
-                    'БД_ID', 'Claude_Статус', 'Возможные_совпадения_БД', 'Рекомендации'
-                ]
-                not_found_cols = [col for col in not_found_cols if col in not_found.columns]
-                not_found[not_found_cols].to_excel(writer, sheet_name='Не_найдены_расширенный', index=False)
-            else:
-                pd.DataFrame({'Сообщение': ['Все клиенты найдены']}).to_excel(
-                    writer, sheet_name='Не_найдены_расширенный', index=False
-                )
-
-            # ====== ЛИСТ 5: ИСПРАВЛЕНИЯ OCR ======
-            with_corrections = enhanced_df[enhanced_df['Исправления_OCR'].str.len() > 0].copy()
-            if not with_corrections.empty:
-                # Добавляем ID как индекс
-                with_corrections.insert(0, 'ID', with_corrections.index)
-                corr_cols = [
-                    'ID', 'OCR_ФИО', 'OCR_Телефон', 'БД_ID',
-                    'Исправления_OCR', 'Рекомендации'
-                ]
-                corr_cols = [col for col in corr_cols if col in with_corrections.columns]
-                with_corrections[corr_cols].to_excel(writer, sheet_name='Исправления_OCR', index=False)
-            else:
-                pd.DataFrame({'Сообщение': ['Исправлений не требуется']}).to_excel(
-                    writer, sheet_name='Исправления_OCR', index=False
-                )
-
-            # ====== ЛИСТ 6: ВСЕ РЕКОМЕНДАЦИИ ======
-            with_recommendations = enhanced_df[enhanced_df['Рекомендации'].str.len() > 0].copy()
-            if not with_recommendations.empty:
-                # Добавляем ID как индекс
-                with_recommendations.insert(0, 'ID', with_recommendations.index)
-                rec_cols = [
-                    'ID', 'OCR_ФИО', 'БД_ID', 'Статус_БД',
-                    'Claude_Статус', 'Рекомендации'
-                ]
-                rec_cols = [col for col in rec_cols if col in with_recommendations.columns]
-                with_recommendations[rec_cols].to_excel(writer, sheet_name='Рекомендации', index=False)
+        # Колонка ID (индекс строки) добавляется один раз на весь отчёт,
+        # а не insert в копию каждого листа
+        enhanced_df = enhanced_df.assign(ID=enhanced_df.index)
+
+        # Строки по статусам Claude — одним groupby, а не маской на каждый статус
+        status_groups = dict(list(enhanced_df.groupby('Claude_Статус', sort=False, observed=True)))
+        no_rows = enhanced_df.iloc[0:0]
+
+        # Непустые текстовые колонки — маска на колонку один раз для сводки и листов.
+        # ne('') сравнивает без вызова len() на каждой ячейке; notna — как раньше
+        # str.len() > 0, где NaN не считался заполненным
+        def filled(col):
+            values = enhanced_df[col]
+            return values.ne('') & values.notna()
+
+        has_matches = filled('Возможные_совпадения_БД')
+        has_corrections = filled('Исправления_OCR')
+        has_discrepancies = filled('Расхождения')
+        has_recommendations = filled('Рекомендации')
+
+        # write-only: строки сразу уходят в XML листа, объектная модель
+        # ячеек всего отчёта в памяти не строится
+        wb = Workbook(write_only=True)
+
+        # ====== ЛИСТ 1: СВОДКА ======
+        summary_data = {
+            'Метрика': [
+                'Всего клиентов',
+                'Подтверждены Claude',
+                'Требуют проверки',
+                'Возможные дубли',
+                'Не найдены',
+                'Найдено возможных совпадений',
+                'Исправлено ошибок OCR',
+                'Выявлено расхождений'
+            ],
+            'Значение': [
+                len(enhanced_df),
+                len(status_groups.get(_STATUS_CONFIRMED, no_rows)),
+                len(status_groups.get(_STATUS_NEEDS_REVIEW, no_rows)),
+                len(status_groups.get(_STATUS_POSSIBLE_DUPLICATE, no_rows)),
+                len(status_groups.get(_STATUS_NOT_FOUND, no_rows)),
+                int(has_matches.sum()),
+                int(has_corrections.sum()),
+                int(has_discrepancies.sum())
+            ]
+        }
+        summary_df = pd.DataFrame(summary_data)
+        _write_df_sheet(wb, 'Сводка', summary_df)
+
+        # Строки листа «Не найдены» — по статусу сверки с БД, а не Claude
+        status_col = 'Статус_БД' if 'Статус_БД' in enhanced_df.columns else 'Статус'
+        try:
+            from config import STATUS_DB_NOT_FOUND
+        except ImportError:
+            STATUS_DB_NOT_FOUND = "Нет в БД (новый для картотеки)"
+        if status_col == 'Статус_БД':
+            not_found = enhanced_df[enhanced_df[status_col] == STATUS_DB_NOT_FOUND]
+        else:
+            not_found = enhanced_df[enhanced_df[status_col] == 'Не найден']
+
+        # ====== ЛИСТЫ 2–6: (лист, строки, колонки, сообщение для пустого листа) ======
+        sheet_specs = [
+            ('Требуют_проверки', status_groups.get(_STATUS_NEEDS_REVIEW, no_rows), [
+                'ID', 'OCR_ФИО', 'OCR_Телефон',
+                'БД_ID', 'БД_ФИО', 'БД_Телефон', 'Статус_БД',
+                'Claude_Статус', 'Claude_Совпадение_%',
+                'Расхождения', 'Рекомендации'
+            ], 'Нет клиентов, требующих проверки'),
+            ('Возможные_дубли', status_groups.get(_STATUS_POSSIBLE_DUPLICATE, no_rows), [
+                'ID', 'OCR_ФИО', 'OCR_Телефон',
+                'БД_ID', 'БД_ФИО', 'БД_Телефон',
+                'Claude_Совпадение_%', 'Рекомендации'
+            ], 'Дубли не найдены'),
+            ('Не_найдены_расширенный', not_found, [
+                'ID', 'OCR_ФИО', 'OCR_Телефон',
+                'БД_ID', 'Claude_Статус', 'Возможные_совпадения_БД', 'Рекомендации'
+            ], 'Все клиенты найдены'),
+            ('Исправления_OCR', enhanced_df[has_corrections], [
+                'ID', 'OCR_ФИО', 'OCR_Телефон', 'БД_ID',
+                'Исправления_OCR', 'Рекомендации'
+            ], 'Исправлений не требуется'),
+            ('Рекомендации', enhanced_df[has_recommendations], [
+                'ID', 'OCR_ФИО', 'БД_ID', 'Статус_БД',
+                'Claude_Статус', 'Рекомендации'
+            ], 'Рекомендаций нет'),
+        ]
+        for sheet_name, rows, cols, empty_message in sheet_specs:
+            if rows.empty:
+                _write_df_sheet(wb, sheet_name, pd.DataFrame({'Сообщение': [empty_message]}))
             else:
-                pd.DataFrame({'Сообщение': ['Рекомендаций нет']}).to_excel(
-                    writer, sheet_name='Рекомендации', index=False
-                )
+                _write_df_sheet(wb, sheet_name, rows[[col for col in cols if col in rows.columns]])
+
+        wb.save(output_path)
 
         log.info(f"  ✓ Отчёт сохранён: {output_path}")
 
@@ -3,7 +3,7 @@
 import json
 import logging
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import pandas as pd
 
@@ -29,9 +29,67 @@ def load_client(creds_path: str):
     return build("sheets", "v4", credentials=creds)
 
 
+def _column_values(s: pd.Series) -> list:
+    """Значения колонки для записи в RAW: тип определяется один раз на колонку."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.dt.strftime("%d.%m.%Y").fillna("").tolist()
+    if pd.api.types.is_numeric_dtype(s):
+        # числа уходят в Sheets как числа; NaN/NA — "" (None в RAW-записи
+        # оставил бы в ячейке старое значение при clear=False)
+        return s.astype(object).where(s.notna(), "").tolist()
+    return s.astype("string").fillna("").tolist()
+
+
 def df_to_values(df: pd.DataFrame):
     # Convert DataFrame to list-of-lists with header
-    return [list(df.columns)] + df.fillna("").astype(str).values.tolist()
+    cols = [_column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    return [list(df.columns)] + [list(row) for row in zip(*cols)]
+
+
+# {spreadsheet_id: {title: sheetId}} — метаданные листов читаются один раз
+# на таблицу за процесс; новые листы дописываются сюда при создании
+_META_CACHE: Dict[str, Dict[str, int]] = {}
+
+
+def _sheet_ids(client, spreadsheet_id: str) -> Dict[str, int]:
+    """{title: sheetId} листов таблицы (spreadsheets().get — только при первом обращении)."""
+    ids = _META_CACHE.get(spreadsheet_id)
+    if ids is None:
+        meta = client.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties").execute()
+        ids = {}
+        for s in meta.get("sheets", []):
+            props = s.get("properties", {})
+            ids[props.get("title")] = props.get("sheetId")
+        _META_CACHE[spreadsheet_id] = ids
+    return ids
+
+
+def _ensure_sheets_exist(client, spreadsheet_id: str, sheet_names: List[str]) -> Dict[str, int]:
+    """
+    Проверяет, существуют ли листы. Недостающие создаёт одним batchUpdate
+    (addSheet на каждый). Возвращает {sheet_name: sheetId}.
+    """
+    ids = _sheet_ids(client, spreadsheet_id)
+    missing = [name for name in dict.fromkeys(sheet_names) if name not in ids]
+    for name in sheet_names:
+        if name in ids:
+            log.info(f"  Лист '{name}' найден (id={ids[name]})")
+
+    if missing:
+        # Листов нет — создаём все одним запросом
+        log.info(f"  Листы не найдены, создаём: {', '.join(missing)}...")
+        body = {
+            "requests": [
+                {"addSheet": {"properties": {"title": name}}}
+                for name in missing
+            ]
+        }
+        resp = client.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
+        for name, reply in zip(missing, resp["replies"]):
+            ids[name] = reply["addSheet"]["properties"]["sheetId"]
+            log.info(f"  ✓ Лист '{name}' создан (id={ids[name]})")
+
+    return {name: ids[name] for name in sheet_names}
 
 
 def _ensure_sheet_exists(client, spreadsheet_id: str, sheet_name: str):
@@ -39,44 +97,53 @@ def _ensure_sheet_exists(client, spreadsheet_id: str, sheet_name: str):
     Проверяет, существует ли лист. Если нет — создаёт через batchUpdate addSheet.
     Возвращает sheetId (int).
     """
-    # Получаем список существующих листов
-    meta = client.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties").execute()
-    for s in meta.get("sheets", []):
-        props = s.get("properties", {})
-        if props.get("title") == sheet_name:
-            log.info(f"  Лист '{sheet_name}' найден (id={props.get('sheetId')})")
-            return props.get("sheetId")
-
-    # Лист не найден — создаём
-    log.info(f"  Лист '{sheet_name}' не найден, создаём...")
-    body = {
-        "requests": [{
-            "addSheet": {
-                "properties": {"title": sheet_name}
-            }
-        }]
-    }
-    resp = client.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
-    new_id = resp["replies"][0]["addSheet"]["properties"]["sheetId"]
-    log.info(f"  ✓ Лист '{sheet_name}' создан (id={new_id})")
-    return new_id
+    return _ensure_sheets_exist(client, spreadsheet_id, [sheet_name])[sheet_name]
 
 
-def upload_df(df: pd.DataFrame, spreadsheet_id: str, sheet_name: str, creds_path: str, clear: bool = True):
+def upload_many(sheets: Dict[str, pd.DataFrame], spreadsheet_id: str, creds_path: str, clear: bool = True):
+    """
+    Выгружает несколько DataFrame ({sheet_name: df}) в листы таблицы.
+
+    Запросов — не по 3-4 на лист, а на все сразу: метаданные (из кэша),
+    один addSheet для недостающих, один batchClear и один values.batchUpdate.
+    """
     client = load_client(creds_path)
 
-    # Убеждаемся что лист существует (создаём при необходимости)
-    _ensure_sheet_exists(client, spreadsheet_id, sheet_name)
-
-    values = df_to_values(df)
-    body = {"values": values}
-    range_name = f"{sheet_name}!A1"
-    if clear:
-        client.spreadsheets().values().clear(spreadsheetId=spreadsheet_id, range=sheet_name).execute()
-    client.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption="RAW",
-        body=body,
-    ).execute()
+    # Убеждаемся что листы существуют (создаём при необходимости)
+    _ensure_sheets_exist(client, spreadsheet_id, list(sheets))
+
+    values_api = client.spreadsheets().values()
+    try:
+        if len(sheets) == 1:
+            # Один лист — обычные clear/update (столько же запросов)
+            (sheet_name, df), = sheets.items()
+            if clear:
+                values_api.clear(spreadsheetId=spreadsheet_id, range=sheet_name).execute()
+            values_api.update(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A1",
+                valueInputOption="RAW",
+                body={"values": df_to_values(df)},
+            ).execute()
+        elif sheets:
+            if clear:
+                values_api.batchClear(spreadsheetId=spreadsheet_id, body={"ranges": list(sheets)}).execute()
+            values_api.batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={
+                    "valueInputOption": "RAW",
+                    "data": [
+                        {"range": f"{sheet_name}!A1", "values": df_to_values(df)}
+                        for sheet_name, df in sheets.items()
+                    ],
+                },
+            ).execute()
+    except Exception:
+        # Лист могли удалить вручную — при следующей выгрузке метаданные перечитаются
+        _META_CACHE.pop(spreadsheet_id, None)
+        raise
     return True
+
+
+def upload_df(df: pd.DataFrame, spreadsheet_id: str, sheet_name: str, creds_path: str, clear: bool = True):
+    return upload_many({sheet_name: df}, spreadsheet_id, creds_path, clear=clear)
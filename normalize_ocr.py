@@ -18,8 +18,11 @@ clients_normalized.xlsx с полями, приведёнными к форма
 Маппинг полей настраивается в config.py (OCR_*_FIELD_MAP).
 """
 
+import functools
+import itertools
 import os
 import sys
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
@@ -43,6 +46,12 @@ SHEET_FIELD_MAPS = {
     "Ботокс":     getattr(config, 'OCR_BOTOX_FIELD_MAP', {}),
 }
 
+# Колонки-идентификаторы, которые читаются строками: числовая ячейка
+# с пропусками в колонке иначе становится float (87011234567.0).
+# Один dtype на все листы: колонки, которых нет в листе, pandas пропускает
+# (Телефон/ИИН/Экстренный контакт — «Клиенты», Контакты — «Комплексы»)
+_READ_DTYPES = {"Телефон": str, "ИИН / Паспорт": str, "Экстренный контакт": str, "Контакты": str}
+
 
 # ============================================================
 # НОРМАЛИЗАЦИЯ ДАННЫХ
@@ -61,6 +70,24 @@ def normalize_phone(phone):
     return digits
 
 
+def normalize_phone_series(values):
+    """
+    normalize_phone для целой колонки: цифры — одним str.replace по всей
+    колонке, замены 8… → 7… и добавление 7 — масками, без вызова функции
+    на каждую ячейку. Пустые значения и float (в т.ч. NaN) → "".
+    """
+    if values.dtype.kind == "f":
+        return pd.Series("", index=values.index, dtype=object)
+    values = values.astype(object)
+    blank = (values.isna() | ~values.astype(bool)
+             | values.map(type).isin((float, np.float64, np.float32)))
+    digits = values.astype(str).str.replace(r"\D", "", regex=True)
+    lengths = digits.str.len()
+    digits = digits.mask((lengths == 11) & digits.str.startswith("8"), "7" + digits.str[1:])
+    digits = digits.mask(lengths == 10, "7" + digits)
+    return digits.astype(object).mask(blank, "")
+
+
 def normalize_date(date_val):
     """Приводит дату к формату ДД.ММ.ГГГГ."""
     if not date_val or str(date_val).strip() in ("", "nan", "NaT", "None"):
@@ -82,21 +109,129 @@ def normalize_date(date_val):
     return s  # Возвращаем как есть
 
 
+# Форматы, которые normalize_date пробует по очереди (по первым 19 символам)
+_DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+
+def normalize_date_series(values):
+    """
+    normalize_date для целой колонки. Каждый формат разбирается одним
+    pd.to_datetime(format=..., errors="coerce") по ещё не распознанным
+    значениям (те же строгие форматы, что и strptime, без угадывания
+    format="mixed"); to_datetime кэширует повторяющиеся строки — даты
+    визитов в колонке сильно повторяются.
+    """
+    if values.dtype.kind == "M":
+        return values.dt.strftime("%d.%m.%Y").astype(object).fillna("")
+
+    values = values.astype(object)
+    text = values.astype(str).str.strip()
+    blank = values.isna() | ~values.astype(bool) | text.isin(("", "nan", "NaT", "None"))
+    result = text.astype(object)
+
+    # Уже в формате ДД.ММ.ГГГГ — как есть
+    dotted = (text.str.len() >= 8) & (text.str.count(r"\.") == 2)
+    pending = text[~blank & ~dotted].str[:19]
+    for fmt in _DATE_FORMATS:
+        if pending.empty:
+            break
+        parsed = pd.to_datetime(pending, format=fmt, errors="coerce", cache=True)
+        ok = parsed.notna()
+        result[ok[ok].index] = parsed[ok].dt.strftime("%d.%m.%Y")
+        pending = pending[~ok]
+
+    return result.mask(blank, "")
+
+
+# Обратный маппинг: полное имя → короткое (как в БД), ключ — в нижнем регистре.
+# DB_DOCTOR_MAP: {"Оксана А. - врач": "Асшеман Оксана"}
+# Нам нужен обратный: {"асшеман оксана": "Оксана А. - врач"}.
+# reversed — при повторах остаётся первая запись, как при переборе по порядку
+_DOCTOR_REVERSE = {
+    ocr_full.lower(): db_short
+    for db_short, ocr_full in reversed(list(getattr(config, 'DB_DOCTOR_MAP', {}).items()))
+}
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_doctor(doctor_name):
     """Приводит имя врача из OCR к формату БД (через DB_DOCTOR_MAP)."""
     if not doctor_name or str(doctor_name).strip() in ("", "nan"):
         return ""
     name = str(doctor_name).strip()
+    return _DOCTOR_REVERSE.get(name.lower(), name)
+
+
+def normalize_doctor_series(values):
+    """normalize_doctor один раз на уникальное имя; пропуски (NaN/None) → ""."""
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([normalize_doctor(name) for name in uniques] + [""], dtype=object)
+    return pd.Series(mapped[codes], index=values.index)
+
+
+# ============================================================
+# ДВИЖКИ EXCEL
+# ============================================================
+
+def _pandas_version():
+    """(major, minor) установленной pandas: "2.1.4" → (2, 1)."""
+    parts = []
+    for part in pd.__version__.split(".")[:2]:
+        digits = "".join(itertools.takewhile(str.isdigit, part))
+        parts.append(int(digits or 0))
+    return tuple(parts)
 
-    # Обратный маппинг: полное имя → короткое (как в БД)
-    reverse_map = getattr(config, 'DB_DOCTOR_MAP', {})
-    # DB_DOCTOR_MAP: {"Оксана А. - врач": "Асшеман Оксана"}
-    # Нам нужен обратный: {"Асшеман Оксана": "Оксана А. - врач"}
-    for db_short, ocr_full in reverse_map.items():
-        if name.lower() == ocr_full.lower():
-            return db_short
 
-    return name
+def _excel_engines():
+    """
+    (движок чтения, движок записи) для pandas.
+
+    Чтение — calamine (python-calamine, разбор XML в Rust без объектной модели
+    ячеек openpyxl), запись — xlsxwriter (потоковая, без стилей в памяти).
+    Если пакет не установлен — openpyxl, как раньше. Движок calamine есть
+    в pandas только с 2.2: на более старой pandas — тоже openpyxl.
+    """
+    try:
+        import python_calamine  # noqa: F401
+        reader = "calamine" if _pandas_version() >= (2, 2) else "openpyxl"
+    except ImportError:
+        reader = "openpyxl"
+    try:
+        import xlsxwriter  # noqa: F401
+        writer = "xlsxwriter"
+    except ImportError:
+        writer = "openpyxl"
+    return reader, writer
+
+
+def _cell_columns(df):
+    """Колонки листа списками значений для openpyxl: NaN/NaT/NA → пустая ячейка."""
+    return [df.iloc[:, i].astype(object).where(df.iloc[:, i].notna(), None).tolist()
+            for i in range(df.shape[1])]
+
+
+def _save_sheets(output_path, sheets, engine):
+    """
+    Сохраняет {лист: DataFrame} в xlsx.
+
+    xlsxwriter пишет потоково сам; без него — openpyxl в режиме write_only:
+    строки сразу уходят в XML, модель ячеек всего листа в памяти не строится.
+    """
+    if engine != "openpyxl":
+        with pd.ExcelWriter(output_path, engine=engine) as writer:
+            for name, df in sheets.items():
+                df.to_excel(writer, sheet_name=name, index=False)
+        return
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for name, df in sheets.items():
+        ws = wb.create_sheet(title=name)
+        ws.append([str(c) for c in df.columns])
+        for row in zip(*_cell_columns(df)):
+            ws.append(row)
+    wb.save(output_path)
 
 
 # ============================================================
@@ -111,35 +246,59 @@ def normalize_sheet(df, field_map, sheet_name):
     if df is None or len(df) == 0:
         return pd.DataFrame()
 
-    # Переименование столбцов
-    rename_dict = {}
-    for old_col in df.columns:
-        if old_col in field_map:
-            rename_dict[old_col] = field_map[old_col]
-
-    new_df = df.rename(columns=rename_dict).copy()
+    # Переименование столбцов: поверхностная копия — данные не копируются,
+    # колонки ниже заменяются присваиванием, исходный df не меняется
+    new_df = df.copy(deep=False)
+    rename_dict = {col: field_map[col] for col in df.columns.intersection(list(field_map))}
+    if rename_dict:
+        new_df.rename(columns=rename_dict, inplace=True)
 
     # Нормализация телефонов
     for col in new_df.columns:
         if col.lower() in ("телефон", "phone", "контакты"):
-            new_df[col] = new_df[col].apply(normalize_phone)
+            new_df[col] = normalize_phone_series(new_df[col])
 
     # Нормализация дат
     for col in new_df.columns:
         col_l = col.lower()
         if any(w in col_l for w in ("дата", "date", "визит")):
-            new_df[col] = new_df[col].apply(normalize_date)
+            new_df[col] = normalize_date_series(new_df[col])
 
     # Нормализация врачей (оставляем OCR-формат, не конвертируем в БД-формат)
     # Причина: при сверке verify_with_db сам маппит через DB_DOCTOR_MAP
     # Но если лист — "Процедуры" или "Покупки", добавляем столбец с БД-форматом
     for col in new_df.columns:
         if col.lower() in ("доктор", "врач", "консультант"):
-            new_df[f"{col}_БД"] = new_df[col].apply(normalize_doctor)
+            new_df[f"{col}_БД"] = normalize_doctor_series(new_df[col])
 
     return new_df
 
 
+def _column(df, name, default=""):
+    """Колонка листа или default, если её нет, — как row.get(name, default) для всех строк."""
+    return df[name] if name in df.columns else default
+
+
+def _is_blank(values):
+    """Пусто: NaN/None, пустая строка, 0 или строка «nan»."""
+    values = values.astype(object)
+    return values.isna() | ~values.astype(bool) | values.eq("nan")
+
+
+def _visits_frame(df, date, doctor, procedure, quantity, cost, source):
+    """Строки листа в формате «Все_визиты» (колонки или скаляры на все строки)."""
+    return pd.DataFrame({
+        "ID": _column(df, "ID"),
+        "Клиент": _column(df, "Клиент"),
+        "Дата визита": date,
+        "Доктор": doctor,
+        "Процедура": procedure,
+        "Количество": quantity,
+        "Стоимость": cost,
+        "Источник": source,
+    }, index=df.index)
+
+
 def normalize_ocr_file(input_path, output_path):
     """
     Полная нормализация OCR Excel → нормализованный Excel.
@@ -157,11 +316,14 @@ def normalize_ocr_file(input_path, output_path):
         print(f"  ОШИБКА: файл не найден: {input_path}")
         return None
 
-    xf = pd.ExcelFile(input_path)
+    read_engine, write_engine = _excel_engines()
+
+    # Все листы одним read_excel (порядок листов сохраняется);
+    # телефоны/ИИН — сразу строками, без вывода типа через float
+    sheets = pd.read_excel(input_path, sheet_name=None, dtype=_READ_DTYPES, engine=read_engine)
     normalized_sheets = {}
 
-    for sheet_name in xf.sheet_names:
-        df = pd.read_excel(input_path, sheet_name=sheet_name)
+    for sheet_name, df in sheets.items():
         field_map = SHEET_FIELD_MAPS.get(sheet_name, {})
 
         if field_map:
@@ -178,103 +340,97 @@ def normalize_ocr_file(input_path, output_path):
     # ── Создаём сводный лист «Все_визиты» ──
     # Объединяем процедуры, покупки, комплексы, ботокс
     # в формат БД: Клиент | Телефон | Дата визита | Доктор | Процедура | Количество
-    all_visits = []
+    # Каждый лист — целыми колонками (без iterrows), затем один concat
+    visit_frames = []
 
     # Процедуры
     if "Процедуры" in normalized_sheets:
         proc = normalized_sheets["Процедуры"]
-        for _, row in proc.iterrows():
-            all_visits.append({
-                "ID": row.get("ID", ""),
-                "Клиент": row.get("Клиент", ""),
-                "Дата визита": row.get("Дата визита", ""),
-                "Доктор": row.get("Доктор", row.get("Доктор_БД", "")),
-                "Процедура": row.get("Процедура", ""),
-                "Количество": 1,
-                "Стоимость": row.get("Стоимость", ""),
-                "Источник": "Процедурный лист",
-            })
+        visit_frames.append(_visits_frame(
+            proc,
+            date=_column(proc, "Дата визита"),
+            doctor=_column(proc, "Доктор", _column(proc, "Доктор_БД")),
+            procedure=_column(proc, "Процедура"),
+            quantity=1,
+            cost=_column(proc, "Стоимость"),
+            source="Процедурный лист",
+        ))
 
     # Покупки
     if "Покупки" in normalized_sheets:
         purch = normalized_sheets["Покупки"]
-        for _, row in purch.iterrows():
-            all_visits.append({
-                "ID": row.get("ID", ""),
-                "Клиент": row.get("Клиент", ""),
-                "Дата визита": row.get("Дата визита", ""),
-                "Доктор": row.get("Доктор", row.get("Доктор_БД", "")),
-                "Процедура": row.get("Процедура", ""),
-                "Количество": 1,
-                "Стоимость": row.get("Стоимость", ""),
-                "Источник": "Покупки",
-            })
+        visit_frames.append(_visits_frame(
+            purch,
+            date=_column(purch, "Дата визита"),
+            doctor=_column(purch, "Доктор", _column(purch, "Доктор_БД")),
+            procedure=_column(purch, "Процедура"),
+            quantity=1,
+            cost=_column(purch, "Стоимость"),
+            source="Покупки",
+        ))
 
     # Комплексы
     if "Комплексы" in normalized_sheets:
         comp = normalized_sheets["Комплексы"]
-        for _, row in comp.iterrows():
-            proc_name = row.get("Процедура", "")
-            if not proc_name or str(proc_name) == "nan":
-                proc_name = row.get("Комплекс", "")
-            all_visits.append({
-                "ID": row.get("ID", ""),
-                "Клиент": row.get("Клиент", ""),
-                "Дата визита": row.get("Дата визита",
-                                       row.get("Дата процедуры", "")),
-                "Доктор": row.get("Доктор", row.get("Доктор_БД", "")),
-                "Процедура": proc_name,
-                "Количество": row.get("Количество", 1),
-                "Стоимость": row.get("Стоимость", ""),
-                "Источник": "Комплекс",
-            })
+        # Пустая процедура — берём название комплекса
+        proc_name = _column(comp, "Процедура")
+        if isinstance(proc_name, pd.Series):
+            proc_name = proc_name.astype(object)
+            proc_name = proc_name.mask(_is_blank(proc_name), _column(comp, "Комплекс"))
+        else:
+            proc_name = _column(comp, "Комплекс")
+        visit_frames.append(_visits_frame(
+            comp,
+            date=_column(comp, "Дата визита", _column(comp, "Дата процедуры")),
+            doctor=_column(comp, "Доктор", _column(comp, "Доктор_БД")),
+            procedure=proc_name,
+            quantity=_column(comp, "Количество", 1),
+            cost=_column(comp, "Стоимость"),
+            source="Комплекс",
+        ))
 
     # Ботокс
     if "Ботокс" in normalized_sheets:
         botox = normalized_sheets["Ботокс"]
-        for _, row in botox.iterrows():
-            zone = row.get("Зона", "")
-            drug = row.get("Препарат", "")
-            proc_name = f"Ботулинотерапия: {drug}" if drug else "Ботулинотерапия"
-            if zone and str(zone) != "nan":
-                proc_name += f" ({zone})"
-            all_visits.append({
-                "ID": row.get("ID", ""),
-                "Клиент": row.get("Клиент", ""),
-                "Дата визита": row.get("Дата визита", ""),
-                "Доктор": "",
-                "Процедура": proc_name,
-                "Количество": row.get("Количество", 1),
-                "Стоимость": "",
-                "Источник": "Ботокс",
-            })
-
-    if all_visits:
-        visits_df = pd.DataFrame(all_visits)
+        proc_name = pd.Series("Ботулинотерапия", index=botox.index, dtype=object)
+        drug = _column(botox, "Препарат")
+        if isinstance(drug, pd.Series):
+            proc_name = proc_name.mask(~_is_blank(drug), "Ботулинотерапия: " + drug.astype(str))
+        zone = _column(botox, "Зона")
+        if isinstance(zone, pd.Series):
+            proc_name = proc_name.mask(~_is_blank(zone), proc_name + " (" + zone.astype(str) + ")")
+        visit_frames.append(_visits_frame(
+            botox,
+            date=_column(botox, "Дата визита"),
+            doctor="",
+            procedure=proc_name,
+            quantity=_column(botox, "Количество", 1),
+            cost="",
+            source="Ботокс",
+        ))
+
+    all_visits = pd.concat(visit_frames, ignore_index=True) if visit_frames else pd.DataFrame()
+
+    if len(all_visits):
         # Убираем пустые строки
-        visits_df = visits_df[
-            visits_df["Клиент"].notna() &
-            (visits_df["Клиент"] != "") &
-            (visits_df["Клиент"] != "nan")
+        visits_df = all_visits[
+            all_visits["Клиент"].notna() &
+            (all_visits["Клиент"] != "") &
+            (all_visits["Клиент"] != "nan")
         ]
         normalized_sheets["Все_визиты"] = visits_df
         print(f"  ★ Все_визиты: {len(visits_df)} записей "
               f"(формат БД: Клиент/Дата/Доктор/Процедура/Кол-во)")
 
     # ── Сохраняем ──
-    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-        # Сначала сводный лист
-        if "Все_визиты" in normalized_sheets:
-            normalized_sheets["Все_визиты"].to_excel(
-                writer, sheet_name="Все_визиты", index=False
-            )
-
-        # Потом остальные
-        for name, df in normalized_sheets.items():
-            if name == "Все_визиты":
-                continue
-            if len(df) > 0:
-                df.to_excel(writer, sheet_name=name, index=False)
+    # Сначала сводный лист, потом остальные (пустые листы не пишем)
+    ordered = {}
+    if "Все_визиты" in normalized_sheets:
+        ordered["Все_визиты"] = normalized_sheets["Все_визиты"]
+    for name, df in normalized_sheets.items():
+        if name != "Все_визиты" and len(df) > 0:
+            ordered[name] = df
+    _save_sheets(output_path, ordered, write_engine)
 
     print(f"\n  ✓ Нормализованный файл: {output_path}")
     print(f"    Листов: {len(normalized_sheets)}")
@@ -8,6 +8,7 @@
 CLI:
     python3 quality_baseline.py
     python3 quality_baseline.py --repeat 3 --output-dir artifacts/quality
+    python3 quality_baseline.py --repeat 3 --parallel-repeats
     python3 quality_baseline.py \\
         --pytest-cmd "python3 -m pytest tests/ -v" \\
         --smoke-cmd "python3 run_pipeline.py --skip-ocr"
@@ -20,7 +21,9 @@ import re
 import shlex
 import subprocess
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -75,6 +78,12 @@ def parse_args() -> argparse.Namespace:
         default=2,
         help="Количество прогонов pytest >= 1 (default: 2)",
     )
+    parser.add_argument(
+        "--parallel-repeats",
+        action="store_true",
+        help="Запускать прогоны pytest одновременно (только для тестов без общих "
+             "файлов/портов; у каждого прогона свой --basetemp, без .pytest_cache)",
+    )
     parser.add_argument(
         "--output-dir",
         default="artifacts/quality",
@@ -87,6 +96,12 @@ def parse_args() -> argparse.Namespace:
 # PYTEST RUNNER
 # ============================================================
 
+# Строка теста pytest -v: "tests/foo.py::bar PASSED" или "FAILED" / "ERROR"
+_RE_TEST_LINE = re.compile(r"^(tests/\S+::\S+)\s+(PASSED|FAILED|ERROR)")
+# Счётчик итоговой строки: "5 passed", "1 failed", "2 error"
+_RE_SUMMARY_COUNT = re.compile(r"(\d+) (passed|failed|error)")
+
+
 def _parse_pytest_output(stdout: str):
     """
     Разбирает вывод pytest -v.
@@ -101,33 +116,31 @@ def _parse_pytest_output(stdout: str):
     failed = 0
 
     for line in stdout.splitlines():
-        # Строки вида: "tests/foo.py::bar PASSED" или "FAILED" / "ERROR"
-        m = re.match(r"^(tests/\S+::\S+)\s+(PASSED|FAILED|ERROR)", line)
+        m = _RE_TEST_LINE.match(line)
         if m:
-            test_id = m.group(1)
-            outcome = m.group(2)
-            test_results[test_id] = "passed" if outcome == "PASSED" else "failed"
+            test_results[m.group(1)] = "passed" if m.group(2) == "PASSED" else "failed"
+            continue
 
         # Итоговая строка pytest, например:
         #   "5 passed in 1.2s"
         #   "4 passed, 1 failed in 2.3s"
         #   "1 failed, 1 error, 3 passed in 2.3s"
-        # Признак итоговой строки — наличие хотя бы одного счётчика
-        if re.search(r"\d+ (?:passed|failed|error)", line):
-            m_pass = re.search(r"(\d+) passed", line)
-            if m_pass:
-                passed = int(m_pass.group(1))
-            # findall ловит ВСЕ вхождения "N failed" и "N error" в одной строке,
-            # затем суммирует их → корректный общий счётчик провалов.
+        # Признак итоговой строки — наличие хотя бы одного счётчика;
+        # все счётчики строки — одним findall
+        counts = _RE_SUMMARY_COUNT.findall(line)
+        if counts:
+            passed_counts = [int(n) for n, kind in counts if kind == "passed"]
+            if passed_counts:
+                passed = passed_counts[0]
+            # Сумма ВСЕХ "N failed" и "N error" в строке → общий счётчик провалов.
             # Присваивание (не +=): каждая итоговая строка перезаписывает счётчик
             # (если строка без провалов → 0).
-            all_fail_counts = re.findall(r"(\d+) (?:failed|error)", line)
-            failed = sum(int(x) for x in all_fail_counts)
+            failed = sum(int(n) for n, kind in counts if kind != "passed")
 
     return test_results, passed, failed
 
 
-def _run_pytest_once(cmd: str, cwd: str) -> dict:
+def _run_pytest_once(cmd: str, cwd: str, env: dict = None) -> dict:
     """Запускает pytest один раз, возвращает статистику прогона."""
     t0 = time.time()
     result = subprocess.run(
@@ -135,6 +148,7 @@ def _run_pytest_once(cmd: str, cwd: str) -> dict:
         capture_output=True,
         text=True,
         cwd=cwd,
+        env=env,
     )
     duration = round(time.time() - t0, 2)
 
@@ -155,23 +169,51 @@ def _run_pytest_once(cmd: str, cwd: str) -> dict:
     }
 
 
-def collect_pytest_stats(cmd: str, cwd: str, repeat: int) -> dict:
+def _format_run(run: dict) -> str:
+    status = "OK" if run["returncode"] == 0 else "FAIL"
+    return f" {status} ({run['passed']}/{run['total']} passed, {run['duration_sec']:.1f}s)"
+
+
+def _run_pytest_isolated(cmd: str, cwd: str) -> dict:
+    """
+    Прогон для параллельного режима: свой --basetemp (pytest чистит
+    basetemp при старте и старые каталоги tmp_path — общий каталог
+    одновременные прогоны удаляли бы друг у друга) и без .pytest_cache.
+    """
+    with tempfile.TemporaryDirectory(prefix="quality-pytest-") as basetemp:
+        env = os.environ.copy()
+        env["PYTEST_ADDOPTS"] = " ".join(filter(None, (
+            env.get("PYTEST_ADDOPTS", ""),
+            "-p no:cacheprovider",
+            f"--basetemp={shlex.quote(os.path.join(basetemp, 'tmp'))}",
+        )))
+        return _run_pytest_once(cmd, cwd, env=env)
+
+
+def collect_pytest_stats(cmd: str, cwd: str, repeat: int, parallel: bool = False) -> dict:
     """
     Запускает pytest ``repeat`` раз, собирает агрегированную статистику.
     Определяет flaky-кандидаты: тесты, исход которых менялся между прогонами.
+
+    parallel — прогоны идут одновременно в пуле потоков (каждый — отдельный
+    процесс pytest); результаты в порядке прогонов. Имеет смысл только для
+    тестов без побочных эффектов за пределами tmp_path.
     """
     print(f"  [pytest] Команда: {cmd}")
-    runs_raw = []
-
-    for i in range(repeat):
-        print(f"  [pytest] Прогон {i + 1}/{repeat}...", end="", flush=True)
-        run = _run_pytest_once(cmd, cwd)
-        runs_raw.append(run)
-        status = "OK" if run["returncode"] == 0 else "FAIL"
-        print(
-            f" {status} ({run['passed']}/{run['total']} passed,"
-            f" {run['duration_sec']:.1f}s)"
-        )
+
+    if parallel and repeat > 1:
+        print(f"  [pytest] {repeat} прогонов параллельно...", flush=True)
+        with ThreadPoolExecutor(max_workers=repeat) as pool:
+            runs_raw = list(pool.map(lambda _: _run_pytest_isolated(cmd, cwd), range(repeat)))
+        for i, run in enumerate(runs_raw):
+            print(f"  [pytest] Прогон {i + 1}/{repeat}:" + _format_run(run))
+    else:
+        runs_raw = []
+        for i in range(repeat):
+            print(f"  [pytest] Прогон {i + 1}/{repeat}...", end="", flush=True)
+            run = _run_pytest_once(cmd, cwd)
+            runs_raw.append(run)
+            print(_format_run(run))
 
     # Канонический результат — последний прогон
     canonical = runs_raw[-1]
@@ -323,6 +365,9 @@ def _generate_md(baseline: dict) -> str:
         "# С 3 прогонами для flaky-детекции",
         "python3 quality_baseline.py --repeat 3",
         "",
+        "# Те же прогоны одновременно (тесты без общих файлов/портов)",
+        "python3 quality_baseline.py --repeat 3 --parallel-repeats",
+        "",
         "# Ручной smoke-прогон (все 3 env var для детерминизма)",
         f"ENABLE_FINAL_VERIFICATION=false GSHEETS_UPLOAD_ENABLED=false SMOKE_MODE=true {ss['command']}",
         "",
@@ -349,7 +394,8 @@ def generate_baseline(args: argparse.Namespace) -> dict:
     )
 
     print("\n=== pytest ===")
-    pytest_stats = collect_pytest_stats(args.pytest_cmd, str(PROJECT_DIR), args.repeat)
+    pytest_stats = collect_pytest_stats(args.pytest_cmd, str(PROJECT_DIR), args.repeat,
+                                        parallel=getattr(args, "parallel_repeats", False))
 
     print("\n=== smoke ===")
     smoke_result = run_smoke(args.smoke_cmd, str(PROJECT_DIR))
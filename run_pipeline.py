@@ -38,7 +38,6 @@ if not os.environ.get("GRPC_DEFAULT_SSL_ROOTS_FILE_PATH"):
         pass
 
 import time
-import json
 import argparse
 import logging
 from datetime import datetime
@@ -138,7 +137,8 @@ def run_ocr_pipeline(log, config):
         from client_card_ocr import (
             init_vision_client, init_claude_client,
             process_all_images, group_by_client,
-            deduplicate_pages, write_to_excel
+            deduplicate_pages, write_to_excel, get_image_files,
+            save_raw_results
         )
     except ImportError as e:
         log.error(f"Не удалось импортировать client_card_ocr: {e}")
@@ -155,11 +155,7 @@ def run_ocr_pipeline(log, config):
         return None
 
     # Считаем фото
-    from pathlib import Path
-    image_files = [
-        f for f in os.listdir(config.INPUT_FOLDER)
-        if Path(f).suffix.lower() in config.IMAGE_EXTENSIONS
-    ]
+    image_files = get_image_files(config.INPUT_FOLDER)
 
     if not image_files:
         log.error(f"Фотографии не найдены в: {config.INPUT_FOLDER}")
@@ -196,11 +192,7 @@ def run_ocr_pipeline(log, config):
     ocr_time = time.time() - t_ocr
 
     # Сохраняем сырые данные
-    raw_path = os.path.join(
-        os.path.dirname(config.OUTPUT_FILE) or '.', "raw_results.json"
-    )
-    with open(raw_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    raw_path = save_raw_results(results)
     log.info(f"  Сырые данные: {raw_path}")
 
     # Статистика OCR
@@ -534,7 +526,8 @@ def generate_pipeline_report(log, config, verification_df, ocr_excel_path):
     со всеми ключевыми данными в одном файле.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    report_path = os.path.join(script_dir, "pipeline_report.xlsx")
+    report_path = getattr(config, 'PIPELINE_REPORT_FILE',
+                          os.path.join(script_dir, "pipeline_report.xlsx"))
 
     log.info("\n── Генерация итогового отчёта ──")
 
@@ -703,7 +696,8 @@ def print_summary(log, verification_df, total_time, ocr_excel_path, config):
     if os.path.exists(report_path):
         log.info(f"     Отчёт сверки:        {report_path}")
 
-    pipeline_path = os.path.join(script_dir, "pipeline_report.xlsx")
+    pipeline_path = getattr(config, 'PIPELINE_REPORT_FILE',
+                            os.path.join(script_dir, "pipeline_report.xlsx"))
     if os.path.exists(pipeline_path):
         log.info(f"     Итоговый отчёт:      {pipeline_path}")
 
@@ -1013,7 +1007,7 @@ def main():
         intermediate_files = [
             getattr(cfg, 'NORMALIZED_FILE', 'clients_normalized.xlsx'),
             "verification_report.xlsx",
-            "pipeline_report.xlsx",
+            getattr(cfg, 'PIPELINE_REPORT_FILE', 'pipeline_report.xlsx'),
             getattr(cfg, 'NOT_FOUND_CLIENTS_FILE', 'clients_not_found.xlsx'),
             getattr(cfg, 'FINAL_VERIFICATION_REPORT', 'final_verification_report.xlsx'),
             "raw_results.json",
@@ -1077,11 +1071,14 @@ def main():
             spreadsheet_id = getattr(cfg, 'GSHEETS_SPREADSHEET_ID', '')
             if google_sheets and creds_path and spreadsheet_id:
                 try:
+                    # Все листы — одной выгрузкой (общие запросы на метаданные/очистку/запись)
+                    upload_sheets = {}
                     if verification_df is not None:
-                        google_sheets.upload_df(verification_df, spreadsheet_id, 'verification', creds_path)
+                        upload_sheets['verification'] = verification_df
                     if os.path.exists(cfg.OUTPUT_FILE):
-                        clients_df = pd.read_excel(cfg.OUTPUT_FILE, sheet_name='Клиенты')
-                        google_sheets.upload_df(clients_df, spreadsheet_id, 'clients', creds_path)
+                        upload_sheets['clients'] = pd.read_excel(cfg.OUTPUT_FILE, sheet_name='Клиенты')
+                    if upload_sheets:
+                        google_sheets.upload_many(upload_sheets, spreadsheet_id, creds_path)
                     log.info("  ✓ Выгружено в Google Sheets")
                 except Exception as e:
                     log.warning(f"  ⚠ Ошибка выгрузки в Google Sheets: {e}")
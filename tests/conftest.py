@@ -0,0 +1,30 @@
+"""
+Общие настройки тестов.
+
+Логи (ocr_logs/) и pipeline_report.xlsx при прогоне тестов пишутся во
+временную папку, а не в каталог проекта: config читает OCR_LOG_FOLDER и
+PIPELINE_REPORT_FILE из окружения, subprocess-прогоны наследуют его.
+Параллельные прогоны (quality_baseline --parallel-repeats) не делят файлы.
+"""
+
+import os
+import shutil
+import tempfile
+
+_OUTPUT_DIR = None
+
+
+def pytest_configure(config):
+    global _OUTPUT_DIR
+    if os.environ.get("OCR_LOG_FOLDER") and os.environ.get("PIPELINE_REPORT_FILE"):
+        return  # уже задано снаружи
+    _OUTPUT_DIR = tempfile.mkdtemp(prefix="ocr_test_outputs_")
+    os.environ["OCR_LOG_FOLDER"] = os.path.join(_OUTPUT_DIR, "ocr_logs")
+    os.environ["PIPELINE_REPORT_FILE"] = os.path.join(_OUTPUT_DIR, "pipeline_report.xlsx")
+
+
+def pytest_unconfigure(config):
+    if _OUTPUT_DIR:
+        os.environ.pop("OCR_LOG_FOLDER", None)
+        os.environ.pop("PIPELINE_REPORT_FILE", None)
+        shutil.rmtree(_OUTPUT_DIR, ignore_errors=True)
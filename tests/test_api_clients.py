@@ -0,0 +1,75 @@
+"""
+Тесты инициализации API-клиентов (init_claude_client / init_vision_client).
+
+Проверяют:
+1. Claude получает общий httpx-клиент с пулом на 2×API_MAX_WORKERS соединений.
+2. base_url из config передаётся, если задан.
+3. Vision получает gRPC-канал с keepalive-опциями.
+4. Без get_transport_class (старый SDK) — обычный клиент с credentials.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+
+def test_claude_client_shares_pool(monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    import client_card_ocr as cco
+
+    fake = SimpleNamespace(DefaultHttpxClient=httpx.Client, Anthropic=MagicMock())
+    monkeypatch.setattr(cco, "_lazy_import_anthropic", lambda: fake)
+    monkeypatch.setattr(cco.config, "API_MAX_WORKERS", 4)
+    monkeypatch.setattr(cco.config, "ANTHROPIC_BASE_URL", "http://proxy:1", raising=False)
+
+    cco.init_claude_client()
+
+    kwargs = fake.Anthropic.call_args.kwargs
+    assert kwargs["base_url"] == "http://proxy:1"
+    http_client = kwargs["http_client"]
+    assert isinstance(http_client, httpx.Client)
+    assert http_client.timeout.connect == 5.0
+    pool = http_client._transport._pool
+    assert pool._max_connections == 8
+    http_client.close()
+
+
+def _fake_vision(monkeypatch, cco, client_cls):
+    creds = object()
+    service_account = SimpleNamespace(Credentials=SimpleNamespace(
+        from_service_account_file=lambda path: creds))
+    monkeypatch.setattr(cco, "_lazy_import_service_account", lambda: service_account)
+    monkeypatch.setattr(cco, "_lazy_import_vision",
+                        lambda: SimpleNamespace(ImageAnnotatorClient=client_cls))
+    monkeypatch.setattr(cco.config, "GOOGLE_VISION_CREDENTIALS", "key.json", raising=False)
+    return creds
+
+
+def test_vision_channel_keepalive(monkeypatch):
+    import client_card_ocr as cco
+
+    transport_cls = MagicMock()
+    client_cls = MagicMock()
+    client_cls.get_transport_class.return_value = transport_cls
+    creds = _fake_vision(monkeypatch, cco, client_cls)
+
+    cco.init_vision_client()
+
+    client_cls.get_transport_class.assert_called_once_with("grpc")
+    channel_kwargs = transport_cls.create_channel.call_args.kwargs
+    assert channel_kwargs["credentials"] is creds
+    assert ("grpc.keepalive_time_ms", 30000) in channel_kwargs["options"]
+    transport_cls.assert_called_once_with(channel=transport_cls.create_channel.return_value)
+    assert client_cls.call_args.kwargs == {"transport": transport_cls.return_value}
+
+
+def test_vision_fallback_without_transport_api(monkeypatch):
+    import client_card_ocr as cco
+
+    client_cls = MagicMock(spec=["__call__"])
+    creds = _fake_vision(monkeypatch, cco, client_cls)
+
+    cco.init_vision_client()
+
+    assert client_cls.call_args.kwargs == {"credentials": creds}
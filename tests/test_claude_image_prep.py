@@ -0,0 +1,96 @@
+"""
+Тесты подготовки изображения для Claude (CardImage.claude_payload).
+
+Проверяют:
+1. Фото уменьшается до CLAUDE_MAX_IMAGE_DIM и перекодируется в JPEG.
+2. PNG с альфа-каналом конвертируется без ошибки.
+3. Файл читается один раз, сжатие считается один раз на CardImage.
+4. При наличии pyvips ресайз идёт через libvips.
+"""
+
+import base64
+import io
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _pil_backend(monkeypatch):
+    """По умолчанию тестируем PIL-путь, даже если pyvips установлен."""
+    import client_card_ocr as cco
+    monkeypatch.setitem(cco._pyvips_cache, "loaded", True)
+    monkeypatch.setitem(cco._pyvips_cache, "pyvips", None)
+
+
+def _decode(b64):
+    from PIL import Image
+    return Image.open(io.BytesIO(base64.standard_b64decode(b64)))
+
+
+def test_downscaled_to_max_dim(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+    from PIL import Image
+
+    monkeypatch.setattr(cco.config, "CLAUDE_MAX_IMAGE_DIM", 400, raising=False)
+    path = tmp_path / "big.jpg"
+    Image.new("RGB", (1200, 800), "white").save(path)
+
+    b64, media_type = cco.CardImage.load(str(path)).claude_payload()
+
+    assert media_type == "image/jpeg"
+    assert _decode(b64).size == (400, 267)
+
+
+def test_rgba_png_converted(tmp_path):
+    import client_card_ocr as cco
+    from PIL import Image
+
+    path = tmp_path / "card.png"
+    Image.new("RGBA", (100, 50), (255, 0, 0, 128)).save(path)
+
+    b64, media_type = cco.CardImage.load(str(path)).claude_payload()
+
+    assert media_type == "image/jpeg"
+    assert _decode(b64).mode == "RGB"
+
+
+def test_unreadable_image_sent_as_is(tmp_path):
+    import client_card_ocr as cco
+
+    card = cco.CardImage(str(tmp_path / "scan.png"), b"not an image")
+    b64, media_type = card.claude_payload()
+
+    assert base64.standard_b64decode(b64) == b"not an image"
+    assert media_type == "image/png"
+
+
+def test_encoded_once_per_card(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    calls = []
+    monkeypatch.setattr(cco, "_encode_for_claude", lambda card: calls.append(card) or ("b64", "image/jpeg"))
+    card = cco.CardImage(str(tmp_path / "card.jpg"), b"raw")
+
+    assert card.claude_payload() == card.claude_payload() == ("b64", "image/jpeg")
+    assert len(calls) == 1
+
+
+def test_pyvips_backend_used_when_available(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    thumb = MagicMock(width=400, height=300)
+    thumb.hasalpha.return_value = False
+    thumb.jpegsave_buffer.return_value = b"vips-jpeg"
+    fake_pyvips = SimpleNamespace(Image=MagicMock())
+    fake_pyvips.Image.thumbnail_buffer.return_value = thumb
+    monkeypatch.setitem(cco._pyvips_cache, "pyvips", fake_pyvips)
+    monkeypatch.setattr(cco.config, "CLAUDE_MAX_IMAGE_DIM", 400, raising=False)
+
+    b64, media_type = cco.CardImage(str(tmp_path / "card.jpg"), b"raw").claude_payload()
+
+    assert base64.standard_b64decode(b64) == b"vips-jpeg"
+    assert media_type == "image/jpeg"
+    args, kwargs = fake_pyvips.Image.thumbnail_buffer.call_args
+    assert args == (b"raw", 400) and kwargs["height"] == 400 and kwargs["size"] == "down"
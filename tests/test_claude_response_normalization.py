@@ -197,6 +197,24 @@ class TestClaudeResponseNormalization:
         assert "parse_mode" in result
         assert result["parse_mode"] == "strict"
 
+    def test_canonical_non_dict_data(self):
+        """Тест что data не-словарь в каноническом формате → пустые поля."""
+        payload = {"page_type": "procedure_sheet", "data": ["строка"]}
+
+        result = normalize_claude_response(payload, "", "test.jpg")
+
+        assert result["page_type"] == "procedure_sheet"
+        assert result["data"] == {}
+
+    def test_russian_key_non_dict_skipped(self):
+        """Тест что русский ключ со скаляром пропускается, берётся следующий."""
+        payload = {"медкарта": "нет", "ботокс": {"fio": "Иванова Анна"}}
+
+        result = normalize_claude_response(payload, "", "test.jpg")
+
+        assert result["page_type"] == "botox_record"
+        assert result["data"]["fio"] == "Иванова Анна"
+
 
 class TestInferPageType:
     """Тесты функции определения типа страницы."""
@@ -244,3 +262,43 @@ class TestInferPageType:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestCollectNamePhoneIin:
+    """Тесты извлечения fio/phone/iin по алиасам."""
+
+    def test_nested_alias_has_priority(self):
+        """Вложенный ('пациент', 'фио') важнее плоского fio."""
+        from client_card_ocr import collect_name_phone_iin
+
+        data = {"пациент": {"фио": "Иванов  Иван", "иин": "900101300123"}, "client_name": "Другой"}
+        result = collect_name_phone_iin(data)
+        assert result["fio"] == "Иванов Иван"
+        assert result["iin"] == "900101300123"
+
+    def test_skips_empty_and_non_scalar(self):
+        """Пустые значения, словари и списки пропускаются."""
+        from client_card_ocr import collect_name_phone_iin
+
+        data = {"patient_info": "строка", "client_name": "", "patient_name": {"x": 1},
+                "patient": "Петров Пётр", "contact": ["8701"], "contacts": "8701 123 45 67"}
+        result = collect_name_phone_iin(data)
+        assert result["fio"] == "Петров Петр"  # ё → е
+        assert result["phone"] == "8701 123 45 67"
+        assert "iin" not in result
+
+    def test_existing_fields_not_overwritten(self):
+        """setdefault: уже заполненное поле не меняется."""
+        from client_card_ocr import collect_name_phone_iin
+
+        result = collect_name_phone_iin({"fio": "Сидоров", "phone": "1", "patient_info": {"phone": "2"}})
+        assert result["fio"] == "Сидоров"
+        assert result["phone"] == "1"
+
+    def test_normalize_simple_yo_and_whitespace(self):
+        """ё/Ё → е/Е, пробельные символы схлопываются."""
+        from client_card_ocr import _normalize_simple
+
+        assert _normalize_simple("  Пётр\t\tЁлкин \n") == "Петр Елкин"
+        assert _normalize_simple(None) == ""
+        assert _normalize_simple(87011234567) == "87011234567"
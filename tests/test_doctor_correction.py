@@ -0,0 +1,104 @@
+"""
+Тесты коррекции имён врачей (correct_doctor_name).
+
+Проверяют:
+1. Точное совпадение по алиасам (имя, инициалы, сокращения).
+2. Нечёткое совпадение через rapidfuzz.process.extractOne.
+3. Без rapidfuzz: Numba-ядро (utils.fastfuzz) или difflib дают тот же результат.
+4. Результат кэшируется (lru_cache).
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Асшеман Оксана", "Асшеман Оксана"),
+    ("Оксана Асшеман", "Асшеман Оксана"),
+    ("вика", "Житникова Виктория"),
+    ("Ж.В.", "Житникова Виктория"),
+])
+def test_exact_alias_match(raw, expected):
+    import client_card_ocr as cco
+    assert cco.correct_doctor_name(raw) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Асшеман Оксан", "Асшеман Оксана"),
+    ("Житникова Вика", "Житникова Виктория"),
+    ("Шарипова Элвира", "Шарипова Эльвира"),
+])
+def test_fuzzy_match_rapidfuzz(raw, expected):
+    import client_card_ocr as cco
+    assert cco.correct_doctor_name(raw) == expected
+
+
+def test_unknown_name_returned_as_is():
+    import client_card_ocr as cco
+    assert cco.correct_doctor_name("  Кто-то Другой ") == "Кто-то Другой"
+
+
+def test_empty_name_passthrough():
+    import client_card_ocr as cco
+    assert cco.correct_doctor_name("") == ""
+    assert cco.correct_doctor_name(None) is None
+
+
+def _disable_rapidfuzz(monkeypatch, cco):
+    monkeypatch.setitem(cco._rapidfuzz_cache, "loaded", True)
+    monkeypatch.setitem(cco._rapidfuzz_cache, "fuzz", None)
+    monkeypatch.setitem(cco._rapidfuzz_cache, "process", None)
+
+
+def test_difflib_fallback_same_result(monkeypatch):
+    import client_card_ocr as cco
+
+    _disable_rapidfuzz(monkeypatch, cco)
+    monkeypatch.setitem(cco._fastfuzz_cache, "loaded", True)
+    monkeypatch.setitem(cco._fastfuzz_cache, "module", None)
+    cco.correct_doctor_name.cache_clear()
+
+    assert cco.correct_doctor_name("Асшеман Оксан") == "Асшеман Оксана"
+    assert cco.correct_doctor_name("Кто-то Другой") == "Кто-то Другой"
+    cco.correct_doctor_name.cache_clear()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Асшеман Оксан", "Асшеман Оксана"),
+    ("Житникова Вика", "Житникова Виктория"),
+    ("Шарипова Элвира", "Шарипова Эльвира"),
+    ("Кто-то Другой", "Кто-то Другой"),
+])
+def test_numba_fallback_same_result(monkeypatch, raw, expected):
+    pytest.importorskip("numba")
+    import client_card_ocr as cco
+
+    _disable_rapidfuzz(monkeypatch, cco)
+    monkeypatch.setitem(cco._fastfuzz_cache, "loaded", False)
+    cco.correct_doctor_name.cache_clear()
+
+    assert cco.correct_doctor_name(raw) == expected
+    assert cco._fastfuzz_cache["module"] is not None
+    cco.correct_doctor_name.cache_clear()
+
+
+def test_fastfuzz_kernel_matches_rapidfuzz():
+    pytest.importorskip("numba")
+    from rapidfuzz import fuzz
+    from utils import fastfuzz
+
+    pairs = [("асшеман оксан", "асшеман оксана"), ("вика житникова", "житникова виктория"),
+             ("", ""), ("", "рада"), ("ё ж", "ж ё"), ("abc", "xyz")]
+    for a, b in pairs:
+        score = fastfuzz.indel_ratio(fastfuzz.encode(fastfuzz.token_sort_key(a)),
+                                     fastfuzz.encode(fastfuzz.token_sort_key(b)))
+        assert score == pytest.approx(fuzz.token_sort_ratio(a, b) / 100)
+
+
+def test_result_is_memoized():
+    import client_card_ocr as cco
+
+    cco.correct_doctor_name.cache_clear()
+    cco.correct_doctor_name("Асшеман Оксан")
+    cco.correct_doctor_name("Асшеман Оксан")
+    info = cco.correct_doctor_name.cache_info()
+    assert info.hits == 1 and info.misses == 1
@@ -0,0 +1,185 @@
+"""
+Тесты записи clients_database.xlsx (write_to_excel).
+
+Проверяют:
+1. Новая книга пишется целиком: 6 листов, заголовки и строки на месте.
+2. Стили заголовка и ячеек, жёлтая заливка для нераспознанных.
+3. Ширины колонок и автофильтр выставлены.
+4. Всё это — одинаково для xlsxwriter (constant_memory) и openpyxl write-only.
+5. Дозапись: новые клиенты и их страницы дописываются под старыми строками со стилями.
+6. Если дозапись упала, при пересоздании файла строки клиентов не собираются заново.
+7. Без новых клиентов книга читается только в read-only режиме и не пересохраняется.
+8. openpyxl сохраняет книгу с уровнем сжатия ZIP из config.EXCEL_COMPRESSLEVEL.
+"""
+
+import openpyxl
+import pytest
+
+
+@pytest.fixture
+def grouped_clients():
+    return {
+        "иванов иван": {
+            "name": "Иванов Иван", "phone": "87011234567", "iin": "",
+            "pages": [
+                {"filename": "a.jpg", "page_type": "medical_card_front",
+                 "data": {"fio": "Иванов Иван", "birth_date": "01.01.1990"}, "ocr_text": "лицевая"},
+                {"filename": "b.jpg", "page_type": "procedure_sheet",
+                 "data": {"procedures": [
+                     {"date": "01.02.2024", "procedure_name": "Чистка", "cost": "5000"},
+                     {"date": "05.03.2024", "procedure_name": "Пилинг", "cost": "8000"},
+                 ]}, "ocr_text": "процедуры"},
+            ],
+        },
+        "_unmatched": {
+            "name": "НЕ ОПРЕДЕЛЕНО", "phone": "", "iin": "",
+            "pages": [{"filename": "c.jpg", "page_type": "unknown", "data": {}, "ocr_text": ""}],
+        },
+    }
+
+
+@pytest.fixture(params=["openpyxl", "xlsxwriter"])
+def backend(request, monkeypatch):
+    import client_card_ocr as cco
+
+    if request.param == "xlsxwriter":
+        module = pytest.importorskip("xlsxwriter")
+    else:
+        module = None
+    monkeypatch.setitem(cco._xlsxwriter_cache, "loaded", True)
+    monkeypatch.setitem(cco._xlsxwriter_cache, "xlsxwriter", module)
+    return request.param
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch, grouped_clients, backend):
+    import client_card_ocr as cco
+
+    out = tmp_path / "clients.xlsx"
+    monkeypatch.setattr(cco.config, "OUTPUT_FILE", str(out))
+    cco.write_to_excel(grouped_clients, [])
+    return openpyxl.load_workbook(out)
+
+
+def test_sheets_and_rows(workbook):
+    assert workbook.sheetnames == [
+        "Клиенты", "Мед_данные", "Процедуры", "Покупки", "Комплексы", "Ботокс",
+    ]
+    ws = workbook["Клиенты"]
+    assert ws.max_row == 3
+    assert ws["D1"].value == "ФИО"
+    assert {ws["A2"].value, ws["A3"].value} == {"???", "CL-0002"}
+
+    procs = workbook["Процедуры"]
+    assert [c.value for c in procs[3]][3] == "Пилинг"
+    assert workbook["Ботокс"].max_row == 1
+
+
+def test_styles_applied(workbook):
+    ws = workbook["Клиенты"]
+    assert ws["A1"].font.b
+    assert ws["A1"].fill.fgColor.rgb.endswith("2F5496")
+
+    rows = {ws.cell(row=r, column=1).value: r for r in (2, 3)}
+    assert ws.cell(row=rows["???"], column=4).fill.fgColor.rgb.endswith("FFF2CC")
+    assert ws.cell(row=rows["CL-0002"], column=4).fill.fill_type is None
+    assert ws.cell(row=rows["CL-0002"], column=4).border.left.style == "thin"
+
+
+def test_widths_and_filter(workbook, backend):
+    # xlsxwriter дописывает к ширине поправку на отступы ячейки (< 1 символа)
+    def width(expected):
+        return expected if backend == "openpyxl" else pytest.approx(expected, abs=1)
+
+    ws = workbook["Процедуры"]
+    assert ws.auto_filter.ref == "A1:F3"
+    assert ws.column_dimensions["A"].width == width(12)
+    assert workbook["Клиенты"].column_dimensions["U"].width == width(len("Файлы-источники") + 2)
+    # OCR-колонки не сканируются — сразу максимальная ширина
+    assert workbook["Клиенты"].column_dimensions["V"].width == width(50)
+
+
+def test_append_new_clients(workbook, tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    new = {"петрова анна": {
+        "name": "Петрова Анна", "phone": "", "iin": "",
+        "pages": [{"filename": "d.jpg", "page_type": "procedure_sheet", "ocr_text": "новая",
+                   "data": {"procedures": [{"date": "10.04.2024", "procedure_name": "Массаж"}]}}],
+    }}
+    monkeypatch.setattr(cco.config, "OUTPUT_FILE", str(tmp_path / "clients.xlsx"))
+    cco.write_to_excel(new, [])
+
+    wb = openpyxl.load_workbook(tmp_path / "clients.xlsx")
+    ws = wb["Клиенты"]
+    assert ws.max_row == 4
+    assert [ws.cell(row=4, column=c).value for c in (1, 4)] == ["CL-0003", "Петрова Анна"]
+    assert ws.cell(row=4, column=30).border.left.style == "thin"
+    assert ws.cell(row=4, column=4).fill.fill_type is None
+    procs = wb["Процедуры"]
+    assert [c.value for c in procs[4]][:4] == ["CL-0003", "Петрова Анна", "10.04.2024", "Массаж"]
+    assert procs.cell(row=4, column=6).alignment.wrap_text
+
+
+def test_failed_append_reuses_client_rows(tmp_path, monkeypatch, grouped_clients):
+    import client_card_ocr as cco
+
+    out = tmp_path / "clients.xlsx"
+    monkeypatch.setattr(cco.config, "OUTPUT_FILE", str(out))
+    wb = openpyxl.Workbook()  # существующая книга, в которую дозапись упадёт
+    wb.active.title = "Клиенты"
+    wb.active.append(["ID", "Файлы-источники"])
+    wb.save(out)
+
+    def broken_append(*args, **kwargs):
+        raise OSError("диск переполнен")
+
+    calls = []
+    real_collect = cco.collect_ocr_texts
+    monkeypatch.setattr(cco, "collect_ocr_texts", lambda pages: calls.append(1) or real_collect(pages))
+    monkeypatch.setattr(cco, "_append_styled_row", broken_append)
+
+    cco.write_to_excel(grouped_clients, [])
+
+    # «_unmatched» собран при дозаписи и взят из кэша, «иванов иван» — один раз при пересоздании
+    assert len(calls) == 2
+    ws = openpyxl.load_workbook(out)["Клиенты"]
+    assert ws.max_row == 3
+
+
+def test_no_new_clients_reads_only(workbook, tmp_path, monkeypatch, grouped_clients):
+    import client_card_ocr as cco
+
+    out = tmp_path / "clients.xlsx"
+    monkeypatch.setattr(cco.config, "OUTPUT_FILE", str(out))
+    modes = []
+    real_load = openpyxl.load_workbook
+    monkeypatch.setattr(openpyxl, "load_workbook",
+                        lambda *a, **kw: modes.append(kw.get("read_only", False)) or real_load(*a, **kw))
+    mtime = out.stat().st_mtime_ns
+
+    cco.write_to_excel(grouped_clients, [])
+
+    assert modes == [True]
+    assert out.stat().st_mtime_ns == mtime
+
+
+@pytest.mark.parametrize("level", [0, 9])
+def test_openpyxl_compresslevel(tmp_path, monkeypatch, grouped_clients, level):
+    import zipfile
+    import client_card_ocr as cco
+
+    out = tmp_path / "clients.xlsx"
+    monkeypatch.setattr(cco.config, "OUTPUT_FILE", str(out))
+    monkeypatch.setattr(cco.config, "EXCEL_COMPRESSLEVEL", level, raising=False)
+    monkeypatch.setitem(cco._xlsxwriter_cache, "loaded", True)
+    monkeypatch.setitem(cco._xlsxwriter_cache, "xlsxwriter", None)
+
+    cco.write_to_excel(grouped_clients, [])
+
+    with zipfile.ZipFile(out) as zf:
+        info = zf.getinfo("xl/worksheets/sheet1.xml")
+    assert info.compress_type == zipfile.ZIP_DEFLATED
+    # уровень 0 — deflate без сжатия, 9 — XML листа сжимается в разы
+    assert (info.compress_size >= info.file_size) == (level == 0)
+    assert openpyxl.load_workbook(out)["Клиенты"].max_row == 3
@@ -0,0 +1,32 @@
+"""
+Тесты хэширования содержимого файла (_file_md5).
+
+Проверяют совпадение с hashlib.md5 для mmap-пути, блочного чтения
+и пустого файла; отсутствующий файл → пустая строка.
+"""
+
+import hashlib
+
+
+def test_mmap_and_chunked_paths(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    data = bytes(range(256)) * 5000
+    path = tmp_path / "card.jpg"
+    path.write_bytes(data)
+    expected = hashlib.md5(data).hexdigest()
+
+    assert cco._file_md5(str(path)) == expected
+
+    monkeypatch.setattr(cco, "_MD5_MMAP_LIMIT", 1024)
+    monkeypatch.setattr(cco, "_MD5_CHUNK", 4096)
+    assert cco._file_md5(str(path)) == expected
+
+
+def test_empty_and_missing(tmp_path):
+    import client_card_ocr as cco
+
+    empty = tmp_path / "empty.jpg"
+    empty.write_bytes(b"")
+    assert cco._file_md5(str(empty)) == hashlib.md5(b"").hexdigest()
+    assert cco._file_md5(str(tmp_path / "nope.jpg")) == ""
@@ -0,0 +1,266 @@
+"""
+Тесты батчей финальной верификации (final_verification.batch_verify_clients).
+
+Проверяют:
+1. Батчи уходят в Claude параллельно, результаты — в порядке батчей.
+2. 429 от Claude: пауза на весь пул и повтор того же батча.
+3. Прочая ошибка — «Ошибка верификации» для всех клиентов батча, без повторов.
+4. Выборка БД (самые частые клиенты) собирается один раз и уходит в кэшируемый
+   системный блок, а не в каждый батч.
+5. Message Batches API: один пакет, результаты по custom_id в порядке батчей,
+   неуспешные батчи — «Ошибка верификации»; пакет не создан — обычные запросы;
+   по таймауту пакет отменяется, готовые до отмены ответы сохраняются.
+6. Найденные в БД с совпадением ≥ AUTO_CONFIRM_THRESHOLD подтверждаются без Claude.
+"""
+
+import json
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+
+log = logging.getLogger("test")
+
+
+def _config(**overrides):
+    values = dict(CLAUDE_MODEL="test-model", API_RPS=0, VERIFICATION_MAX_WORKERS=4, MAX_RETRIES=2)
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _df(n):
+    return pd.DataFrame({"OCR_ФИО": [f"Клиент {i}" for i in range(n)],
+                         "Статус": ["Не найден"] * n}, index=range(10, 10 + n))
+
+
+def _ids_in(message):
+    payload = message[message.index("{"):message.rindex("}") + 1]
+    return [c["client_id"] for c in json.loads(payload)["clients"]]
+
+
+def _reply(ids):
+    text = json.dumps({"clients": [{"client_id": i, "final_status": "Подтверждён"} for i in ids]})
+    return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class _Client:
+    def __init__(self, create):
+        self.messages = SimpleNamespace(create=create)
+
+
+def test_batches_parallel_in_order():
+    from final_verification import batch_verify_clients
+
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def create(**kwargs):
+        ids = _ids_in(kwargs["messages"][0]["content"])
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05 if ids[0] == "10" else 0.01)  # первый батч отвечает последним
+        with lock:
+            active[0] -= 1
+        return _reply(ids)
+
+    results = batch_verify_clients(log, _config(), _Client(create), _df(7), {}, {}, batch_size=2)
+
+    assert [r["client_id"] for r in results] == [str(i) for i in range(10, 17)]
+    assert peak[0] > 1
+
+
+class _RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"}, status_code=429)
+
+
+def test_rate_limit_pauses_and_retries(monkeypatch):
+    import final_verification
+    from utils.rate_limit import RateLimiter
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise _RateLimited("429")
+        return _reply(_ids_in(kwargs["messages"][0]["content"]))
+
+    paused = []
+    monkeypatch.setattr(RateLimiter, "pause", lambda self, seconds: paused.append(seconds))
+    sleeps = []
+    monkeypatch.setattr(final_verification.time, "sleep", sleeps.append)
+
+    results = final_verification.batch_verify_clients(
+        log, _config(VERIFICATION_MAX_WORKERS=1), _Client(create), _df(2), {}, {}, batch_size=5)
+
+    assert len(calls) == 2 and paused == [2] and sleeps == []
+    assert [r["final_status"] for r in results] == ["Подтверждён"] * 2
+
+
+def test_other_error_marks_batch_failed():
+    from final_verification import batch_verify_clients
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        raise ValueError("bad request")
+
+    results = batch_verify_clients(log, _config(), _Client(create), _df(3), {}, {}, batch_size=2)
+
+    assert len(calls) == 2
+    assert [r["client_id"] for r in results] == ["10", "11", "12"]
+    assert {r["final_status"] for r in results} == {"Ошибка верификации"}
+
+
+def test_db_sample_built_once_and_cached(monkeypatch):
+    import final_verification
+
+    db_index = {f"клиент {i}": {"name_orig": f"Клиент {i}", "phone": str(i), "total_visits": i,
+                                "doctors": ["А", "Б", "В", "Г"]} for i in range(300)}
+    samples = []
+    real_sample = final_verification.prepare_db_sample
+    monkeypatch.setattr(final_verification, "prepare_db_sample",
+                        lambda *a, **kw: samples.append(1) or real_sample(*a, **kw))
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return _reply(_ids_in(kwargs["messages"][0]["content"]))
+
+    final_verification.batch_verify_clients(log, _config(), _Client(create), _df(5), {}, db_index,
+                                            batch_size=2)
+
+    assert len(requests) == 3 and samples == [1]
+    system = requests[0]["system"]
+    assert all(r["system"] is system for r in requests)
+    assert system[0]["text"] == final_verification.CLAUDE_VERIFICATION_PROMPT
+    assert system[-1]["cache_control"] == {"type": "ephemeral"}
+    assert "db_clients_sample" not in requests[0]["messages"][0]["content"]
+
+    sample = real_sample(db_index)
+    assert len(sample) == final_verification.DB_SAMPLE_LIMIT
+    # самые частые клиенты БД — первыми
+    assert sample[0] == {"fio": "Клиент 299", "phone": "299", "visits": 299, "doctors": "А, Б, В"}
+    assert [c["visits"] for c in sample] == list(range(299, 99, -1))
+
+
+class _Batches:
+    """Заглушка messages.batches: пакет завершается со второго опроса."""
+
+    def __init__(self, fail_create=False):
+        self.fail_create = fail_create
+        self.requests = None
+        self.polls = 0
+        self.canceled = False
+
+    def create(self, requests):
+        import anthropic
+        if self.fail_create:
+            raise anthropic.APIConnectionError(request=None)
+        self.requests = requests
+        return SimpleNamespace(id="msgbatch_1", processing_status="in_progress")
+
+    def retrieve(self, batch_id):
+        self.polls += 1
+        return SimpleNamespace(id=batch_id, processing_status="ended" if self.polls > 1 else "in_progress")
+
+    def cancel(self, batch_id):
+        self.canceled = True
+
+    def results(self, batch_id):
+        items = []
+        for req in reversed(self.requests):  # ответы пакета приходят в произвольном порядке
+            if req["custom_id"] == "batch_2":
+                result = SimpleNamespace(type="errored")
+            else:
+                ids = _ids_in(req["params"]["messages"][0]["content"])
+                result = SimpleNamespace(type="succeeded", message=_reply(ids))
+            items.append(SimpleNamespace(custom_id=req["custom_id"], result=result))
+        return items
+
+
+def test_message_batches_api(monkeypatch):
+    import final_verification
+
+    monkeypatch.setattr(final_verification.time, "sleep", lambda s: None)
+    def create(**kwargs):
+        raise AssertionError("при пакетном режиме обычных запросов нет")
+
+    batches = _Batches()
+    client = _Client(create)
+    client.messages.batches = batches
+
+    results = final_verification.batch_verify_clients(
+        log, _config(USE_MESSAGE_BATCHES_API=True), client, _df(5), {}, {}, batch_size=2)
+
+    assert len(batches.requests) == 3 and batches.polls == 2
+    assert batches.requests[0]["params"]["system"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert [r["client_id"] for r in results] == ["10", "11", "12", "13", "14"]
+    assert [r["final_status"] for r in results] == (
+        ["Подтверждён"] * 2 + ["Ошибка верификации"] * 2 + ["Подтверждён"])
+
+
+def test_message_batches_timeout_keeps_finished(monkeypatch):
+    import final_verification
+
+    sleeps = []
+    monkeypatch.setattr(final_verification.time, "sleep", sleeps.append)
+    batches = _Batches()
+    client = _Client(None)
+    client.messages.batches = batches
+
+    results = final_verification.batch_verify_clients(
+        log, _config(USE_MESSAGE_BATCHES_API=True, MESSAGE_BATCHES_TIMEOUT=0), client, _df(5), {}, {},
+        batch_size=2)
+
+    assert batches.canceled and batches.polls == 2 and len(sleeps) == 1
+    assert [r["final_status"] for r in results] == (
+        ["Подтверждён"] * 2 + ["Ошибка верификации"] * 2 + ["Подтверждён"])
+
+
+def test_message_batches_unavailable_falls_back():
+    import final_verification
+
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        return _reply(_ids_in(kwargs["messages"][0]["content"]))
+
+    client = _Client(create)
+    client.messages.batches = _Batches(fail_create=True)
+
+    results = final_verification.batch_verify_clients(
+        log, _config(USE_MESSAGE_BATCHES_API=True), client, _df(3), {}, {}, batch_size=2)
+
+    assert len(calls) == 2
+    assert [r["final_status"] for r in results] == ["Подтверждён"] * 3
+
+
+def test_confident_matches_skip_claude(tmp_path):
+    from final_verification import run_final_claude_verification
+
+    df = pd.DataFrame({
+        "OCR_ФИО": ["А", "Б", "В", "Г"],
+        "Статус_БД": ["Найден в БД", "Найден в БД", "Возможное совпадение в БД", "Найден в БД"],
+        "Совпадение_%": [97.0, 80.0, 99.0, 95.0],
+    }, index=[3, 4, 5, 6])
+    sent = []
+
+    def create(**kwargs):
+        ids = _ids_in(kwargs["messages"][0]["content"])
+        sent.extend(ids)
+        return _reply(ids)
+
+    config = _config(AUTO_CONFIRM_THRESHOLD=95, STATUS_DB_FOUND="Найден в БД",
+                     FINAL_VERIFICATION_REPORT=str(tmp_path / "report.xlsx"))
+    enhanced, _ = run_final_claude_verification(log, config, _Client(create), df, {"x": 1}, {})
+
+    assert sent == ["4", "5"]
+    assert list(enhanced["Claude_Статус"]) == ["Подтверждён"] * 4
+    assert list(enhanced["Claude_Совпадение_%"]) == [97.0, 0.0, 0.0, 95.0]
@@ -53,18 +53,16 @@ def _run_upload_block(cfg, verification_df, log):
             spreadsheet_id = getattr(cfg, 'GSHEETS_SPREADSHEET_ID', '')
             if google_sheets and creds_path and spreadsheet_id:
                 try:
+                    upload_sheets = {}
                     if verification_df is not None:
-                        google_sheets.upload_df(
-                            verification_df, spreadsheet_id,
-                            'verification', creds_path,
-                        )
+                        upload_sheets['verification'] = verification_df
                     if os.path.exists(cfg.OUTPUT_FILE):
-                        clients_df = pd.read_excel(
+                        upload_sheets['clients'] = pd.read_excel(
                             cfg.OUTPUT_FILE, sheet_name='Клиенты',
                         )
-                        google_sheets.upload_df(
-                            clients_df, spreadsheet_id,
-                            'clients', creds_path,
+                    if upload_sheets:
+                        google_sheets.upload_many(
+                            upload_sheets, spreadsheet_id, creds_path,
                         )
                     log.info("  ✓ Выгружено в Google Sheets")
                 except Exception as e:
@@ -80,7 +78,7 @@ def _run_upload_block(cfg, verification_df, log):
 class TestGSheetsUploadEnabled:
     """Тесты: upload вызывается когда всё настроено."""
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_called_with_enabled_and_creds(self, mock_upload):
         """При GSHEETS_UPLOAD_ENABLED=True + creds + id → upload вызывается."""
         mock_upload.return_value = True
@@ -98,13 +96,13 @@ class TestGSheetsUploadEnabled:
         _run_upload_block(cfg, verification_df, log)
 
         mock_upload.assert_called_once_with(
-            verification_df, "fake-spreadsheet-id", "verification",
+            {"verification": verification_df}, "fake-spreadsheet-id",
             "/fake/creds.json",
         )
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_called_for_both_sheets(self, mock_upload):
-        """Если clients_database.xlsx существует — upload вызывается дважды."""
+        """Если clients_database.xlsx существует — оба листа в одной выгрузке."""
         import tempfile
         mock_upload.return_value = True
 
@@ -126,7 +124,10 @@ class TestGSheetsUploadEnabled:
 
             _run_upload_block(cfg, verification_df, log)
 
-            assert mock_upload.call_count == 2
+            mock_upload.assert_called_once()
+            sheets = mock_upload.call_args[0][0]
+            assert list(sheets) == ["verification", "clients"]
+            assert list(sheets["clients"].columns) == ["ФИО", "Телефон"]
             log.info.assert_called()
         finally:
             os.remove(tmp_path)
@@ -135,7 +136,7 @@ class TestGSheetsUploadEnabled:
 class TestGSheetsUploadDisabled:
     """Тесты: upload НЕ вызывается при выключенном флаге или пустых параметрах."""
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_not_called_when_disabled(self, mock_upload):
         """GSHEETS_UPLOAD_ENABLED=False → upload НЕ вызывается."""
         cfg = _make_config(
@@ -150,7 +151,7 @@ class TestGSheetsUploadDisabled:
         mock_upload.assert_not_called()
         log.warning.assert_called()  # Должен быть warning о выключенной выгрузке
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_not_called_when_no_creds(self, mock_upload):
         """GSHEETS_CREDENTIALS пустой → upload НЕ вызывается."""
         cfg = _make_config(
@@ -164,7 +165,7 @@ class TestGSheetsUploadDisabled:
 
         mock_upload.assert_not_called()
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_not_called_when_no_spreadsheet_id(self, mock_upload):
         """GSHEETS_SPREADSHEET_ID пустой → upload НЕ вызывается."""
         cfg = _make_config(
@@ -178,7 +179,7 @@ class TestGSheetsUploadDisabled:
 
         mock_upload.assert_not_called()
 
-    @patch('google_sheets.upload_df')
+    @patch('google_sheets.upload_many')
     def test_upload_not_called_when_both_empty(self, mock_upload):
         """Оба параметра пустые → upload НЕ вызывается."""
         cfg = _make_config(
@@ -196,9 +197,9 @@ class TestGSheetsUploadDisabled:
 class TestGSheetsUploadErrorHandling:
     """Тесты: ошибки выгрузки НЕ роняют пайплайн."""
 
-    @patch('google_sheets.upload_df', side_effect=Exception("API error"))
+    @patch('google_sheets.upload_many', side_effect=Exception("API error"))
     def test_upload_error_only_warns(self, mock_upload):
-        """Ошибка upload_df → только warning, без исключения."""
+        """Ошибка upload_many → только warning, без исключения."""
         cfg = _make_config(
             GSHEETS_UPLOAD_ENABLED=True,
             GSHEETS_CREDENTIALS="/fake/creds.json",
@@ -16,7 +16,7 @@ def build_result(filename, page_type, data, ocr_text="TEXT"):
 def test_grouping_aliases_and_unknown_texts(monkeypatch):
     import client_card_ocr as cco
 
-    # Отключаем rapidfuzz, чтобы использовался SequenceMatcher
+    # Отключаем rapidfuzz, чтобы использовался запасной путь (Numba или difflib)
     monkeypatch.setitem(cco._rapidfuzz_cache, "loaded", True)
     monkeypatch.setitem(cco._rapidfuzz_cache, "fuzz", None)
     monkeypatch.setattr(cco.config, "FUZZY_NAME_THRESHOLD", 0.7, raising=False)
@@ -111,3 +111,241 @@ def test_dedup_not_applied_to_unmatched(monkeypatch):
     assert len(res["_unmatched"]["pages"]) == 2
     # client_1 должен быть дедуплицирован до 1
     assert len(res["client_1"]["pages"]) == 1
+
+
+def test_cdist_grouping_matches_pairwise(monkeypatch):
+    """Группировка через матрицу cdist совпадает с попарным fuzzy_match."""
+    import random
+    import client_card_ocr as cco
+
+    rng = random.Random(7)
+    surnames = ["Иванова", "Иванов", "Петрова", "Сидоренко", "Капленко", "Ахметова"]
+    names = ["Анна", "Алина", "Карина", "Дана", "Айгерим"]
+    page_types = ["medical_card_front", "procedure_sheet", "products_list", "botox_record"]
+    results = []
+    for i in range(60):
+        fio = f"{rng.choice(surnames)} {rng.choice(names)}"
+        if rng.random() < 0.3:
+            fio = fio[:-1]  # опечатка OCR
+        if rng.random() < 0.3:
+            fio = " ".join(reversed(fio.split()))
+        data = {"fio": fio}
+        if rng.random() < 0.2:
+            data["phone"] = f"8701{rng.randint(0, 3):07d}"
+        results.append(build_result(f"{i}.jpg", rng.choice(page_types), data))
+
+    def grouping():
+        grouped = cco.group_by_client(results)
+        return {k: [p["filename"] for p in v["pages"]] for k, v in grouped.items()}
+
+    with_matrix = grouping()
+    monkeypatch.setattr(cco, "_fio_matcher", lambda fios, threshold: None)
+    assert grouping() == with_matrix
+
+
+def test_fallback_similarity_matches_rapidfuzz(monkeypatch):
+    """Без rapidfuzz fuzzy_match/text_similarity через Numba дают те же баллы."""
+    import pytest
+    pytest.importorskip("numba")
+    import client_card_ocr as cco
+
+    pairs = [("Иванова Анна", "Анна Иванов"), ("Капленко Карина", "Каплено Карина"),
+             ("Петрова Дана", "Ахметова Айгерим")]
+    texts = [("Процедурный лист\nЧистка 5000", "процедурный  лист чистка 500")]
+    expected = [cco.fuzzy_match(a, b) for a, b in pairs] + [cco.text_similarity(a, b) for a, b in texts]
+
+    monkeypatch.setitem(cco._rapidfuzz_cache, "loaded", True)
+    monkeypatch.setitem(cco._rapidfuzz_cache, "fuzz", None)
+    monkeypatch.setitem(cco._fastfuzz_cache, "loaded", False)
+    actual = [cco.fuzzy_match(a, b) for a, b in pairs] + [cco.text_similarity(a, b) for a, b in texts]
+
+    assert cco._fastfuzz_cache["module"] is not None
+    assert actual == pytest.approx(expected)
+
+
+def test_fio_matcher_blocks_match_pairwise(monkeypatch):
+    """Совпадения ФИО, посчитанные блоками cdist, совпадают с попарным fuzzy_match."""
+    import client_card_ocr as cco
+
+    fios = [cco.normalize_name(f) for f in [
+        "Иванова Анна", "Анна Иванов", "Капленко Карина", "Каплено Карина",
+        "Петрова Дана", "Ахметова Айгерим", "Ахметов Айгерим", "Дана Петрова",
+        "Сидоренко Алина", "Сидоренко Алина", "Иванов Иван",
+    ]]
+    monkeypatch.setattr(cco, "_FIO_MATRIX_BLOCK", 4)
+    matcher = cco._fio_matcher(fios, 0.75)
+    founders = [0, 2, 3, 5, 8]  # в блоках до текущего и внутри него
+
+    actual, expected = [], []
+    for pos in range(len(fios)):
+        if pos in founders:
+            matcher.add_founder(pos)
+        for f in founders:
+            if f <= pos:
+                actual.append(matcher.matches(pos, f))
+                expected.append(cco.fuzzy_match(fios[pos], fios[f]) >= 0.75)
+
+    assert actual == expected
+    assert matcher._block[2].shape == (3, 4)  # последний блок × основатели до него
+
+
+def test_phone_filled_later_is_indexed(monkeypatch):
+    """Телефон, дописанный клиенту позже, участвует в следующих сопоставлениях."""
+    import client_card_ocr as cco
+
+    monkeypatch.setattr(cco.config, "FUZZY_NAME_THRESHOLD", 0.9, raising=False)
+    results = [
+        build_result("front.jpg", "medical_card_front", {"fio": "Иванова Анна"}),
+        build_result("proc.jpg", "procedure_sheet",
+                     {"fio": "Иванова Анна", "phone": "+7 701-123-45-67"}),
+        build_result("prod.jpg", "products_list",
+                     {"fio": "Совсем Другая", "phone": "87011234567"}),
+    ]
+
+    grouped = cco.group_by_client(results)
+
+    assert len(grouped) == 1
+    assert len(grouped["client_1"]["pages"]) == 3
+
+
+def test_find_matching_client_index_equivalent():
+    """С ведущимся ClientIndex результат тот же, что при построении на лету."""
+    import client_card_ocr as cco
+
+    clients = {
+        "client_1": {"name": "Иванова Анна", "phone": "", "iin": "900101 300123"},
+        "client_2": {"name": "Петрова Дана", "phone": "+7 (701) 555-00-11", "iin": ""},
+    }
+    index = cco.ClientIndex.from_clients(clients)
+    queries = [
+        {"fio": "", "phone": "", "iin": "900101300123"},
+        {"fio": "", "phone": "8 701 555 00 11", "iin": ""},
+        {"fio": "Анна Иванов", "phone": "", "iin": ""},
+        {"fio": "Кто-то Ещё", "phone": "123", "iin": ""},
+    ]
+    for ids in queries:
+        assert (cco.find_matching_client(ids, clients, 0.8, index=index)
+                == cco.find_matching_client(ids, clients, 0.8))
+    assert [cco.find_matching_client(q, clients, 0.8, index=index) for q in queries] == [
+        "client_1", "client_2", "client_1", None,
+    ]
+
+
+def test_text_duplicate_matrix_matches_pairwise():
+    """Матрица сходства OCR-текстов (cdist) совпадает с попарным text_similarity."""
+    import client_card_ocr as cco
+
+    texts = [
+        "Процедурный лист\nЧистка лица 15000", "процедурный  лист чистка лица 15000",
+        "Процедурный лист чистка лица 1500", "Ботокс Диспорт лоб 50 ед",
+        "", "   ", "Совсем другой текст карточки",
+    ]
+    matrix = cco._text_duplicate_matrix(texts, 0.9)
+
+    expected = [[bool(a and b) and cco.text_similarity(a, b) >= 0.9 for b in texts]
+                for a in texts]
+    assert matrix.tolist() == expected
+
+
+def test_exact_iin_beats_earlier_fuzzy_name():
+    """Точный ИИН находит клиента через индекс, даже если раньше есть похожее ФИО."""
+    import client_card_ocr as cco
+
+    clients = {
+        "client_1": {"name": "Иванова Анна", "phone": "", "iin": ""},
+        "client_2": {"name": "Иванова Анна Сергеевна", "phone": "87015550011", "iin": "900101300123"},
+    }
+    index = cco.ClientIndex.from_clients(clients)
+
+    by_iin = {"fio": "Иванова Анна", "phone": "", "iin": "900101 300123"}
+    by_phone = {"fio": "Иванова Анна", "phone": "+7 701 555 00 11", "iin": ""}
+    assert cco.find_matching_client(by_iin, clients, 0.8, index=index) == "client_2"
+    assert cco.find_matching_client(by_phone, clients, 0.8, index=index) == "client_2"
+    assert cco.find_matching_client({"fio": "Иванова Анна", "phone": "", "iin": ""},
+                                    clients, 0.8, index=index) == "client_1"
+
+
+def test_text_similarity_cutoff_keeps_decision(monkeypatch):
+    """score_cutoff не меняет решение «дубль/не дубль» ни в одном бэкенде."""
+    import client_card_ocr as cco
+
+    texts = [
+        "Процедурный лист\nЧистка лица 15000", "процедурный  лист чистка лица 15000",
+        "Процедурный лист чистка лица 1500", "Процедурный лист", "abcdefghij", "abcdefghi",
+        "Ботокс Диспорт лоб 50 ед", "x" * 400, "",
+    ]
+    pairs = [(a, b) for a in texts for b in texts]
+
+    def decisions(threshold):
+        return [(cco.text_similarity(a, b) >= threshold,
+                 cco.text_similarity(a, b, threshold) >= threshold) for a, b in pairs]
+
+    # 18/19 — ровно сходство пары длиной 10 и 9 (граница оценки 2·min/(len1+len2))
+    for threshold in (0.9, 0.95, 18 / 19):
+        assert all(plain == cut for plain, cut in decisions(threshold))
+        monkeypatch.setitem(cco._rapidfuzz_cache, "loaded", True)
+        monkeypatch.setitem(cco._rapidfuzz_cache, "fuzz", None)
+        monkeypatch.setitem(cco._fastfuzz_cache, "loaded", True)
+        monkeypatch.setitem(cco._fastfuzz_cache, "module", None)
+        assert all(plain == cut for plain, cut in decisions(threshold))
+        monkeypatch.undo()
+
+    # сильно разная длина — 0.0 без вызова метрики
+    monkeypatch.setattr(cco, "_lazy_import_rapidfuzz", lambda: 1 / 0)
+    assert cco._indel_similarity("ab", "x" * 400, 0.9) == 0.0
+
+
+def test_dedup_same_type_and_data():
+    """Проверка 3: тот же тип и данные (порядок ключей не важен) — дубль; unknown — нет."""
+    import client_card_ocr as cco
+
+    def page(name, page_type, data, text):
+        return {"filename": name, "page_type": page_type, "data": data, "ocr_text": text}
+
+    grouped = {"client_1": {"name": "А", "pages": [
+        page("a.jpg", "botox_record", {"drug": "Диспорт", "units": "50"}, "первый текст"),
+        page("b.jpg", "botox_record", {"units": "50", "drug": "Диспорт"}, "совсем другое длиннее"),
+        page("c.jpg", "unknown", {}, "ещё одна страница"),
+        page("d.jpg", "unknown", {}, "и последняя, отличная"),
+        page("e.jpg", "procedure_sheet", {"drug": "Диспорт", "units": "50"}, "процедуры"),
+    ]}}
+
+    cco.deduplicate_pages(grouped)
+
+    assert [p["filename"] for p in grouped["client_1"]["pages"]] == ["b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+
+
+def test_fuzzy_match_cutoff_keeps_decision():
+    """fuzzy_match с score_cutoff: то же решение по порогу, ниже порога — 0.0 или точный балл."""
+    import client_card_ocr as cco
+
+    names = ["Иванова Анна", "Анна Иванов", "Иванова Анна Сергеевна", "Капленко Карина",
+             "Каплено Карина", "Ли Ан", "Ахметова Айгерим Нурлановна"]
+    for threshold in (0.75, 0.85, 0.9):
+        for a in names:
+            for b in names:
+                plain = cco.fuzzy_match(a, b)
+                cut = cco.fuzzy_match(a, b, threshold)
+                assert (plain >= threshold) == (cut >= threshold)
+                assert abs(cut - plain) < 1e-9 or cut == 0.0
+
+
+def test_dedup_text_check_same_without_rapidfuzz(monkeypatch):
+    """Проверка 2 без rapidfuzz (попарно по нормализованным текстам) убирает те же страницы."""
+    import copy
+    import client_card_ocr as cco
+
+    texts = ["Процедурный лист\nЧистка лица 15000", "процедурный  лист чистка лица 15000",
+             "Ботокс Диспорт лоб 50 ед", "", "   ", "БОТОКС диспорт лоб 50 ед."]
+    grouped = {"client_1": {"name": "А", "pages": [
+        {"filename": f"{i}.jpg", "ocr_text": t, "page_type": "unknown"} for i, t in enumerate(texts)
+    ]}}
+
+    with_rf = cco.deduplicate_pages(copy.deepcopy(grouped))
+    monkeypatch.setitem(cco._rapidfuzz_cache, "loaded", True)
+    monkeypatch.setitem(cco._rapidfuzz_cache, "fuzz", None)
+    without_rf = cco.deduplicate_pages(copy.deepcopy(grouped))
+
+    kept = [p["filename"] for p in with_rf["client_1"]["pages"]]
+    assert kept == [p["filename"] for p in without_rf["client_1"]["pages"]]
+    assert kept == ["1.jpg", "3.jpg", "4.jpg", "5.jpg"]  # из пары остаётся более длинный текст
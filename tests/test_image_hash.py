@@ -0,0 +1,178 @@
+"""
+Тесты перцептивного хэша и расстояния Хэмминга (дедупликация фото).
+
+Проверяют:
+1. Хэш — int из hash_size² бит.
+2. Одно фото в разном размере/качестве → расстояние < 10%.
+3. Разные фото → расстояние заметно больше.
+4. Нечитаемый файл → None, расстояние с ним = 1.0.
+5. Однотонное фото (хэш 0) — валидный хэш, а не «нет хэша».
+6. Матрица дублей (NumPy, блоками строк) совпадает с попарным hamming_distance,
+   в т.ч. для точных повторов.
+7. deduplicate_pages хэширует каждый файл один раз на все группы.
+8. Хэш сохраняется в JSON-кэше и переиспользуется, пока файл не изменился.
+9. Побайтно одинаковые файлы декодируются один раз и считаются дублями.
+"""
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _card(path, size, stripes, quality=90):
+    img = Image.new("L", size, 255)
+    w, h = size
+    for i, (top, bottom) in enumerate(stripes):
+        for y in range(int(top * h), int(bottom * h)):
+            for x in range(int(w * 0.1 * (i + 1)), w):
+                img.putpixel((x, y), 30)
+    img.save(path, quality=quality)
+    return str(path)
+
+
+@pytest.fixture
+def images(tmp_path):
+    stripes = [(0.1, 0.2), (0.4, 0.45), (0.7, 0.9)]
+    return {
+        "big": _card(tmp_path / "big.jpg", (640, 480), stripes),
+        "small": _card(tmp_path / "small.jpg", (320, 240), stripes, quality=40),
+        "other": _card(tmp_path / "other.jpg", (640, 480), [(0.5, 0.95)]),
+    }
+
+
+def test_hash_is_int_of_bits(images):
+    import client_card_ocr as cco
+
+    h = cco.compute_image_hash(images["big"], 16)
+    assert isinstance(h, int) and 0 < h.bit_length() <= 256
+    assert cco.compute_image_hash(images["big"], 8).bit_length() <= 64
+    assert cco.hamming_distance(h, ~h & ((1 << 256) - 1)) == 1.0
+
+
+def test_same_photo_close_different_far(images):
+    import client_card_ocr as cco
+
+    big, small, other = (cco.compute_image_hash(images[k]) for k in ("big", "small", "other"))
+    assert cco.hamming_distance(big, big) == 0.0
+    assert cco.hamming_distance(big, small) < 0.10
+    assert cco.hamming_distance(big, other) > 0.10
+
+
+def test_unreadable_file(tmp_path):
+    import client_card_ocr as cco
+
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not an image")
+    h = cco.compute_image_hash(str(bad))
+    assert h is None
+    assert cco.hamming_distance(h, h) == 1.0
+
+
+def test_blank_photo_hash_is_zero(tmp_path):
+    import client_card_ocr as cco
+
+    blank = tmp_path / "blank.png"
+    Image.new("L", (100, 100), 200).save(blank)
+    h = cco.compute_image_hash(str(blank))
+    assert h == 0
+    assert cco.hamming_distance(h, h) == 0.0
+
+
+def test_duplicate_matrix_matches_pairwise(monkeypatch):
+    import random
+    import client_card_ocr as cco
+
+    rng = random.Random(3)
+    base = rng.getrandbits(256)
+    hashes = [base ^ (1 << rng.randrange(256)) for _ in range(4)]
+    hashes += [rng.getrandbits(256) for _ in range(3)] + [None, 0]
+    hashes += [hashes[0], hashes[5], None, 0]  # точные повторы сводятся к одному хэшу
+    for k in range(5):  # на границе порога: 25 и 26 различающихся бит
+        hashes.append(base ^ ((1 << (24 + k % 3)) - 1))
+
+    matrix = cco._hash_duplicate_matrix(hashes, 256)
+
+    expected = [[cco.hamming_distance(a, b) < 0.10 for b in hashes] for a in hashes]
+    assert matrix.tolist() == expected
+    monkeypatch.setattr(cco, "_HASH_BLOCK_BYTES", 64)  # по две строки на блок
+    assert cco._hash_duplicate_matrix(hashes, 256).tolist() == expected
+
+
+def test_dedup_hashes_each_file_once(images, monkeypatch):
+    import client_card_ocr as cco
+
+    calls = []
+    real = cco.compute_image_hash
+    monkeypatch.setattr(cco, "compute_image_hash", lambda p, size: calls.append(p) or real(p, size))
+
+    def page(name, text):
+        return {"filename": name, "filepath": images[name], "ocr_text": text,
+                "page_type": "procedure_sheet", "data": {"n": text}}
+
+    grouped = {
+        "client_1": {"name": "А", "pages": [page("big", "один"), page("small", "два текста")]},
+        "client_2": {"name": "Б", "pages": [page("other", "три"), page("big", "четыре")]},
+        "_unmatched": {"name": "?", "pages": [page("small", "x"), page("other", "y")]},
+    }
+    cco.deduplicate_pages(grouped)
+
+    assert sorted(calls) == sorted(images.values())
+    assert [p["filename"] for p in grouped["client_1"]["pages"]] == ["small"]
+    assert len(grouped["client_2"]["pages"]) == 2
+    assert len(grouped["_unmatched"]["pages"]) == 2
+
+
+def test_dedup_reuses_cached_hash(images, tmp_path, monkeypatch):
+    import json
+    import os
+    import client_card_ocr as cco
+
+    monkeypatch.setattr(cco.config, "CACHE_FOLDER", str(tmp_path / "cache"))
+    calls = []
+    real = cco.compute_image_hash
+    monkeypatch.setattr(cco, "compute_image_hash", lambda p, size: calls.append(p) or real(p, size))
+
+    def grouped():
+        pages = [cco.load_from_cache(images[n]) for n in ("big", "other")]
+        return {"client_1": {"name": "А", "pages": pages}}
+
+    for name in ("big", "other"):
+        cco.save_to_cache(images[name], {"filename": name, "filepath": images[name],
+                                         "ocr_text": name, "page_type": "unknown", "data": {}})
+
+    cco.deduplicate_pages(grouped())  # первый запуск: хэши считаются и пишутся в кэш
+    assert len(calls) == 2
+    cached = json.load(open(cco.get_cache_path(images["big"]), encoding="utf-8"))
+    assert int(cached["img_phash"], 16) == real(images["big"])
+
+    calls.clear()
+    cco.deduplicate_pages(grouped())  # повторный: только lookup
+    assert calls == []
+
+    st = os.stat(images["other"])
+    os.utime(images["other"], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cco.deduplicate_pages(grouped())  # файл изменился — пересчёт только его
+    assert calls == [images["other"]]
+
+
+def test_identical_files_hashed_once(images, tmp_path, monkeypatch):
+    import shutil
+    import client_card_ocr as cco
+
+    copy = str(tmp_path / "copy.jpg")
+    shutil.copyfile(images["big"], copy)
+    calls = []
+    real = cco.compute_image_hash
+    monkeypatch.setattr(cco, "compute_image_hash", lambda p, size: calls.append(p) or real(p, size))
+
+    def page(path, text):
+        return {"filename": path, "filepath": path, "ocr_text": text,
+                "page_type": "unknown", "data": {}}
+
+    grouped = {"client_1": {"name": "А", "pages": [
+        page(images["big"], "короткий"), page(copy, "совсем другой текст"), page(images["other"], "x"),
+    ]}}
+    cco.deduplicate_pages(grouped)
+
+    assert sorted(calls) == sorted([images["big"], images["other"]])
+    assert [p["filepath"] for p in grouped["client_1"]["pages"]] == [copy, images["other"]]
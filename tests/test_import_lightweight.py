@@ -58,3 +58,18 @@ def test_no_heavy_modules_loaded_on_plain_import():
     # Берём последнюю строку — setup_logging() может печатать в stdout
     output = result.stdout.strip().split("\n")[-1]
     assert output == "NONE", f"Heavy modules loaded on import: {output}"
+
+
+def test_system_prompt_not_read_on_import():
+    """Промпт Claude читается с диска при первом запросе, а не при импорте."""
+    code = (
+        "import client_card_ocr as c; "
+        "print(c.get_system_prompt.cache_info().currsize)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, timeout=10,
+        cwd=str(__import__("pathlib").Path(__file__).resolve().parent.parent),
+    )
+    assert result.returncode == 0, f"Import failed: {result.stderr}"
+    assert result.stdout.strip().split("\n")[-1] == "0"
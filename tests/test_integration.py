@@ -3,7 +3,8 @@
 
 Проверяют:
 1. Merge fallback-результатов по не-секвенциальным индексам
-2. Парсинг check_results/summary от Claude
+   (Claude_Статус — Categorical, нестандартные статусы сохраняются)
+2. Парсинг check_results/summary от Claude (в т.ч. в markdown-обёртке)
 3. Сохранение raw_payload/parse_mode в результатах
 """
 
@@ -113,6 +114,45 @@ class TestFallbackMergeIntegration:
         assert enhanced.at[10, 'Claude_Статус'] == 'OK1'
         assert enhanced.at[50, 'Claude_Статус'] == 'OK2'
         assert enhanced.at[99, 'Claude_Статус'] == 'OK3'
+        # Целые confidence_score не меняют dtype колонки (float64, как раньше)
+        assert enhanced['Claude_Совпадение_%'].dtype == 'float64'
+        assert enhance_verification_df(verification_df.iloc[0:0], [])['Claude_Совпадение_%'].dtype == 'float64'
+
+    def test_merge_numeric_and_foreign_ids(self):
+        """Тест client_id числом, чужих и нечисловых client_id."""
+        from final_verification import enhance_verification_df
+
+        verification_df = pd.DataFrame({'OCR_ФИО': ['A', 'B', 'C']}, index=[2, 5, 8])
+        claude_results = [
+            {'client_id': 5, 'final_status': 'OK', 'confidence_score': 70},
+            {'client_id': '7', 'final_status': 'Чужой'},
+            {'client_id': '²', 'final_status': 'Мусор'},
+            {'client_id': 'abc', 'final_status': 'Мусор'},
+        ]
+
+        enhanced = enhance_verification_df(verification_df, claude_results)
+
+        assert list(enhanced['Claude_Статус']) == ['', 'OK', '']
+        assert list(enhanced['Claude_Совпадение_%']) == [0.0, 70.0, 0.0]
+
+    def test_status_column_categorical(self):
+        """Claude_Статус — Categorical; нестандартный статус не теряется."""
+        from final_verification import enhance_verification_df
+
+        verification_df = pd.DataFrame({'OCR_ФИО': ['A', 'B', 'C']}, index=[0, 1, 2])
+        claude_results = [
+            {'client_id': '0', 'final_status': 'Подтверждён'},
+            {'client_id': '1', 'final_status': 'Новый статус'},
+        ]
+
+        enhanced = enhance_verification_df(verification_df, claude_results)
+        status = enhanced['Claude_Статус']
+
+        assert isinstance(status.dtype, pd.CategoricalDtype)
+        assert list(status) == ['Подтверждён', 'Новый статус', '']
+        assert list(status.cat.categories[-2:]) == ['Ошибка верификации', 'Новый статус']
+        assert (status == 'Подтверждён').tolist() == [True, False, False]
+        assert enhance_verification_df(verification_df.iloc[0:0], [])['Claude_Статус'].dtype == 'category'
 
 
 class TestClaudeResponseParsing:
@@ -171,6 +211,23 @@ class TestClaudeResponseParsing:
         assert results[0]['client_id'] == '1'
         assert results[0]['final_status'] == 'OK'  # Нормализовано из status
 
+    def test_parse_markdown_wrapped_with_trailing_text(self):
+        """Тест ```json-обёртки и текста со скобками после объекта."""
+        from final_verification import parse_claude_batch_response
+
+        body = json.dumps({"clients": [{"client_id": "4", "final_status": "Подтверждён",
+                                        "recommendations": ["Проверить {скобки}"]}]},
+                          ensure_ascii=False, indent=2)
+        mock_response = Mock()
+        mock_response.content = [Mock()]
+        mock_response.content[0].text = f"```json\n{body}\n```\nПримечание: {{ок}}"
+
+        results = parse_claude_batch_response(mock_response, Mock())
+
+        assert [r['client_id'] for r in results] == ['4']
+        assert results[0]['recommendations'] == ['Проверить {скобки}']
+        assert results[0]['_rec_text'] == 'Проверить {скобки}'  # текст колонки — уже при разборе
+
 
 class TestRawPayloadPreservation:
     """Тесты сохранения raw_payload и parse_mode."""
@@ -0,0 +1,190 @@
+"""
+Тесты нормализации OCR-файла под формат БД (normalize_ocr.normalize_ocr_file).
+
+Проверяют:
+1. Листы переименованы по маппингу, «Все_визиты» — первым листом.
+2. «Все_визиты»: строки процедур, покупок, комплексов и ботокса в одном формате,
+   пустые клиенты отброшены.
+3. Комплекс без процедуры — название комплекса; ботокс без препарата —
+   «Ботулинотерапия» (без «nan»).
+4. normalize_phone_series совпадает с normalize_phone поэлементно.
+5. normalize_date_series совпадает с normalize_date (строгие форматы, без угадывания).
+6. Врач по DB_DOCTOR_MAP без учёта регистра; колонка — один вызов на уникальное имя.
+7. normalize_sheet переименовывает только известные колонки и не меняет исходный лист.
+8. Без xlsxwriter файл пишется openpyxl (write_only) с тем же содержимым,
+   что и pd.ExcelWriter(engine="openpyxl"): числа, даты, пропуски.
+9. Телефон числом в колонке с пропусками читается строкой и нормализуется.
+10. calamine выбирается только на pandas >= 2.2 (на старой — openpyxl).
+"""
+
+import pandas as pd
+
+
+def _write(path, sheets):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+
+
+def _normalize(tmp_path, sheets):
+    from normalize_ocr import normalize_ocr_file
+
+    src, dst = tmp_path / "ocr.xlsx", tmp_path / "normalized.xlsx"
+    _write(src, sheets)
+    assert normalize_ocr_file(str(src), str(dst)) == str(dst)
+    return pd.read_excel(dst, sheet_name=None)
+
+
+def test_all_visits_sheet(tmp_path):
+    sheets = _normalize(tmp_path, {
+        "Процедуры": pd.DataFrame({"ID": ["C1", "C2"], "ФИО": ["Иванова Анна", None],
+                                   "Дата": ["12.03.2024", "13.03.2024"],
+                                   "Процедура": ["Чистка", "Пилинг"], "Стоимость": [15000, 9000]}),
+        "Покупки": pd.DataFrame({"ID": ["C1"], "ФИО": ["Иванова Анна"], "Дата": ["2024-03-14"],
+                                 "Консультант": ["Крошка Рада"], "Наименование": ["Крем"], "Цена": [5000]}),
+        "Комплексы": pd.DataFrame({"ID": ["C3", "C3"], "Пациент": ["Петров", "Петров"],
+                                   "Комплекс": ["PRIVILAGE", "PRIVILAGE"], "Процедура": ["Массаж", None],
+                                   "Дата": ["01.12.2023", "02.12.2023"], "Кол-во": [2, None]}),
+        "Ботокс": pd.DataFrame({"ID": ["C4", "C4"], "ФИО": ["Сидорова", "Сидорова"],
+                                "Препарат": ["Диспорт", None], "Область введения": ["Лоб", "Лоб"],
+                                "Кол-во единиц": [50, 20], "Дата процедуры": ["05.01.2024", "06.01.2024"]}),
+    })
+
+    assert list(sheets)[0] == "Все_визиты"
+    assert "Клиент" in sheets["Процедуры"].columns
+
+    visits = sheets["Все_визиты"]
+    assert list(visits.columns) == ["ID", "Клиент", "Дата визита", "Доктор", "Процедура",
+                                    "Количество", "Стоимость", "Источник"]
+    assert list(visits["Источник"]) == ["Процедурный лист", "Покупки", "Комплекс", "Комплекс",
+                                        "Ботокс", "Ботокс"]
+    assert list(visits["Процедура"]) == ["Чистка", "Крем", "Массаж", "PRIVILAGE",
+                                         "Ботулинотерапия: Диспорт (Лоб)", "Ботулинотерапия (Лоб)"]
+    assert list(visits["Дата визита"]) == ["12.03.2024", "14.03.2024", "01.12.2023", "02.12.2023",
+                                           "05.01.2024", "06.01.2024"]
+    assert visits.loc[1, "Доктор"] == "Крошка Рада"
+    assert list(visits["Количество"].iloc[:3]) == [1, 1, 2]
+
+
+def test_no_visit_sheets(tmp_path):
+    sheets = _normalize(tmp_path, {"Мед_данные": pd.DataFrame({"ID": [1], "Аллергии": ["нет"]})})
+
+    assert list(sheets) == ["Мед_данные"]
+
+
+def test_phone_series_matches_scalar():
+    import numpy as np
+    from normalize_ocr import normalize_phone, normalize_phone_series
+
+    values = pd.Series(["8 701 123 45 67", "+7(701)1234567", 87011234567, "701 123 45 67",
+                        None, "", np.nan, "12-34", 7011234567.0, 0, "80000000000000"], dtype=object)
+
+    assert normalize_phone_series(values).tolist() == [normalize_phone(v) for v in values]
+    assert normalize_phone_series(values.iloc[:4]).tolist() == ["77011234567"] * 4
+    numeric = pd.Series([87011234567.0, np.nan])  # float-колонка — как раньше, пусто
+    assert normalize_phone_series(numeric).tolist() == ["", ""]
+
+
+def test_date_series_matches_scalar():
+    import datetime
+    import numpy as np
+    from normalize_ocr import normalize_date, normalize_date_series
+
+    values = pd.Series(["12.03.2024", "2024-03-12", "2024-3-5", datetime.datetime(2024, 3, 5, 10, 30),
+                        "03/04/2023", "31/02/2023", "05-06-2022", "2024", "вчера", None, np.nan,
+                        "", " 2024-03-12 10:00:00.123 "], dtype=object)
+
+    result = normalize_date_series(values).tolist()
+
+    assert result == [normalize_date(v) for v in values]
+    assert result[:5] == ["12.03.2024", "12.03.2024", "05.03.2024", "05.03.2024", "03.04.2023"]
+    assert result[7] == "2024"  # не дата по формату — как есть
+    dates = pd.Series([pd.Timestamp("2024-03-05"), pd.NaT])
+    assert normalize_date_series(dates).tolist() == ["05.03.2024", ""]
+
+
+def test_doctor_series_unique_names(monkeypatch):
+    import numpy as np
+    import normalize_ocr
+
+    db_short, ocr_full = next(iter(normalize_ocr.config.DB_DOCTOR_MAP.items()))
+    assert normalize_ocr.normalize_doctor(f" {ocr_full.upper()} ") == db_short
+
+    calls = []
+    real = normalize_ocr.normalize_doctor
+    monkeypatch.setattr(normalize_ocr, "normalize_doctor", lambda name: calls.append(name) or real(name))
+    values = pd.Series([ocr_full, "Другой", ocr_full, None, np.nan, "Другой"], dtype=object)
+
+    result = normalize_ocr.normalize_doctor_series(values)
+
+    assert result.tolist() == [db_short, "Другой", db_short, "", "", "Другой"]
+    assert calls == [ocr_full, "Другой"]
+
+
+def test_normalize_sheet_keeps_source():
+    from normalize_ocr import normalize_sheet
+
+    df = pd.DataFrame({"ФИО": ["Иванова"], "Телефон": ["8 701 123 45 67"], "Дата": ["2024-03-12"]})
+    source = df.copy()
+
+    renamed = normalize_sheet(df, {"ФИО": "Клиент", "Нет такой": "X"}, "Клиенты")
+    same = normalize_sheet(df, {}, "Клиенты")
+
+    assert list(renamed.columns) == ["Клиент", "Телефон", "Дата"]
+    assert list(same.columns) == ["ФИО", "Телефон", "Дата"]
+    assert renamed.loc[0, "Телефон"] == same.loc[0, "Телефон"] == "77011234567"
+    assert same.loc[0, "Дата"] == "12.03.2024"
+    pd.testing.assert_frame_equal(df, source)
+
+
+def test_write_only_fallback_same_content(tmp_path):
+    import numpy as np
+    from normalize_ocr import _save_sheets
+
+    sheets = {
+        "Все_визиты": pd.DataFrame({
+            "Клиент": ["Иванова Анна", "Петров", None],
+            "Дата визита": pd.to_datetime(["2024-03-12 00:00", None, "2023-12-01 10:30"]),
+            "Количество": [1, 2, 3],
+            "Стоимость": [15000.5, np.nan, 9000.0],
+            "Источник": ["Покупки", "", "Комплекс"],
+        }),
+        "Мед_данные": pd.DataFrame({"ID": [1, 2], "Аллергии": ["нет", None]}),
+    }
+    reference, fallback = tmp_path / "reference.xlsx", tmp_path / "fallback.xlsx"
+    with pd.ExcelWriter(reference, engine="openpyxl") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    _save_sheets(str(fallback), sheets, "openpyxl")
+
+    expected = pd.read_excel(reference, sheet_name=None)
+    actual = pd.read_excel(fallback, sheet_name=None)
+    assert list(actual) == list(expected) == ["Все_визиты", "Мед_данные"]
+    for name in expected:
+        pd.testing.assert_frame_equal(actual[name], expected[name])
+    assert actual["Все_визиты"]["Дата визита"].dtype.kind == "M"
+
+
+def test_numeric_phone_with_blanks(tmp_path):
+    sheets = _normalize(tmp_path, {
+        "Клиенты": pd.DataFrame({"ID": ["C1", "C2", "C3"], "ФИО": ["Иванова", "Петров", "Сидорова"],
+                                 "Телефон": [87011234567, None, "701 765 43 21"]}),
+    })
+
+    phones = sheets["Клиенты"]["Телефон"]
+    assert phones.isna().tolist() == [False, True, False]
+    assert phones.dropna().astype("int64").tolist() == [77011234567, 77017654321]
+
+
+def test_calamine_needs_pandas_22(monkeypatch):
+    import sys
+    import types
+    import normalize_ocr
+
+    monkeypatch.setitem(sys.modules, "python_calamine", types.ModuleType("python_calamine"))
+    monkeypatch.setattr(pd, "__version__", "2.1.4")
+    assert normalize_ocr._excel_engines()[0] == "openpyxl"
+    monkeypatch.setattr(pd, "__version__", "2.2.0rc1")
+    assert normalize_ocr._excel_engines()[0] == "calamine"
+    monkeypatch.setattr(pd, "__version__", "3.0.1")
+    assert normalize_ocr._excel_engines()[0] == "calamine"
@@ -0,0 +1,57 @@
+"""
+Тесты поиска ключевых слов типов страниц одним regex.
+
+Проверяют, что скомпилированный матчер даёт те же баллы, что и
+наивная проверка `keyword in text` по каждому слову — включая
+вложенные слова («процедур» внутри «процедуры»).
+"""
+
+import pytest
+
+
+def _naive_scores(payload, ocr_text):
+    from client_card_ocr import PAGE_TYPE_INDICATORS
+
+    keys_lower = [str(k).lower() for k in payload]
+    text_lower = ocr_text.lower()
+    scores = {}
+    for page_type, keywords in PAGE_TYPE_INDICATORS.items():
+        score = 0
+        for kw in keywords:
+            if any(kw in key for key in keys_lower):
+                score += 2
+            if kw in text_lower:
+                score += 1
+        scores[page_type] = score
+    return scores
+
+
+@pytest.mark.parametrize("text", [
+    "Лист процедуры: название, описание",
+    "ПРОЦЕДУР нет",
+    "Приобретения комплекса, пакет привилегия",
+    "ботокс ботулин препарат область",
+    "",
+])
+def test_matcher_finds_same_keywords(text):
+    from client_card_ocr import PAGE_TYPE_INDICATORS, _find_indicators
+
+    lower = text.lower()
+    expected = {kw for kws in PAGE_TYPE_INDICATORS.values() for kw in kws if kw in lower}
+    assert _find_indicators(lower) == expected
+
+
+@pytest.mark.parametrize("payload, text, expected", [
+    ({"procedures": [], "procedure_name": ""}, "процедуры", "procedure_sheet"),
+    ({"complex_name": "", "purchase_date": ""}, "", "complex_package"),
+    ({"injections": []}, "ботокс", "botox_record"),
+    ({"foo": 1}, "просто текст", "unknown"),
+])
+def test_infer_matches_naive_scoring(payload, text, expected):
+    from client_card_ocr import infer_page_type_from_content
+
+    naive = _naive_scores(payload, text)
+    best = max(naive, key=naive.get)
+    naive_type = best if naive[best] >= 3 else "unknown"
+
+    assert infer_page_type_from_content(payload, text, "t.jpg") == naive_type == expected
@@ -0,0 +1,170 @@
+"""
+Тесты параллельной обработки новых карточек (process_all_images).
+
+Проверяют:
+1. Claude-запросы выполняются в пуле потоков (несколько одновременно).
+2. Порядок результатов совпадает с порядком входных файлов.
+3. Ошибка одного файла не ломает остальные; кэш и реестр пишутся только для успешных.
+4. Реестр сбрасывается на диск каждые SAVE_EVERY_N карточек, JSON пишется атомарно.
+5. Vision и Claude получают один и тот же CardImage (файл читается один раз).
+6. get_image_files: только файлы с нужным расширением (без учёта регистра), по алфавиту.
+7. Повторный запуск читает кэш каждого обработанного файла один раз.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    input_dir = tmp_path / "JPG"
+    input_dir.mkdir()
+    for i in range(6):
+        (input_dir / f"card_{i}.jpg").write_bytes(b"x")
+
+    monkeypatch.setattr(cco.config, "INPUT_FOLDER", str(input_dir))
+    monkeypatch.setattr(cco.config, "CACHE_FOLDER", str(tmp_path / "cache"))
+    monkeypatch.setattr(cco.config, "PROCESSED_REGISTRY", str(tmp_path / "registry.json"), raising=False)
+    monkeypatch.setattr(cco.config, "API_RPS", 0)
+    monkeypatch.setattr(cco.config, "MAX_RETRIES", 0)
+    monkeypatch.setattr(cco.config, "API_MAX_WORKERS", 4, raising=False)
+
+    def fake_batch(vision_client, cards):
+        return [SimpleNamespace(full_text=c.path, enhanced_text=c.path, tables_md="", tables_csv="",
+                                page_confidence=0.9) for c in cards]
+
+    monkeypatch.setattr(cco, "ocr_images_structured_batch", fake_batch)
+    return cco
+
+
+def test_claude_calls_run_concurrently_and_keep_order(pipeline, monkeypatch):
+    cco = pipeline
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def fake_claude(client, card, ocr_text):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+        return {"page_type": "medical", "data": {"fio": card.path}}
+
+    monkeypatch.setattr(cco, "extract_with_claude", fake_claude)
+
+    results = cco.process_all_images(None, None)
+
+    assert state["peak"] > 1
+    assert [r["filename"] for r in results] == [f"card_{i}.jpg" for i in range(6)]
+    assert len(cco.load_registry()) == 6
+
+
+def test_failed_file_not_cached(pipeline, monkeypatch):
+    cco = pipeline
+
+    def fake_claude(client, card, ocr_text):
+        if card.filename == "card_2.jpg":
+            raise RuntimeError("overloaded")
+        return {"page_type": "medical", "data": {}}
+
+    monkeypatch.setattr(cco, "extract_with_claude", fake_claude)
+
+    results = cco.process_all_images(None, None)
+
+    assert results[2]["page_type"] == "error"
+    assert "overloaded" in results[2]["data"]["error"]
+    registry = cco.load_registry()
+    assert "card_2.jpg" not in registry
+    assert len(registry) == 5
+
+
+def test_registry_flushed_periodically(pipeline, monkeypatch):
+    cco = pipeline
+    monkeypatch.setattr(cco.config, "SAVE_EVERY_N", 2)
+    monkeypatch.setattr(cco, "extract_with_claude",
+                        lambda client, path, text: {"page_type": "medical", "data": {}})
+    saves = []
+    real_save = cco.save_registry
+    monkeypatch.setattr(cco, "save_registry", lambda reg: (saves.append(len(reg)), real_save(reg)))
+
+    cco.process_all_images(None, None)
+
+    # 6 файлов: каждые 2 карточки + финальное сохранение
+    assert saves == [2, 4, 6, 6]
+
+
+def test_json_written_atomically(tmp_path):
+    import json
+    import client_card_ocr as cco
+
+    path = tmp_path / "reg.json"
+    cco._write_json_atomic(str(path), {"карта.jpg": {"n": 1}})
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {"карта.jpg": {"n": 1}}
+    assert "карта.jpg" in path.read_text(encoding="utf-8")
+    assert not (tmp_path / "reg.json.tmp").exists()
+
+
+def test_ocr_and_claude_share_card_bytes(pipeline, monkeypatch):
+    cco = pipeline
+    ocr_cards, claude_cards = {}, {}
+
+    real_batch = cco.ocr_images_structured_batch
+
+    def recording_batch(vision_client, cards):
+        ocr_cards.update({c.path: c for c in cards})
+        return real_batch(vision_client, cards)
+
+    def fake_claude(client, card, ocr_text):
+        claude_cards[card.path] = card
+        return {"page_type": "medical", "data": {}}
+
+    monkeypatch.setattr(cco, "ocr_images_structured_batch", recording_batch)
+    monkeypatch.setattr(cco, "extract_with_claude", fake_claude)
+
+    cco.process_all_images(None, None)
+
+    assert len(claude_cards) == 6
+    assert all(claude_cards[p] is ocr_cards[p] for p in claude_cards)
+
+
+def test_get_image_files_filters_and_sorts(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    for name in ["b.JPG", "a.png", "c.txt", ".jpg", "d.webp"]:
+        (tmp_path / name).write_bytes(b"x")
+    (tmp_path / "folder.jpg").mkdir()
+    monkeypatch.setattr(cco.config, "IMAGE_EXTENSIONS", [".jpg", ".PNG", ".webp"])
+
+    files = cco.get_image_files(str(tmp_path))
+
+    assert files == [str(tmp_path / n) for n in ["a.png", "b.JPG", "d.webp"]]
+
+
+def test_warm_run_reads_each_cache_once(pipeline, monkeypatch):
+    cco = pipeline
+    monkeypatch.setattr(cco, "extract_with_claude",
+                        lambda client, card, text: {"page_type": "medical", "data": {}})
+    cco.process_all_images(None, None)
+
+    reads = []
+    real_load = cco.load_from_cache
+    monkeypatch.setattr(cco, "load_from_cache", lambda p: reads.append(p) or real_load(p))
+    # Без новых файлов — результаты из кэша
+    results = cco.process_all_images(None, None)
+    assert [r["filename"] for r in results] == [f"card_{i}.jpg" for i in range(6)]
+    assert len(reads) == len(set(reads)) == 6
+
+    # Один новый файл: старые читаются для группировки тоже один раз
+    reads.clear()
+    with open(f"{cco.config.INPUT_FOLDER}/card_6.jpg", "wb") as f:
+        f.write(b"x")
+    results = cco.process_all_images(None, None)
+    assert len(results) == 7
+    assert len(reads) == len(set(reads)) == 7
@@ -9,6 +9,7 @@ Unit-тесты baseline качества OCR-пайплайна.
    - пайплайн завершается с кодом 0.
 4. Парсер pytest: корректный подсчёт failed + error.
 5. Валидация --repeat: значения <= 0 отклоняются.
+6. --parallel-repeats: прогоны идут одновременно, у каждого свой --basetemp.
 """
 
 import json
@@ -641,3 +642,40 @@ class TestRepeatValidation:
         from quality_baseline import _positive_int
         with pytest.raises(argparse.ArgumentTypeError, match=r"целое"):
             _positive_int("abc")
+
+
+# ============================================================
+# 8. ПАРАЛЛЕЛЬНЫЕ ПРОГОНЫ (--parallel-repeats)
+# ============================================================
+
+
+class TestParallelRepeats:
+    """collect_pytest_stats(parallel=True): пул потоков, порядок и изоляция прогонов."""
+
+    def test_runs_overlap_with_own_basetemp(self, monkeypatch):
+        import threading
+        import time
+        import quality_baseline
+
+        active, peak, envs = [0], [0], []
+        lock = threading.Lock()
+
+        def fake_run(cmd, cwd, env=None):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                envs.append(env["PYTEST_ADDOPTS"])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return {"returncode": 0, "passed": 2, "failed": 0, "total": 2,
+                    "duration_sec": 0.05, "test_results": {}}
+
+        monkeypatch.setattr(quality_baseline, "_run_pytest_once", fake_run)
+
+        stats = quality_baseline.collect_pytest_stats("pytest", ".", 3, parallel=True)
+
+        assert peak[0] == 3
+        assert len(stats["runs"]) == 3
+        assert all("-p no:cacheprovider" in e and "--basetemp=" in e for e in envs)
+        assert len({e.split("--basetemp=")[1] for e in envs}) == 3
@@ -0,0 +1,159 @@
+"""
+Тесты ограничителя частоты запросов (utils.rate_limit.RateLimiter).
+
+Проверяют:
+1. rps <= 0 — без ожидания.
+2. Сверх burst запросы идут с интервалом 1/rps, ожидание растёт по очереди.
+3. Жетоны восстанавливаются со временем, но не больше burst.
+4. process_all_images берёт жетон перед каждым запросом к Claude.
+5. pause задерживает все потоки; slow_down/speed_up держат темп в границах.
+6. rate_limit_delay читает Retry-After из ошибок anthropic/google.
+7. 429 от Claude: пауза на весь пул, повтор без повторного OCR.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    from utils import rate_limit
+
+    state = {"now": 100.0, "sleeps": []}
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: state["now"])
+    monkeypatch.setattr(rate_limit.time, "sleep", state["sleeps"].append)
+    return state
+
+
+def test_unlimited(clock):
+    from utils.rate_limit import RateLimiter
+
+    limiter = RateLimiter(0)
+    assert [limiter.acquire() for _ in range(5)] == [0.0] * 5
+    assert clock["sleeps"] == []
+
+
+def test_queue_waits_grow(clock):
+    from utils.rate_limit import RateLimiter
+
+    limiter = RateLimiter(2.0)
+    waits = [limiter.acquire() for _ in range(4)]
+    assert waits == pytest.approx([0.0, 0.5, 1.0, 1.5])
+    assert clock["sleeps"] == pytest.approx([0.5, 1.0, 1.5])
+
+
+def test_refill_capped_by_burst(clock):
+    from utils.rate_limit import RateLimiter
+
+    limiter = RateLimiter(1.0, burst=2)
+    assert [limiter.acquire() for _ in range(2)] == [0.0, 0.0]
+    clock["now"] += 60  # долгий простой: накопится не больше burst
+    waits = [limiter.acquire() for _ in range(3)]
+    assert waits == pytest.approx([0.0, 0.0, 1.0])
+
+
+def test_pipeline_acquires_before_claude(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    import client_card_ocr as cco
+    from utils import rate_limit
+
+    input_dir = tmp_path / "JPG"
+    input_dir.mkdir()
+    for i in range(3):
+        (input_dir / f"card_{i}.jpg").write_bytes(b"x")
+    monkeypatch.setattr(cco.config, "INPUT_FOLDER", str(input_dir))
+    monkeypatch.setattr(cco.config, "CACHE_FOLDER", str(tmp_path / "cache"))
+    monkeypatch.setattr(cco.config, "PROCESSED_REGISTRY", str(tmp_path / "registry.json"), raising=False)
+    monkeypatch.setattr(cco.config, "API_RPS", 1000.0)
+    monkeypatch.setattr(cco, "ocr_images_structured_batch", lambda client, cards: [
+        SimpleNamespace(full_text="", enhanced_text="", tables_md="", tables_csv="",
+                        page_confidence=0.9) for _ in cards])
+    monkeypatch.setattr(cco, "extract_with_claude",
+                        lambda client, card, text: {"page_type": "unknown", "data": {}})
+
+    calls = []
+    real_acquire = rate_limit.RateLimiter.acquire
+    monkeypatch.setattr(rate_limit.RateLimiter, "acquire",
+                        lambda self: calls.append(self.rps) or real_acquire(self))
+
+    cco.process_all_images(None, None)
+
+    assert calls == [1000.0] * 3
+
+
+def test_pause_and_adaptive_rate(clock):
+    from utils.rate_limit import RateLimiter
+
+    limiter = RateLimiter(4.0)
+    limiter.pause(3.0)
+    assert limiter.acquire() == pytest.approx(3.0)
+    assert limiter.acquire() == pytest.approx(3.25)
+
+    for _ in range(10):
+        limiter.slow_down()
+    assert limiter.rps == pytest.approx(0.4)
+    for _ in range(20):
+        limiter.speed_up()
+    assert limiter.rps == pytest.approx(4.0)
+
+    unlimited = RateLimiter(0)
+    unlimited.slow_down()
+    unlimited.pause(2.0)
+    assert unlimited.rps == 0
+    assert unlimited.acquire() == pytest.approx(2.0)
+
+
+class _ApiError(Exception):
+    def __init__(self, status=None, headers=None, code=None):
+        super().__init__(f"status {status or code}")
+        self.status_code = status
+        self.response = type("Resp", (), {"headers": headers or {}, "status_code": status})()
+        if code is not None:
+            self.code = code
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (_ApiError(429, {"retry-after": "7"}), 7.0),
+    (_ApiError(529, {"retry-after-ms": "1500", "retry-after": "9"}), 1.5),
+    (_ApiError(429, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}), 0.0),
+    (_ApiError(429), 0.0),
+    (_ApiError(code=429), 0.0),
+    (_ApiError(500, {"retry-after": "3"}), None),
+    (ValueError("bad json"), None),
+])
+def test_rate_limit_delay(exc, expected):
+    from utils.rate_limit import rate_limit_delay
+    assert rate_limit_delay(exc) == expected
+
+
+def test_claude_429_pauses_pool_and_keeps_ocr(monkeypatch):
+    from types import SimpleNamespace
+    import client_card_ocr as cco
+    from utils.rate_limit import RateLimiter
+
+    monkeypatch.setattr(cco.config, "MAX_RETRIES", 2)
+    ocr_calls, claude_calls = [], []
+    monkeypatch.setattr(cco, "ocr_image_structured", lambda client, card: ocr_calls.append(1) or
+                        SimpleNamespace(full_text="t", enhanced_text="t", tables_md="",
+                                        tables_csv="", page_confidence=0.9))
+
+    def claude(client, card, text):
+        claude_calls.append(1)
+        if len(claude_calls) == 1:
+            raise _ApiError(429, {"retry-after": "0.01"})
+        return {"page_type": "unknown", "data": {}}
+
+    monkeypatch.setattr(cco, "extract_with_claude", claude)
+    sleeps = []
+    monkeypatch.setattr(cco.time, "sleep", sleeps.append)
+
+    limiter = RateLimiter(10.0)
+    paused = []
+    monkeypatch.setattr(limiter, "pause", paused.append)
+    card = cco.CardImage("card.jpg", b"x")
+
+    result = cco._process_new_image(None, None, card, limiter=limiter)
+
+    assert result["page_type"] == "unknown"
+    assert len(ocr_calls) == 1 and len(claude_calls) == 2
+    assert paused == [2] and 2 not in sleeps  # backoff — паузой лимитера, не sleep потока
+    assert limiter.rps == pytest.approx(6.0)  # 10 → 5 после 429, +1 после успеха
@@ -5,6 +5,10 @@
 1. Если лист существует — upload работает без addSheet.
 2. Если листа нет — создаёт через batchUpdate addSheet, затем clear+update.
 3. Ошибка API не роняет вызывающий код.
+4. Метаданные листов читаются один раз на таблицу; upload_many создаёт
+   недостающие листы одним addSheet и пишет batchClear + values.batchUpdate.
+5. df_to_values: числа — числами, даты — ДД.ММ.ГГГГ, остальное — строки;
+   пропуски — "" (ячейка очищается и без clear).
 """
 
 import sys
@@ -17,6 +21,15 @@ import pandas as pd
 from unittest.mock import patch, MagicMock, call
 
 
+@pytest.fixture(autouse=True)
+def _fresh_meta_cache():
+    """Каждый тест — своя таблица: кэш метаданных листов не переносится."""
+    import google_sheets
+    google_sheets._META_CACHE.clear()
+    yield
+    google_sheets._META_CACHE.clear()
+
+
 def _mock_client_with_sheets(existing_sheets):
     """
     Создаёт mock Google Sheets client с заданными существующими листами.
@@ -155,5 +168,88 @@ class TestEnsureSheetExists:
         client.spreadsheets().batchUpdate.assert_called_once()
 
 
+class TestUploadMany:
+    """Тесты: несколько листов и кэш метаданных."""
+
+    @patch('google_sheets.load_client')
+    def test_metadata_fetched_once(self, mock_load):
+        """Повторная выгрузка в ту же таблицу не читает метаданные заново."""
+        from google_sheets import upload_df
+
+        client = _mock_client_with_sheets([{"title": "verification", "sheetId": 1}])
+        mock_load.return_value = client
+        df = pd.DataFrame({"A": [1]})
+
+        upload_df(df, "sid", "verification", "/fake/creds.json")
+        upload_df(df, "sid", "clients", "/fake/creds.json")
+        upload_df(df, "sid", "clients", "/fake/creds.json")
+
+        client.spreadsheets().get.assert_called_once()
+        client.spreadsheets().batchUpdate.assert_called_once()  # только для 'clients'
+
+    @patch('google_sheets.load_client')
+    def test_upload_many_batches_requests(self, mock_load):
+        """Недостающие листы — один addSheet; очистка и запись — по одному запросу."""
+        from google_sheets import upload_many
+
+        client = _mock_client_with_sheets([{"title": "clients", "sheetId": 1}])
+        client.spreadsheets().batchUpdate.return_value.execute.return_value = {"replies": [
+            {"addSheet": {"properties": {"sheetId": 7}}},
+            {"addSheet": {"properties": {"sheetId": 8}}},
+        ]}
+        mock_load.return_value = client
+        sheets = {
+            "clients": pd.DataFrame({"A": [1]}),
+            "visits": pd.DataFrame({"B": ["x"]}),
+            "botox": pd.DataFrame({"C": [2.5]}),
+        }
+
+        assert upload_many(sheets, "sid", "/fake/creds.json") is True
+
+        add = client.spreadsheets().batchUpdate.call_args[1]["body"]["requests"]
+        assert [r["addSheet"]["properties"]["title"] for r in add] == ["visits", "botox"]
+        values = client.spreadsheets().values()
+        values.batchClear.assert_called_once()
+        assert values.batchClear.call_args[1]["body"] == {"ranges": ["clients", "visits", "botox"]}
+        data = values.batchUpdate.call_args[1]["body"]["data"]
+        assert [d["range"] for d in data] == ["clients!A1", "visits!A1", "botox!A1"]
+        assert data[1]["values"][0] == ["B"]
+        values.clear.assert_not_called()
+        values.update.assert_not_called()
+
+    @patch('google_sheets.load_client')
+    def test_failed_write_drops_cache(self, mock_load):
+        """Ошибка записи — метаданные перечитываются при следующей выгрузке."""
+        import google_sheets
+
+        client = _mock_client_with_sheets([{"title": "clients", "sheetId": 1}])
+        client.spreadsheets().values().update.return_value.execute.side_effect = RuntimeError("range")
+        mock_load.return_value = client
+
+        with pytest.raises(RuntimeError):
+            google_sheets.upload_df(pd.DataFrame({"A": [1]}), "sid", "clients", "/fake/creds.json")
+        assert "sid" not in google_sheets._META_CACHE
+
+
+class TestDfToValues:
+    def test_typed_columns(self):
+        import numpy as np
+        from google_sheets import df_to_values
+
+        df = pd.DataFrame({
+            "Сумма": [1500.0, np.nan],
+            "Кол-во": pd.Series([2, None], dtype="Int64"),
+            "Дата": pd.to_datetime(["2024-03-05", None]),
+            "ФИО": ["Иванова", None],
+            "Разное": [7, "текст"],
+        })
+
+        assert df_to_values(df) == [
+            ["Сумма", "Кол-во", "Дата", "ФИО", "Разное"],
+            [1500.0, 2, "05.03.2024", "Иванова", "7"],
+            ["", "", "", "", "текст"],
+        ]
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
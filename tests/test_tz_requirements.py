@@ -434,6 +434,20 @@ class TestPipelineIntegration:
         assert "front text" in texts["full"]
         assert "botox text" in texts["full"]
 
+    def test_single_category_full_is_same_string(self):
+        """Одна категория: full — тот же объект строки (одна запись в sharedStrings)."""
+        from client_card_ocr import collect_ocr_texts
+
+        pages = [
+            {"page_type": "procedure_sheet", "ocr_text": "лист 1"},
+            {"page_type": "unknown", "ocr_text": "лист 2"},
+        ]
+
+        texts = collect_ocr_texts(pages)
+
+        assert texts["full"] == "лист 1\n\n---\n\nлист 2"
+        assert texts["full"] is texts["procedures"]
+
     def test_unknown_pages_go_to_procedures_only(self):
         """Unknown страницы попадают ТОЛЬКО в procedures (и full), не во все колонки."""
         from client_card_ocr import collect_ocr_texts
@@ -0,0 +1,124 @@
+"""
+Тесты батч-OCR через Vision batch_annotate_images.
+
+Проверяют:
+1. Изображения отправляются пачками не более VISION_BATCH_SIZE.
+2. Результаты выровнены по входному списку; ошибка Vision → Exception на месте файла.
+3. ocr_image_structured — обёртка над батч-формой, ошибка пробрасывается.
+4. TEXT_DETECTION вместо DOCUMENT_TEXT_DETECTION, когда блоки не нужны.
+"""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+
+def _response(text="", error=""):
+    annotation = SimpleNamespace(text=text, pages=[]) if text else None
+    return SimpleNamespace(
+        error=SimpleNamespace(message=error),
+        full_text_annotation=annotation,
+    )
+
+
+def _make_client():
+    client = MagicMock()
+
+    def batch_annotate_images(requests):
+        return SimpleNamespace(responses=[
+            _response(text=r.image.content.decode()) for r in requests
+        ])
+
+    client.batch_annotate_images.side_effect = batch_annotate_images
+    return client
+
+
+def _make_images(tmp_path, count):
+    paths = []
+    for i in range(count):
+        p = tmp_path / f"img_{i:02d}.jpg"
+        p.write_bytes(f"text {i}".encode())
+        paths.append(str(p))
+    return paths
+
+
+def test_batch_chunks_by_limit(tmp_path):
+    import client_card_ocr as cco
+
+    paths = _make_images(tmp_path, cco.VISION_BATCH_SIZE + 3)
+    client = _make_client()
+
+    results = cco.ocr_images_structured_batch(client, paths)
+
+    assert client.batch_annotate_images.call_count == 2
+    sizes = [len(c.kwargs["requests"]) for c in client.batch_annotate_images.call_args_list]
+    assert sizes == [cco.VISION_BATCH_SIZE, 3]
+    assert [r.full_text for r in results] == [f"text {i}" for i in range(len(paths))]
+
+
+def test_batch_error_kept_in_place(tmp_path):
+    import client_card_ocr as cco
+
+    paths = _make_images(tmp_path, 3)
+    client = MagicMock()
+    client.batch_annotate_images.return_value = SimpleNamespace(responses=[
+        _response(text="ok 0"),
+        _response(error="quota exceeded"),
+        _response(text="ok 2"),
+    ])
+
+    results = cco.ocr_images_structured_batch(client, paths)
+
+    assert results[0].full_text == "ok 0"
+    assert isinstance(results[1], Exception)
+    assert "quota exceeded" in str(results[1])
+    assert results[2].full_text == "ok 2"
+
+
+def test_single_wrapper(tmp_path):
+    import client_card_ocr as cco
+
+    path = _make_images(tmp_path, 1)[0]
+    client = _make_client()
+    assert cco.ocr_image_structured(client, path).full_text == "text 0"
+
+    client = MagicMock()
+    client.batch_annotate_images.return_value = SimpleNamespace(
+        responses=[_response(error="bad image")]
+    )
+    with pytest.raises(Exception, match="bad image"):
+        cco.ocr_image_structured(client, path)
+
+
+@pytest.mark.parametrize("tables, debug, expected", [
+    (True, False, "DOCUMENT_TEXT_DETECTION"),
+    (False, True, "DOCUMENT_TEXT_DETECTION"),
+    (False, False, "TEXT_DETECTION"),
+])
+def test_feature_type_depends_on_block_needs(tmp_path, monkeypatch, tables, debug, expected):
+    import client_card_ocr as cco
+
+    monkeypatch.setattr(cco.config, "OCR_TABLE_RECONSTRUCTION", tables, raising=False)
+    monkeypatch.setattr(cco.config, "OCR_SAVE_BBOX_DEBUG", debug, raising=False)
+    monkeypatch.setattr(cco, "_build_structured_result", lambda *a: None)
+    client = _make_client()
+
+    cco.ocr_images_structured_batch(client, _make_images(tmp_path, 1))
+
+    request = client.batch_annotate_images.call_args.kwargs["requests"][0]
+    assert request.features[0].type_.name == expected
+    assert list(request.image_context.language_hints) == ["ru"]
+
+
+def test_settings_read_once_per_batch(tmp_path, monkeypatch):
+    import client_card_ocr as cco
+
+    calls = []
+    real = cco._ocr_settings
+    monkeypatch.setattr(cco, "_ocr_settings", lambda: calls.append(1) or real())
+
+    results = cco.ocr_images_structured_batch(_make_client(), _make_images(tmp_path, 5))
+
+    assert len(results) == 5
+    assert len(calls) == 1
@@ -0,0 +1,82 @@
+"""
+Нечёткое сравнение строк без rapidfuzz: Numba JIT-ядро.
+
+Используется как fallback, когда rapidfuzz недоступен. Метрика та же, что
+у rapidfuzz.fuzz.ratio / token_sort_ratio — нормированное Indel-расстояние
+(2·LCS / (len_a + len_b)), поэтому результаты совпадают с основным путём.
+
+Строки кодируются один раз в массивы uint32 (кодовые точки), LCS считается
+в @njit-ядре одной строкой DP. Без numba модуль импортируется, но
+AVAILABLE = False — вызывающий код остаётся на difflib.
+"""
+
+from functools import lru_cache
+
+try:
+    import numba
+    import numpy as np
+except ImportError:  # pragma: no cover
+    numba = None
+    np = None
+
+AVAILABLE = numba is not None
+
+
+def encode(text: str):
+    """Строка → массив кодовых точек uint32."""
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def token_sort_key(text: str) -> str:
+    """Слова по алфавиту через пробел — как в token_sort_ratio."""
+    return " ".join(sorted(text.split()))
+
+
+if AVAILABLE:
+    @numba.njit(cache=True)
+    def _lcs_length(a, b):
+        """Длина наибольшей общей подпоследовательности (DP в одну строку)."""
+        if len(a) < len(b):
+            a, b = b, a
+        row = np.zeros(len(b) + 1, dtype=np.int32)
+        for i in range(len(a)):
+            prev_diag = 0
+            ca = a[i]
+            for j in range(len(b)):
+                prev_row = row[j + 1]
+                if ca == b[j]:
+                    row[j + 1] = prev_diag + 1
+                elif row[j] > prev_row:
+                    row[j + 1] = row[j]
+                prev_diag = prev_row
+        return row[len(b)]
+
+    @numba.njit(cache=True)
+    def indel_ratio(a, b):
+        """Сходство 0.0–1.0: 2·LCS / (len_a + len_b); две пустые строки → 1.0."""
+        total = len(a) + len(b)
+        if total == 0:
+            return 1.0
+        return 2.0 * _lcs_length(a, b) / total
+
+
+@lru_cache(maxsize=8)
+def prepare_choices(choices: tuple) -> tuple:
+    """Закодированные token_sort-ключи вариантов (один раз на набор)."""
+    return tuple(encode(token_sort_key(c)) for c in choices)
+
+
+def token_sort_extract_one(query: str, choices: tuple) -> tuple:
+    """
+    Лучший вариант из choices по token_sort-сходству с query.
+
+    Returns: (индекс, score 0.0–1.0); (-1, 0.0) для пустого choices.
+    """
+    encoded = prepare_choices(choices)
+    q = encode(token_sort_key(query))
+    best_idx, best_score = -1, 0.0
+    for idx, arr in enumerate(encoded):
+        score = indel_ratio(q, arr)
+        if score > best_score:
+            best_idx, best_score = idx, score
+    return best_idx, best_score
@@ -0,0 +1,98 @@
+"""
+Ограничение частоты запросов к API (token bucket) для пула потоков.
+
+Вместо фиксированной паузы после каждого запроса потоки берут «жетон»
+перед запросом: пока лимит не выбран, запросы идут без ожидания, при
+превышении — равномерно с интервалом 1/rps. Жетоны резервируются под
+блокировкой, ожидание — вне её, поэтому потоки не ждут друг друга дольше,
+чем требует лимит.
+
+Темп адаптивный: на 429/529 лимит вдвое снижается и все потоки ждут
+Retry-After (повторы не уходят пачкой), успешные запросы понемногу
+возвращают его к исходному.
+"""
+
+import threading
+import time
+
+# HTTP-статусы «слишком часто»: 429 — лимит, 529 — перегрузка Anthropic API
+RATE_LIMIT_STATUSES = frozenset({429, 529})
+
+
+class RateLimiter:
+    """
+    Token bucket: не более rps запросов в секунду в среднем,
+    до burst запросов подряд без ожидания. rps <= 0 — без ограничения.
+    """
+
+    def __init__(self, rps: float, burst: int = 1):
+        self.rps = rps
+        self.max_rps = rps
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Ждёт свой жетон. Returns: сколько секунд пришлось ждать."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._blocked_until)
+            if self.rps <= 0:
+                wait = start - now
+            else:
+                self._tokens = min(self.burst, self._tokens + (start - self._last) * self.rps)
+                self._last = start
+                self._tokens -= 1
+                wait = start - now + (-self._tokens / self.rps if self._tokens < 0 else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """Ни один поток не получит жетон раньше чем через seconds."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def slow_down(self, factor: float = 0.5):
+        """Снижает темп после отказа по лимиту (не ниже 1/10 исходного)."""
+        with self._lock:
+            if self.max_rps > 0:
+                self.rps = max(self.max_rps * 0.1, self.rps * factor)
+
+    def speed_up(self, step: float = 0.1):
+        """После успешного запроса возвращает темп к исходному на step·max_rps."""
+        with self._lock:
+            if self.rps < self.max_rps:
+                self.rps = min(self.max_rps, self.rps + self.max_rps * step)
+
+
+def rate_limit_delay(exc: Exception) -> float | None:
+    """
+    Для отказа API по лимиту — сколько ждать по заголовкам Retry-After
+    (0.0, если заголовка нет). None — ошибка не связана с лимитом.
+
+    Понимает исключения anthropic (status_code, response.headers) и
+    google-api-core (code == 429).
+    """
+    response = getattr(exc, 'response', None)
+    status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(exc, 'code', None)
+    try:
+        if int(status) not in RATE_LIMIT_STATUSES:
+            return None
+    except (TypeError, ValueError):
+        return None
+
+    headers = getattr(response, 'headers', None) or {}
+    for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue  # HTTP-дата вместо секунд — берём общий backoff
+    return 0.0